@@ -2,9 +2,10 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas, database, crud
 
 # SECRET_KEY should be in env vars, but hardcoding for demo
@@ -31,12 +32,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+# Async so authenticated routes do not pay a threadpool hop for the account lookup
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_read_db)):
+    return await get_user_from_token(token, db)
+
+async def get_current_user_for_stream(request: Request, access_token: Optional[str] = None, db: AsyncSession = Depends(database.get_async_read_db)):
+    # EventSource cannot send headers, so the stream also accepts ?access_token=
+    token = access_token
+    authorization = request.headers.get("Authorization")
+    if not token and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    user = await get_user_from_token(token, db)
+    # The stream outlives this lookup: return the connection to the pool now
+    await db.close()
+    return user
+
+async def get_user_from_token(token: Optional[str], db: AsyncSession):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -47,12 +65,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.Account).filter(models.Account.email == token_data.email).first()
+    user = (await db.execute(select(models.Account).where(models.Account.email == token_data.email))).scalars().first()
     if user is None:
         raise credentials_exception
     return user
 
-def get_current_active_admin(current_user: models.Account = Depends(get_current_user)):
+async def get_current_active_admin(current_user: models.Account = Depends(get_current_user)):
     if current_user.role != "ADMIN":
         raise HTTPException(status_code=400, detail="Not enough privileges")
     return current_user
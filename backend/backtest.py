@@ -0,0 +1,378 @@
+"""
+Offline backtest of a candidate rule set against historical events.
+
+Events are streamed from the `events` table (or a CSV export) and replayed in
+blocks through `vectorized.BatchEvaluator`, which gives the same matches as the
+engine, against both the currently active rules and a candidate set, without
+writing anything. Events are partitioned by user across worker processes so
+every user's velocity windows and simulated risk score stay in one process.
+Risk scores start at zero at the beginning of the replay and decay on event
+time.
+
+    python -m backend.backtest --rules candidate.csv [--since 2026-01-01] [--workers 8]
+    python -m backend.backtest --rules candidate.json --source csv/trustshield_events.csv --json report.json
+
+The rules file (CSV like csv/risk_rules.csv, or a JSON list of rule objects)
+overrides active rules by rule_id; rows with is_active false remove the rule.
+With --replace the file is the whole candidate set.
+"""
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from . import models
+from .context_builder import build_evaluation_context, normalize_service
+from .engine import opens_case, select_action
+from .feature_store import SlidingWindowStore
+from .rule_registry import RuleSet, compile_rule
+from .scoring import level_for_score, score_model
+from .timestamps import now_ms, to_epoch_ms
+from .vectorized import BatchEvaluator
+
+BACKTEST_WORKERS = int(os.getenv("TRUSTSHIELD_BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+# Events per message sent to a worker
+BACKTEST_BATCH_SIZE = int(os.getenv("TRUSTSHIELD_BACKTEST_BATCH_SIZE", "2000"))
+
+RULE_FIELDS = ("rule_id", "condition", "action", "priority", "is_active", "signal", "risk_score")
+EVENT_FIELDS = ("event_id", "user_id", "service", "event_type", "value", "unit", "meta", "timestamp")
+_TRUE = {"true", "t", "yes", "y", "1"}
+
+
+class ReplayEvent:
+    """Read-only event with the attributes the context builder and feature store use."""
+    __slots__ = EVENT_FIELDS
+
+    def __init__(self, row):
+        for name, value in zip(EVENT_FIELDS, row):
+            setattr(self, name, value)
+
+
+# --- Rule sets ---
+
+def _is_active(value):
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE
+    return bool(value)
+
+
+def _rule_row(raw):
+    row = {name: raw.get(name) for name in RULE_FIELDS}
+    row["action"] = (row["action"] or "").upper()
+    row["priority"] = int(row["priority"] or 0)
+    row["risk_score"] = int(float(row["risk_score"])) if row["risk_score"] not in (None, "") else 0
+    row["is_active"] = _is_active(row["is_active"] if row["is_active"] not in (None, "") else True)
+    row["signal"] = row["signal"] or None
+    return row
+
+
+def active_rule_rows(db):
+    rows = db.query(models.RiskRule).filter(models.RiskRule.is_active == 1).all()
+    return [_rule_row({name: getattr(r, name) for name in RULE_FIELDS}) for r in rows]
+
+
+def load_rule_file(path):
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            raw = list(csv.DictReader(f))
+    return [_rule_row(r) for r in raw]
+
+
+def candidate_rule_rows(active_rows, changes, replace=False):
+    """Active rules with `changes` applied by rule_id (or only `changes` if replace)."""
+    rules = {} if replace else {r["rule_id"]: r for r in active_rows}
+    for row in changes:
+        if row["is_active"]:
+            rules[row["rule_id"]] = row
+        else:
+            rules.pop(row["rule_id"], None)
+    return list(rules.values())
+
+
+def compile_rule_set(rows, strict=True):
+    """
+    RuleSet of rule rows. Rules that do not compile raise ValueError if
+    `strict`, else they are skipped like the live registry does.
+    """
+    compiled, errors = [], []
+    for row in rows:
+        try:
+            compiled.append(compile_rule(SimpleNamespace(**row)))
+        except (SyntaxError, ValueError) as e:
+            errors.append(f"{row['rule_id']}: {e}")
+    if errors and strict:
+        raise ValueError("Rules do not compile: " + "; ".join(errors))
+    return RuleSet(0, compiled)
+
+
+# --- Event sources ---
+
+def db_events(db, since=None, until=None, batch_size=BACKTEST_BATCH_SIZE):
+    """Stored events in time order as plain tuples."""
+    table = models.Event.__table__
+    query = select(*(table.c[name] for name in EVENT_FIELDS)).order_by(table.c.timestamp, table.c.event_id)
+    if since:
+        query = query.where(table.c.timestamp >= to_epoch_ms(since))
+    if until:
+        query = query.where(table.c.timestamp < to_epoch_ms(until))
+    result = db.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+    for row in result:
+        yield tuple(row)
+
+
+def csv_events(path, since=None, until=None):
+    """Events of a CSV export in file order, normalized like the ingest endpoint does."""
+    since_ms = to_epoch_ms(since) if since else None
+    until_ms = to_epoch_ms(until) if until else None
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for raw in csv.DictReader(f):
+            timestamp = raw.get("timestamp") or None
+            if since_ms is not None or until_ms is not None:
+                ms = to_epoch_ms(timestamp) if timestamp else None
+                if ms is None or (since_ms is not None and ms < since_ms) or (until_ms is not None and ms >= until_ms):
+                    continue
+            value = raw.get("value")
+            yield (
+                raw.get("event_id"), raw.get("user_id"), normalize_service(raw.get("service")),
+                raw.get("event_type"), float(value) if value not in (None, "") else None,
+                raw.get("unit") or None, raw.get("meta") or None, timestamp,
+            )
+
+
+# --- Replay ---
+
+class _Tally:
+    """Outcome counts of one rule set."""
+    def __init__(self, rule_set):
+        self.rule_set = rule_set
+        self.decisions = 0
+        self.actions = Counter()
+        self.rule_hits = Counter()
+        self.case_events = 0
+        self.case_users = set()
+        self.scores = {} # user_id -> (components, updated_ms)
+
+    def record(self, event, triggered, possible_actions, event_ms):
+        if not triggered:
+            return None
+        selected_action, _ = select_action(possible_actions)
+        self.decisions += 1
+        self.actions[selected_action] += 1
+        self.rule_hits.update(triggered)
+
+        # Same score arithmetic as the profile store, on event time
+        rule_map = self.rule_set.by_id
+        components, updated_ms = self.scores.get(event.user_id, ({}, event_ms))
+        components = score_model.decay(components, updated_ms, event_ms)
+        for rule_id in triggered:
+            rule = rule_map[rule_id]
+            if rule.risk_score:
+                key = rule.signal or ""
+                components[key] = components.get(key, 0.0) + rule.risk_score
+        components = score_model.cap(components)
+        self.scores[event.user_id] = (components, event_ms)
+
+        if opens_case(selected_action, level_for_score(score_model.total(components))):
+            self.case_events += 1
+            self.case_users.add(event.user_id)
+        return selected_action
+
+    def result(self):
+        return {
+            "decisions": self.decisions,
+            "actions": dict(self.actions),
+            "rule_hits": dict(self.rule_hits),
+            "case_events": self.case_events,
+            "cases": len(self.case_users),
+        }
+
+
+def replay(events, baseline, candidate, block_size=BACKTEST_BATCH_SIZE):
+    """
+    Replays event tuples against both rule sets with shared velocity windows,
+    evaluating rules a block at a time (vectorized where possible).
+    Returns the per-set outcome counts and the decision transitions.
+    """
+    features = SlidingWindowStore()
+    base, cand = _Tally(baseline), _Tally(candidate)
+    base_rules, cand_rules = BatchEvaluator(baseline), BatchEvaluator(candidate)
+    transitions = Counter()
+    count = 0
+    rows = iter(events)
+    while True:
+        block = [ReplayEvent(row) for row in itertools.islice(rows, block_size)]
+        if not block:
+            break
+        count += len(block)
+        # Features are order dependent, so they are observed before matching the block
+        contexts = [build_evaluation_context(event, features.observe(event)) for event in block]
+        base_matches = base_rules.evaluate(block, contexts)
+        cand_matches = cand_rules.evaluate(block, contexts)
+        for event, base_match, cand_match in zip(block, base_matches, cand_matches):
+            event_ms = to_epoch_ms(event.timestamp) if event.timestamp else now_ms()
+            before = base.record(event, *base_match, event_ms)
+            after = cand.record(event, *cand_match, event_ms)
+            if before != after:
+                transitions[(before or "NO_DECISION", after or "NO_DECISION")] += 1
+    return {"events": count, "baseline": base.result(), "candidate": cand.result(), "transitions": transitions}
+
+
+def _worker(baseline_rows, candidate_rows, inbox, outbox):
+    def batches():
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            yield from batch
+    try:
+        outbox.put(replay(batches(), compile_rule_set(baseline_rows, strict=False), compile_rule_set(candidate_rows, strict=False)))
+    except Exception as e:
+        outbox.put(e)
+
+
+def _merge(results):
+    merged = {"events": 0, "transitions": Counter()}
+    for name in ("baseline", "candidate"):
+        merged[name] = {"decisions": 0, "actions": Counter(), "rule_hits": Counter(), "case_events": 0, "cases": 0}
+    for result in results:
+        merged["events"] += result["events"]
+        merged["transitions"].update(result["transitions"])
+        for name in ("baseline", "candidate"):
+            for key, value in result[name].items():
+                if isinstance(value, dict):
+                    merged[name][key].update(value)
+                else:
+                    merged[name][key] += value
+    return merged
+
+
+def run_backtest(events, baseline_rows, candidate_rows, workers=BACKTEST_WORKERS, batch_size=BACKTEST_BATCH_SIZE):
+    """
+    Replays `events` (tuples in EVENT_FIELDS order, time-ordered) against both
+    rule sets on `workers` processes and returns the report dict.
+    """
+    baseline = compile_rule_set(baseline_rows, strict=False)
+    candidate = compile_rule_set(candidate_rows, strict=False)
+    for name, rows, rule_set in (("active", baseline_rows, baseline), ("candidate", candidate_rows, candidate)):
+        if len(rows) > len(rule_set.rules):
+            print(f"Skipping {len(rows) - len(rule_set.rules)} {name} rules that do not compile (the engine skips them too)")
+    started = time.perf_counter()
+    if workers <= 1:
+        results = [replay(events, baseline, candidate)]
+    else:
+        # Spawned rather than forked: workers must not inherit database connections
+        ctx = multiprocessing.get_context("spawn")
+        outbox = ctx.Queue()
+        inboxes, processes = [], []
+        for _ in range(workers):
+            inbox = ctx.Queue(maxsize=4)
+            process = ctx.Process(target=_worker, args=(baseline_rows, candidate_rows, inbox, outbox), daemon=True)
+            process.start()
+            inboxes.append(inbox)
+            processes.append(process)
+        pending = [[] for _ in range(workers)]
+        try:
+            for row in events:
+                # Stable across processes, unlike hash()
+                partition = zlib.crc32((row[1] or "").encode()) % workers
+                pending[partition].append(row)
+                if len(pending[partition]) >= batch_size:
+                    inboxes[partition].put(pending[partition])
+                    pending[partition] = []
+            for inbox, batch in zip(inboxes, pending):
+                if batch:
+                    inbox.put(batch)
+                inbox.put(None)
+            results = [outbox.get() for _ in processes]
+        finally:
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+    report = _merge(results)
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def rule_diff(report):
+    """Per-rule hit counts of both sets, rules with the largest change first."""
+    base, cand = report["baseline"]["rule_hits"], report["candidate"]["rule_hits"]
+    rows = [
+        {"rule_id": rule_id, "baseline": base.get(rule_id, 0), "candidate": cand.get(rule_id, 0)}
+        for rule_id in set(base) | set(cand)
+    ]
+    for row in rows:
+        row["delta"] = row["candidate"] - row["baseline"]
+    rows.sort(key=lambda row: (-abs(row["delta"]), row["rule_id"]))
+    return rows
+
+
+def print_report(report, limit=20):
+    base, cand = report["baseline"], report["candidate"]
+    rate = report["events"] / report["seconds"] if report["seconds"] > 0 else 0
+    print(f"Replayed {report['events']} events in {report['seconds']:.1f}s ({rate:.0f} events/s)")
+    print(f"{'':<22}{'active':>10}{'candidate':>12}{'delta':>10}")
+    for label, key in (("decisions", "decisions"), ("fraud cases (users)", "cases"), ("case-triggering events", "case_events")):
+        print(f"{label:<22}{base[key]:>10}{cand[key]:>12}{cand[key] - base[key]:>+10}")
+    print("\nActions")
+    for action in sorted(set(base["actions"]) | set(cand["actions"])):
+        b, c = base["actions"].get(action, 0), cand["actions"].get(action, 0)
+        print(f"  {action:<20}{b:>10}{c:>12}{c - b:>+10}")
+    print("\nRule hits (largest change first)")
+    for row in rule_diff(report)[:limit]:
+        print(f"  {row['rule_id']:<20}{row['baseline']:>10}{row['candidate']:>12}{row['delta']:>+10}")
+    print(f"\nChanged decisions: {sum(report['transitions'].values())}")
+    for (before, after), count in report["transitions"].most_common(limit):
+        print(f"  {before} -> {after}: {count}")
+
+
+def report_json(report):
+    data = dict(report)
+    data["transitions"] = [
+        {"from": before, "to": after, "count": count} for (before, after), count in report["transitions"].most_common()
+    ]
+    data["rules"] = rule_diff(report)
+    return data
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import ReadSessionLocal
+    parser = argparse.ArgumentParser(description="Replay historical events against a candidate rule set")
+    parser.add_argument("--rules", required=True, help="candidate rules (CSV or JSON) applied over the active rules")
+    parser.add_argument("--replace", action="store_true", help="use only the rules in --rules")
+    parser.add_argument("--source", default="db", help="'db' (events table) or a CSV export of events")
+    parser.add_argument("--since", help="first event time to replay (ISO)")
+    parser.add_argument("--until", help="replay events before this time (ISO)")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    db = ReadSessionLocal()
+    try:
+        active = active_rule_rows(db)
+        changes = load_rule_file(args.rules)
+        # Proposed rules must compile; inherited broken ones are skipped like in production
+        compile_rule_set([row for row in changes if row["is_active"]])
+        candidate = candidate_rule_rows(active, changes, replace=args.replace)
+        events = db_events(db, args.since, args.until) if args.source == "db" else csv_events(args.source, args.since, args.until)
+        report = run_backtest(events, active, candidate, workers=args.workers)
+    finally:
+        db.close()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report_json(report), f, indent=2)
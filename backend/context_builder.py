@@ -1,5 +1,16 @@
 import json
 
+# Services that get their own proxy object in the rule context
+KNOWN_SERVICES = ['Paycell', 'BiP', 'TV+', 'Superonline']
+_SERVICE_LOOKUP = {s.upper(): s for s in KNOWN_SERVICES}
+
+def normalize_service(service):
+    """Canonical spelling of a service name ('PAYCELL' -> 'Paycell'); unknown names are only trimmed."""
+    if service is None:
+        return None
+    service = service.strip()
+    return _SERVICE_LOOKUP.get(service.upper(), service)
+
 class ServiceProxy:
     """
     Dynamic object to allow dot notation access to dictionary keys.
@@ -10,24 +21,27 @@ class ServiceProxy:
     def __getattr__(self, name):
         return None
 
-def build_evaluation_context(event):
-    """
-    Constructs the context dictionary for rule evaluation.
-    Maps event values to common feature names (amount, count, etc.)
-    and handles JSON meta parsing.
-    """
-    # Parse Meta
-    meta_data = {}
+def parse_meta(event):
+    """Parses the JSON meta column; anything unparseable yields an empty dict."""
     try:
         if event.meta:
-            meta_data = json.loads(event.meta)
+            return json.loads(event.meta)
     except:
-        meta_data = {}
+        pass
+    return {}
+
+def build_feature_map(event, features=None):
+    """
+    Maps event values to common feature names (amount, count, etc.),
+    merges the JSON meta keys and any stateful features (e.g. sliding
+    window counters such as count_10m) computed for this event.
+    """
+    meta_data = parse_meta(event)
 
     # Generic Value Mapper
     val = event.value if event.value is not None else 0
     
-    feature_map = {
+    return {
         "amount": val,
         "count": int(val), 
         "duration": val,
@@ -41,9 +55,19 @@ def build_evaluation_context(event):
         "merchant": meta_data.get("merchant", "Unknown"),
         "city": event.unit, 
         # Add meta keys
-        **meta_data
+        **meta_data,
+        # Stateful features win over meta so producers cannot spoof them
+        **(features or {})
     }
 
+def build_evaluation_context(event, features=None):
+    """
+    Constructs the context dictionary for rule evaluation.
+    The event's service is exposed as a proxy over its feature map.
+    """
+    val = event.value if event.value is not None else 0
+    feature_map = build_feature_map(event, features)
+
     # Context Setup
     context = {
         "value": val,
@@ -55,7 +79,6 @@ def build_evaluation_context(event):
     }
 
     # Inject other known services as None to prevent NameError
-    KNOWN_SERVICES = ['Paycell', 'BiP', 'TV+', 'Superonline']
     for s in KNOWN_SERVICES:
         if s not in context:
             context[s] = None 
@@ -1,16 +1,47 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, false, or_, select
+from typing import List
 from . import models, schemas
+from .context_builder import normalize_service
+from .enums import ActionType, CasePriorityType, CaseStatusType, NotificationStatusType, RiskLevelType
+from .rule_registry import bump_version, rule_registry
+from .dashboard_stats import dashboard_counters
+from .profile_store import profile_store
+from .scoring import rescore_all
+from .response_cache import response_cache
+from .timestamps import now_ms, to_epoch_ms, to_iso
+from .metrics import forget_rule
+import heapq
 import uuid
 
-def get_events(db: Session, skip: int = 0, limit: int = 100, start_time: str = None, service: str = None, user_id: str = None, sort_by: str = 'timestamp_desc'):
-    query = db.query(models.Event)
+def parse_cursor(after: str):
+    """Splits an `after=<timestamp>,<id>` keyset cursor; raises ValueError if malformed."""
+    timestamp, sep, row_id = (after or "").partition(",")
+    if not sep or not timestamp or not row_id:
+        raise ValueError("Cursor must look like <timestamp>,<id>")
+    return to_epoch_ms(timestamp), row_id
+
+def make_cursor(timestamp: str, row_id: str):
+    return f"{timestamp},{row_id}"
+
+def _after_cursor(query, timestamp_col, id_col, after: str):
+    # Rows strictly after the cursor in (timestamp desc, id desc) order
+    timestamp, row_id = parse_cursor(after)
+    return query.filter(or_(timestamp_col < timestamp, and_(timestamp_col == timestamp, id_col < row_id)))
+
+# The select_* builders return the statement behind a read, so async routes
+# can `await session.scalars(...)` it and the sync get_* run the same query.
+
+def select_events(skip: int = 0, limit: int = 100, start_time: str = None, service: str = None, user_id: str = None, sort_by: str = 'timestamp_desc', after: str = None):
+    query = select(models.Event)
     
     if start_time:
-        query = query.filter(models.Event.timestamp >= start_time)
+        # Parsed up front: timestamps are stored as epoch milliseconds
+        query = query.filter(models.Event.timestamp >= to_epoch_ms(start_time))
     
     if service and service != 'ALL':
-        query = query.filter(func.upper(models.Event.service) == service.upper())
+        # Services are stored in canonical form, so this is an index lookup
+        query = query.filter(models.Event.service == normalize_service(service))
 
     if user_id:
         query = query.filter(models.Event.user_id == user_id)
@@ -20,148 +51,327 @@ def get_events(db: Session, skip: int = 0, limit: int = 100, start_time: str = N
     elif sort_by == 'value_asc':
         query = query.order_by(models.Event.value.asc())
     else:
-        query = query.order_by(models.Event.timestamp.desc())
-        
-    return query.offset(skip).limit(limit).all()
+        query = query.order_by(models.Event.timestamp.desc(), models.Event.event_id.desc())
+
+    if after:
+        if sort_by in ('value_desc', 'value_asc'):
+            raise ValueError("Cursor pagination is only supported with sort_by=timestamp_desc")
+        # Keyset page: seek past the cursor instead of counting skipped rows
+        return _after_cursor(query, models.Event.timestamp, models.Event.event_id, after).limit(limit)
+    return query.offset(skip).limit(limit)
+
+def get_events(db: Session, skip: int = 0, limit: int = 100, start_time: str = None, service: str = None, user_id: str = None, sort_by: str = 'timestamp_desc', after: str = None):
+    return db.scalars(select_events(skip, limit, start_time, service, user_id, sort_by, after)).all()
 
-def create_event(db: Session, event: schemas.EventCreate):
-    db_event = models.Event(**event.dict())
+def _event_row(event: schemas.EventCreate):
+    row = event.dict()
+    row["service"] = normalize_service(row["service"])
+    return row
+
+def create_event(db: Session, event: schemas.EventCreate, queue_for_decision: bool = False):
+    db_event = models.Event(**_event_row(event))
     db.add(db_event)
+    if queue_for_decision:
+        # Committed with the event, so a crash before evaluation leaves it to be replayed
+        db.add(models.PendingEvent(event_id=db_event.event_id, queued_at=now_ms()))
     db.commit()
     db.refresh(db_event)
+    dashboard_counters.record_events([db_event])
     return db_event
 
+def select_pending_event(event_id: str):
+    return select(models.PendingEvent.event_id).where(models.PendingEvent.event_id == event_id)
+
+def is_event_pending(db: Session, event_id: str):
+    return db.execute(select_pending_event(event_id)).first() is not None
+
+def withdraw_pending_event(db: Session, event_id: str):
+    """
+    Deletes an event accepted for the decision pipeline that could not be
+    queued. Returns False if a pipeline worker already claimed it.
+    """
+    withdrawn = db.query(models.PendingEvent).filter(models.PendingEvent.event_id == event_id).delete(synchronize_session=False) > 0
+    if withdrawn:
+        db.query(models.Event).filter(models.Event.event_id == event_id).delete(synchronize_session=False)
+    db.commit()
+    if withdrawn:
+        dashboard_counters.invalidate()
+    return withdrawn
+
+def create_events_bulk(db: Session, events: List[schemas.EventCreate]):
+    """
+    Stages a burst of events as one bulk INSERT without committing, so the
+    caller can evaluate them and commit everything in a single transaction.
+    """
+    rows = [_event_row(event) for event in events]
+    for row in rows:
+        # Parsed once: the INSERT binds epoch milliseconds, and the returned
+        # events carry the ISO form create_event gets back from the table
+        row["timestamp"] = to_epoch_ms(row["timestamp"])
+    db.bulk_insert_mappings(models.Event, rows)
+    return [models.Event(**{**row, "timestamp": to_iso(row["timestamp"])}) for row in rows]
+
 def get_risk_profile(db: Session, user_id: str):
-    return db.query(models.RiskProfile).filter(models.RiskProfile.user_id == user_id).first()
+    # Served from the in-memory store, which includes not yet flushed updates
+    return profile_store.get_profile(db, user_id)
 
 def get_risk_profiles(db: Session, risk_level: str = None, limit: int = 100):
-    query = db.query(models.RiskProfile)
+    query = db.query(models.RiskProfile).order_by(models.RiskProfile.user_id)
     if risk_level:
-        query = query.filter(models.RiskProfile.risk_level == risk_level)
-    return query.limit(limit).all()
+        if not RiskLevelType.is_valid(risk_level):
+            return []
+        risk_level = risk_level.upper()
+        # Stored levels are undecayed and decay only lowers a level, so rows
+        # stored below the requested level cannot match
+        query = query.filter(models.RiskProfile.risk_level >= risk_level)
+    # Profiles changed since the last flush are listed from the store: their
+    # rows are stale or missing, and flushing here would contend with ingest
+    unflushed = profile_store.unflushed()
+    # Streamed until `limit` profiles match: the level is checked on the
+    # view, the live copy decayed to now
+    stored = (profile_store.view(row) for row in query.yield_per(500) if row.user_id not in unflushed)
+    pending = sorted(unflushed.values(), key=lambda p: p["user_id"])
+    profiles = []
+    for profile in heapq.merge(stored, pending, key=lambda p: p["user_id"]):
+        if risk_level and profile["risk_level"] != risk_level:
+            continue
+        profiles.append(profile)
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+def rescore_risk_profiles(db: Session):
+    # Pending in-memory updates go first so the pass sees every profile
+    profile_store.flush()
+    scanned, changed = rescore_all(db)
+    profile_store.invalidate()
+    dashboard_counters.invalidate()
+    response_cache.invalidate("risk-profiles", "dashboard")
+    return {"profiles": scanned, "level_changes": changed}
+
+def select_risk_rules():
+    return select(models.RiskRule)
 
 def get_risk_rules(db: Session):
-    return db.query(models.RiskRule).all()
+    return db.scalars(select_risk_rules()).all()
 
 def create_risk_rule(db: Session, rule: schemas.RiskRuleCreate):
     db_rule = models.RiskRule(**rule.dict())
     db.add(db_rule)
+    bump_version(db)
     db.commit()
     db.refresh(db_rule)
+    rule_registry.invalidate()
+    response_cache.invalidate("risk-rules", "dashboard")
     return db_rule
 
 def update_risk_rule(db: Session, rule_id: str, rule: schemas.RiskRuleBase):
     db_rule = db.query(models.RiskRule).filter(models.RiskRule.rule_id == rule_id).first()
     if db_rule:
+        if db_rule.condition != rule.condition:
+            # The old condition's profile says nothing about the new one
+            forget_rule(rule_id)
         db_rule.condition = rule.condition
         db_rule.action = rule.action
         db_rule.priority = rule.priority
         db_rule.is_active = rule.is_active
+        bump_version(db)
         db.commit()
         db.refresh(db_rule)
+        rule_registry.invalidate()
+        response_cache.invalidate("risk-rules", "dashboard")
     return db_rule
 
 def delete_risk_rule(db: Session, rule_id: str):
     db_rule = db.query(models.RiskRule).filter(models.RiskRule.rule_id == rule_id).first()
     if db_rule:
         db.delete(db_rule)
+        bump_version(db)
         db.commit()
+        rule_registry.invalidate()
+        forget_rule(rule_id)
+        response_cache.invalidate("risk-rules", "dashboard")
     return db_rule
 
-def get_fraud_cases(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.FraudCase).offset(skip).limit(limit).all()
+# GET /risk-rules/stats sort keys -> stats field (all sorted descending)
+RULE_STATS_SORTS = {
+    "total_time": "total_seconds",
+    "mean_time": "mean_seconds",
+    "max_time": "max_seconds",
+    "evaluations": "evaluations",
+    "matches": "matches",
+    "errors": "errors",
+}
+
+def get_rule_stats(db: Session, sort_by: str = "total_time", limit: int = 100):
+    """Evaluation profile of every active rule, most expensive first by default."""
+    field = RULE_STATS_SORTS.get(sort_by)
+    if field is None:
+        raise ValueError(f"sort_by must be one of {', '.join(RULE_STATS_SORTS)}")
+    rule_set = rule_registry.get_rule_set(db)
+    rows = [dict(rule.metrics.stats(), condition=rule.condition, action=rule.action) for rule in rule_set.rules]
+    grand_total = sum(row["total_seconds"] for row in rows)
+    for row in rows:
+        row["time_share"] = row["total_seconds"] / grand_total if grand_total else 0.0
+    rows.sort(key=lambda row: row[field], reverse=True)
+    return rows[:limit]
+
+# Cases in these states still collect new events for the user
+OPEN_CASE_STATUSES = ("OPEN", "IN_PROGRESS", "ESCALATED")
+# Most cases one bulk status update may touch
+MAX_BULK_CASES = 10000
+# Bound on IN (...) list sizes, below SQLite's variable limit
+_IN_CHUNK = 500
+
+def _chunks(items, size=_IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _filter_cases(query, status: str = None, priority: str = None, user_id: str = None):
+    """Applies case queue filters; raises ValueError for an unknown status or priority."""
+    if status and status != 'ALL':
+        if not CaseStatusType.is_valid(status):
+            raise ValueError(f"Unknown case status {status}")
+        query = query.filter(models.FraudCase.status == status)
+    if priority and priority != 'ALL':
+        if not CasePriorityType.is_valid(priority):
+            raise ValueError(f"Unknown case priority {priority}")
+        query = query.filter(models.FraudCase.priority == priority)
+    if user_id:
+        query = query.filter(models.FraudCase.user_id == user_id)
+    return query
+
+def select_fraud_cases(skip: int = 0, limit: int = 100, status: str = None, priority: str = None, user_id: str = None, after: str = None):
+    try:
+        query = _filter_cases(select(models.FraudCase), status, priority, user_id)
+    except ValueError:
+        # An unknown filter value matches no case
+        query = select(models.FraudCase).where(false())
+    query = query.order_by(models.FraudCase.opened_at.desc(), models.FraudCase.case_id.desc())
+    if after:
+        return _after_cursor(query, models.FraudCase.opened_at, models.FraudCase.case_id, after).limit(limit)
+    return query.offset(skip).limit(limit)
+
+def get_fraud_cases(db: Session, skip: int = 0, limit: int = 100, status: str = None, priority: str = None, user_id: str = None, after: str = None):
+    return db.scalars(select_fraud_cases(skip, limit, status, priority, user_id, after)).all()
+
+def get_open_case(db: Session, user_id: str):
+    """The user's most recent case that is not closed yet, or None."""
+    return db.query(models.FraudCase).filter(
+        models.FraudCase.user_id == user_id,
+        models.FraudCase.status.in_(OPEN_CASE_STATUSES),
+    ).order_by(models.FraudCase.opened_at.desc()).first()
+
+def get_open_cases(db: Session, user_ids):
+    """{user_id: most recent open case or None} for every given user."""
+    open_cases = dict.fromkeys(user_ids)
+    for chunk in _chunks(list(open_cases)):
+        cases = db.query(models.FraudCase).filter(
+            models.FraudCase.user_id.in_(chunk),
+            models.FraudCase.status.in_(OPEN_CASE_STATUSES),
+        ).order_by(models.FraudCase.opened_at.asc())
+        for case in cases:
+            open_cases[case.user_id] = case # Newest wins
+    return open_cases
+
+def select_case_actions(case_id: str):
+    return select(models.CaseAction).where(models.CaseAction.case_id == case_id).order_by(models.CaseAction.timestamp.asc())
 
-def get_decisions(db: Session, skip: int = 0, limit: int = 100, action: str = None, user_id: str = None):
-    query = db.query(models.Decision)
+def get_case_actions(db: Session, case_id: str):
+    return db.scalars(select_case_actions(case_id)).all()
+
+def bulk_update_case_status(db: Session, update: schemas.FraudCaseBulkStatusUpdate, actor: str):
+    """
+    Moves the cases listed in `update.case_ids`, or every case matching its
+    filters, to `update.status` and records a STATUS_CHANGE action for each.
+    Raises ValueError for an empty selection or one above MAX_BULK_CASES.
+    """
+    table = models.FraudCase
+    if update.case_ids:
+        case_ids = list(dict.fromkeys(update.case_ids))
+        if len(case_ids) > MAX_BULK_CASES:
+            raise ValueError(f"At most {MAX_BULK_CASES} cases can be updated at once")
+        rows = []
+        for chunk in _chunks(case_ids):
+            rows += db.query(table.case_id, table.status).filter(table.case_id.in_(chunk)).all()
+    else:
+        if not (update.current_status or update.priority or update.user_id):
+            raise ValueError("Give case_ids or at least one of current_status, priority, user_id")
+        query = _filter_cases(db.query(table.case_id, table.status), update.current_status, update.priority, update.user_id)
+        rows = query.limit(MAX_BULK_CASES + 1).all()
+        if len(rows) > MAX_BULK_CASES:
+            raise ValueError(f"More than {MAX_BULK_CASES} cases match; narrow the filters")
+
+    changed = [(case_id, old) for case_id, old in rows if old != update.status]
+    changed_ids = [case_id for case_id, _ in changed]
+    for chunk in _chunks(changed_ids):
+        db.query(table).filter(table.case_id.in_(chunk)).update({table.status: update.status}, synchronize_session=False)
+    timestamp = now_ms()
+    db.bulk_insert_mappings(models.CaseAction, [
+        {
+            "action_id": str(uuid.uuid4()),
+            "case_id": case_id,
+            "action_type": "STATUS_CHANGE",
+            "actor": actor,
+            "note": f"{old} -> {update.status}" + (f": {update.note}" if update.note else ""),
+            "timestamp": timestamp,
+        }
+        for case_id, old in changed
+    ])
+    db.commit()
+
+    old_counts = {}
+    for _, old in changed:
+        old_counts[old] = old_counts.get(old, 0) + 1
+    for old, count in old_counts.items():
+        dashboard_counters.record_case_status_change(old, update.status, count)
+    if changed:
+        response_cache.invalidate("dashboard")
+    return {"matched": len(rows), "updated": len(changed)}
+
+def select_decisions(skip: int = 0, limit: int = 100, action: str = None, user_id: str = None, after: str = None):
+    query = select(models.Decision)
     if action and action != 'ALL':
+        if not ActionType.is_valid(action):
+            return query.where(false())
         query = query.filter(models.Decision.selected_action == action)
     if user_id:
         query = query.filter(models.Decision.user_id == user_id)
-    return query.order_by(models.Decision.timestamp.desc()).offset(skip).limit(limit).all()
+    query = query.order_by(models.Decision.timestamp.desc(), models.Decision.decision_id.desc())
+    if after:
+        return _after_cursor(query, models.Decision.timestamp, models.Decision.decision_id, after).limit(limit)
+    return query.offset(skip).limit(limit)
 
-def get_dashboard_summary(db: Session):
-    total_events = db.query(models.Event).count()
-    active_rules = db.query(models.RiskRule).filter(models.RiskRule.is_active == 1).count()
-    open_cases = db.query(models.FraudCase).filter(models.FraudCase.status == 'OPEN').count()
-    high_risk_users = db.query(models.RiskProfile).filter(models.RiskProfile.risk_level == 'HIGH').count()
-    
-    # --- Charts Data (Real Aggregation) ---
-    import datetime
-    from collections import defaultdict
+def get_decisions(db: Session, skip: int = 0, limit: int = 100, action: str = None, user_id: str = None, after: str = None):
+    return db.scalars(select_decisions(skip, limit, action, user_id, after)).all()
 
-    now = datetime.datetime.now()
-    
-    # 1. Traffic (Last 24h)
-    traffic_24h = []
-    start_24h = (now - datetime.timedelta(hours=24)).isoformat()
-    events_24h = db.query(models.Event).filter(models.Event.timestamp >= start_24h).all()
-    
-    # Bucket by hour
-    hourly_counts = defaultdict(int)
-    for e in events_24h:
-        # timestamp format: YYYY-MM-DDTHH:MM:SS
-        try:
-            hour = e.timestamp.split('T')[1][:2] + ':00'
-            hourly_counts[hour] += 1
-        except:
-            continue
-            
-    # Fill last 24 hours (simplified to just present hours for now or sorted keys)
-    # To be "Area Chart" friendly, let's sort by time.
-    for k in sorted(hourly_counts.keys()):
-        traffic_24h.append({"time": k, "events": hourly_counts[k]})
-    
-    # If empty, add at least one point
-    if not traffic_24h:
-        traffic_24h.append({"time": now.strftime("%H:00"), "events": 0})
+def select_notifications(user_id: str = None, status: str = None, limit: int = 100):
+    query = select(models.BipNotification)
+    if user_id:
+        query = query.filter(models.BipNotification.user_id == user_id)
+    if status and status != 'ALL':
+        if not NotificationStatusType.is_valid(status):
+            return query.where(false())
+        query = query.filter(models.BipNotification.status == status)
+    return query.order_by(models.BipNotification.sent_at.desc()).limit(limit)
 
-    # 2. Risk Distribution
-    risk_dist = []
-    risk_counts = db.query(models.RiskProfile.risk_level, func.count(models.RiskProfile.risk_level)).group_by(models.RiskProfile.risk_level).all()
-    
-    colors = {'LOW': '#10B981', 'MEDIUM': '#F59E0B', 'HIGH': '#F97316', 'CRITICAL': '#EF4444'}
-    for level, count in risk_counts:
-        if level:
-            risk_dist.append({"name": level, "value": count, "color": colors.get(level, '#ccc')})
-            
-    # 3. Service Stats
-    service_stats = []
-    svc_counts = db.query(models.Event.service, func.count(models.Event.service)).group_by(models.Event.service).all()
-    for svc, count in svc_counts:
-        if svc:
-            service_stats.append({"name": svc, "events": count, "cases": 0}) # Cases logic TBD
-
-    # 4. Weekly Heatmap (Last 7 Days)
-    # Matrix: 7 Days x 6 Blocks (4-hour chunks) for density
-    heatmap_data = []
-    start_7d = (now - datetime.timedelta(days=7)).isoformat()
-    events_7d = db.query(models.Event).filter(models.Event.timestamp >= start_7d).all()
-    
-    # Map: Day -> HourBlock -> Count
-    # Day Names: Mon, Tue...
-    days_map = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    heat_map = {d: [0]*12 for d in days_map} # 12 blocks of 2 hours
-    
-    for e in events_7d:
-        try:
-            dt = datetime.datetime.fromisoformat(e.timestamp)
-            day_name = dt.strftime("%a") # Mon
-            hour_idx = dt.hour // 2 # 0-11
-            if day_name in heat_map:
-                heat_map[day_name][hour_idx] += 1
-        except:
-            continue
-            
-    for day in days_map:
-        heatmap_data.append({"day": day, "values": heat_map[day]})
-
-    return {
-        "total_events": total_events,
-        "active_risk_rules": active_rules,
-        "open_fraud_cases": open_cases,
-        "high_risk_users": high_risk_users,
-        "traffic_24h": traffic_24h,
-        "risk_distribution": risk_dist,
-        "service_stats": service_stats,
-        "weekly_heatmap": heatmap_data
-    }
+def get_notifications(db: Session, user_id: str = None, status: str = None, limit: int = 100):
+    return db.scalars(select_notifications(user_id, status, limit)).all()
+
+def select_decision_by_event(event_id: str):
+    return select(models.Decision).where(models.Decision.event_id == event_id).limit(1)
+
+def get_decision_by_event(db: Session, event_id: str):
+    return db.scalars(select_decision_by_event(event_id)).first()
+
+def select_event(event_id: str):
+    return select(models.Event).where(models.Event.event_id == event_id).limit(1)
+
+def get_event(db: Session, event_id: str):
+    return db.scalars(select_event(event_id)).first()
+
+def get_dashboard_summary(db: Session):
+    # Served from incrementally maintained counters instead of scanning events
+    dashboard_counters.ensure_loaded(db)
+    active_rules = db.query(models.RiskRule).filter(models.RiskRule.is_active == 1).count()
+    return dashboard_counters.summary(active_rules)
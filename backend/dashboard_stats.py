@@ -0,0 +1,191 @@
+import datetime
+import os
+import threading
+from sqlalchemy import BigInteger, func, type_coerce
+from . import models
+from .database import WORKERS
+from .profile_store import profile_store
+from .timestamps import HOUR_MS, now_ms, to_epoch_ms
+
+# Counters are rebuilt from the database at most this often to correct drift
+# (rolled back transactions, rows written by other tools). Other API workers'
+# writes only show up through a resync, so it runs more often with several
+DASHBOARD_RESYNC_SECONDS = int(os.getenv("TRUSTSHIELD_DASHBOARD_RESYNC_SECONDS", "300" if WORKERS == 1 else "10"))
+# With several API workers each one's increments would cover only its own
+# writes; the counters are then a plain snapshot of the tables instead
+DASHBOARD_INCREMENTAL = os.getenv("TRUSTSHIELD_DASHBOARD_INCREMENTAL", "1" if WORKERS == 1 else "0") == "1"
+
+RISK_COLORS = {'LOW': '#10B981', 'MEDIUM': '#F59E0B', 'HIGH': '#F97316', 'CRITICAL': '#EF4444'}
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+HEATMAP_WINDOW_HOURS = 7 * 24
+
+
+def hour_key(timestamp):
+    """Epoch hour of a timestamp (hours since 1970-01-01 UTC), used as the hourly bucket key."""
+    try:
+        epoch_ms = to_epoch_ms(timestamp)
+    except ValueError:
+        return None
+    return epoch_ms // HOUR_MS if epoch_ms is not None else None
+
+
+def _local_hour(key):
+    return datetime.datetime.fromtimestamp(key * HOUR_MS / 1000.0)
+
+
+class DashboardCounters:
+    """
+    Pre-aggregated dashboard counters kept up to date as events, profiles
+    and cases are written, so the summary is built from hourly buckets
+    instead of scanning the events table. Without `incremental` the record_*
+    hooks are ignored and every worker shows the tables as of its last
+    resync, at most `resync_seconds` old.
+    """
+    def __init__(self, resync_seconds=DASHBOARD_RESYNC_SECONDS, incremental=DASHBOARD_INCREMENTAL):
+        self.resync_seconds = resync_seconds
+        self.incremental = incremental
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self.total_events = 0
+        self.service_counts = {}
+        self.hourly_counts = {}
+        self.risk_levels = {}
+        self.open_cases = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def ensure_loaded(self, db):
+        now = datetime.datetime.now()
+        loaded_at = self._loaded_at
+        if loaded_at is not None and (now - loaded_at).total_seconds() < self.resync_seconds:
+            return
+        self._load(db, now)
+
+    def _load(self, db, now):
+        # Grouped queries only: cost depends on the number of groups, not rows
+        start_7d = (hour_key(now_ms()) - HEATMAP_WINDOW_HOURS) * HOUR_MS
+        # Raw epoch milliseconds: integer division gives the epoch hour
+        epoch_col = type_coerce(models.Event.timestamp, BigInteger)
+        hour_col = epoch_col // HOUR_MS
+
+        total_events = db.query(func.count(models.Event.event_id)).scalar() or 0
+        service_counts = dict(
+            db.query(models.Event.service, func.count(models.Event.event_id)).group_by(models.Event.service).all()
+        )
+        hourly_counts = dict(
+            db.query(hour_col, func.count(models.Event.event_id))
+            .filter(epoch_col >= start_7d)
+            .group_by(hour_col)
+            .all()
+        )
+        # Profile rows trail the in-memory store; it adds its unflushed changes
+        risk_levels = profile_store.level_counts(lambda: dict(
+            db.query(models.RiskProfile.risk_level, func.count(models.RiskProfile.user_id))
+            .group_by(models.RiskProfile.risk_level)
+            .all()
+        ))
+        open_cases = db.query(func.count(models.FraudCase.case_id)).filter(models.FraudCase.status == 'OPEN').scalar() or 0
+
+        with self._lock:
+            self.total_events = total_events
+            self.service_counts = service_counts
+            self.hourly_counts = hourly_counts
+            self.risk_levels = risk_levels
+            self.open_cases = open_cases
+            self._loaded_at = now
+
+    # --- Incremental updates (no-ops until the first load) ---
+
+    def record_events(self, events):
+        with self._lock:
+            if self._loaded_at is None or not self.incremental:
+                return
+            for event in events:
+                self.total_events += 1
+                self.service_counts[event.service] = self.service_counts.get(event.service, 0) + 1
+                key = hour_key(event.timestamp)
+                if key is not None:
+                    self.hourly_counts[key] = self.hourly_counts.get(key, 0) + 1
+
+    def record_risk_level_change(self, old_level, new_level):
+        if old_level == new_level:
+            return
+        with self._lock:
+            if self._loaded_at is None or not self.incremental:
+                return
+            if old_level is not None:
+                self.risk_levels[old_level] = max(0, self.risk_levels.get(old_level, 0) - 1)
+            self.risk_levels[new_level] = self.risk_levels.get(new_level, 0) + 1
+
+    def record_case_status_change(self, old_status, new_status, count=1):
+        with self._lock:
+            if self._loaded_at is None or not self.incremental:
+                return
+            if old_status == 'OPEN':
+                self.open_cases = max(0, self.open_cases - count)
+            if new_status == 'OPEN':
+                self.open_cases += count
+
+    # --- Read side ---
+
+    def summary(self, active_rules):
+        now = datetime.datetime.now()
+        current_hour = hour_key(now_ms())
+        start_24h = current_hour - 24
+        start_7d = current_hour - HEATMAP_WINDOW_HOURS
+
+        with self._lock:
+            # Drop buckets that fell out of the heatmap window
+            for key in [k for k in self.hourly_counts if k < start_7d]:
+                del self.hourly_counts[key]
+            hourly = dict(self.hourly_counts)
+            service_counts = dict(self.service_counts)
+            risk_levels = dict(self.risk_levels)
+            total_events = self.total_events
+            open_cases = self.open_cases
+
+        # 1. Traffic (Last 24h), bucketed by local hour of day
+        by_hour = {}
+        for key, count in hourly.items():
+            if key >= start_24h:
+                label = _local_hour(key).strftime("%H:00")
+                by_hour[label] = by_hour.get(label, 0) + count
+        traffic_24h = [{"time": k, "events": by_hour[k]} for k in sorted(by_hour)]
+        if not traffic_24h:
+            traffic_24h.append({"time": now.strftime("%H:00"), "events": 0})
+
+        # 2. Risk Distribution
+        risk_dist = [
+            {"name": level, "value": count, "color": RISK_COLORS.get(level, '#ccc')}
+            for level, count in sorted(risk_levels.items(), key=lambda x: x[0] or '') if level and count
+        ]
+
+        # 3. Service Stats
+        service_stats = [
+            {"name": svc, "events": count, "cases": 0} # Cases logic TBD
+            for svc, count in sorted(service_counts.items(), key=lambda x: x[0] or '') if svc
+        ]
+
+        # 4. Weekly Heatmap: 7 days x 12 blocks of 2 hours
+        heat_map = {d: [0] * 12 for d in DAYS}
+        for key, count in hourly.items():
+            dt = _local_hour(key)
+            heat_map[DAYS[dt.weekday()]][dt.hour // 2] += count
+        heatmap_data = [{"day": day, "values": heat_map[day]} for day in DAYS]
+
+        return {
+            "total_events": total_events,
+            "active_risk_rules": active_rules,
+            "open_fraud_cases": open_cases,
+            "high_risk_users": risk_levels.get('HIGH', 0),
+            "traffic_24h": traffic_24h,
+            "risk_distribution": risk_dist,
+            "service_stats": service_stats,
+            "weekly_heatmap": heatmap_data
+        }
+
+
+# Shared by the CRUD layer, the engine and the summary endpoint
+dashboard_counters = DashboardCounters()
@@ -1,97 +1,270 @@
 from sqlalchemy.orm import Session
-from . import models
-import datetime
+from typing import List
+from . import crud, models, schemas
+import time
 import uuid
-import re
 from .context_builder import build_evaluation_context
+from .database import ReadSessionLocal
+from .rule_registry import rule_registry
+from .dashboard_stats import dashboard_counters
+from .response_cache import response_cache
+from .live_feed import live_feed
+from .feature_store import feature_store
+from .profile_store import profile_store
+from .notifications import notification_dispatcher
+from .timestamps import now_ms, to_iso
+from . import metrics
+
+# Define Action Priority (Higher is more critical)
+ACTION_HIERARCHY = {
+    "BLOCK": 100,
+    "SUSPEND_ACCOUNT": 95,
+    "TEMP_BLOCK": 90,
+    "OPEN_FRAUD_CASE": 80,
+    "FORCE_2FA": 70,
+    "RATE_LIMIT": 60,
+    "NOTIFY_USER": 50,
+    "ALERT": 40,
+    "MONITOR": 20,
+    "ALLOW": 0
+}
+
+# Message Templates
+MESSAGES = {
+    "BLOCK": "Güvenlik riski nedeniyle hesabınız geçici olarak erişime kapatılmıştır.",
+    "SUSPEND_ACCOUNT": "Hesabınız şüpheli aktiviteler nedeniyle askıya alınmıştır. Lütfen müşteri hizmetleri ile iletişime geçiniz.",
+    "TEMP_BLOCK": "Geçici olarak işlem yapmanız kısıtlanmıştır.",
+    "OPEN_FRAUD_CASE": "İşleminiz inceleme altına alınmıştır. Bilgilendirme yapılacaktır.",
+    "FORCE_2FA": "Güvenlik nedeniyle ek doğrulama (2FA) zorunlu hale getirildi.",
+    "RATE_LIMIT": "İşlem limitine ulaştınız. Lütfen daha sonra tekrar deneyiniz.",
+    "ALERT": "Hesabınızda olağandışı hareketlilik tespit edildi.",
+    "MONITOR": "İşleminiz güvenlik kontrolünden geçiyor."
+}
+
+_STAGE_SECONDS = {
+    stage: metrics.engine_stage_seconds.labels(stage)
+    for stage in ("context", "rules", "side_effects", "commit", "publish")
+}
+
+_DECISIONS = {action: metrics.decisions.labels(action) for action in ACTION_HIERARCHY}
+
+def _stage_done(timings, stage, started):
+    """
+    Records the time since `started` in the stage histogram, adds it to
+    timings[stage] (if collecting) and returns now.
+    """
+    now = time.perf_counter()
+    _STAGE_SECONDS[stage].observe(now - started)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (now - started)
+    return now
+
+def match_rules(rules, context):
+    """
+    Evaluates compiled rules against an evaluation context. Returns the ids
+    of the matching rules (in rule order) and their candidate actions as
+    dicts (action, priority, rule_id), most severe first.
+    """
+    triggered_rules_ids = []
+    possible_actions = []
+    for rule in rules:
+        rule_started = time.perf_counter()
+        try:
+            res = eval(rule.code, {"__builtins__": None}, context)
+            rule.metrics.observe(time.perf_counter() - rule_started)
+            
+            if res:
+                rule.metrics.hits.inc()
+                triggered_rules_ids.append(rule.rule_id)
+                
+                action = rule.action
+                priority_val = ACTION_HIERARCHY.get(action, 10) # Default to low if unknown
+                
+                possible_actions.append({
+                    "action": action,
+                    "priority": priority_val,
+                    "rule_id": rule.rule_id
+                })
+        except Exception as e:
+            # Counted per rule (GET /risk-rules/stats); only a new kind of error is logged
+            if rule.metrics.failed(time.perf_counter() - rule_started, e):
+                print(f"Error evaluating rule {rule.rule_id}: {rule.condition} - {e}")
+            continue
+
+    # Sort valid actions by priority desc
+    possible_actions.sort(key=lambda x: x["priority"], reverse=True)
+    return triggered_rules_ids, possible_actions
+
+def select_action(possible_actions):
+    """Winning action and the distinct suppressed ones (by priority) of sorted candidate actions."""
+    # Winner
+    selected_action = possible_actions[0]["action"]
+    
+    # Suppressed (All unique actions that correspond to ignored lower priorities)
+    # We filter out the selected action itself from suppressed list
+    suppressed_list = [a["action"] for a in possible_actions if a["action"] != selected_action]
+    # Deduplicate while preserving order (since possible_actions is already sorted by priority desc)
+    seen = set()
+    suppressed_ordered = []
+    for action in suppressed_list:
+        if action not in seen:
+            suppressed_ordered.append(action)
+            seen.add(action)
+    return selected_action, suppressed_ordered
+
+def opens_case(selected_action, risk_level):
+    """
+    Automatic Fraud Case (Using Hierarchy logic): the action is OPEN_FRAUD_CASE
+    or anything HIGHER than it (BLOCK, SUSPEND), or the profile is CRITICAL.
+    """
+    return ACTION_HIERARCHY.get(selected_action, 0) >= ACTION_HIERARCHY["OPEN_FRAUD_CASE"] or risk_level == "CRITICAL"
+
+def _live_messages(events, decisions):
+    """
+    Serializes the live feed payloads once, before commit: afterwards the
+    ORM objects are expired and reading them would reload through the writer.
+    """
+    messages = []
+    for event, decision in zip(events, decisions):
+        messages.append(("event", schemas.Event.model_validate(event).model_dump()))
+        if decision is not None:
+            messages.append(("decision", schemas.Decision.model_validate(decision).model_dump()))
+    return messages
+
+def _live_summary():
+    # On the read pool: publishing after an ingest commit must not hold the single writer
+    db = ReadSessionLocal()
+    try:
+        return schemas.DashboardSummary(**crud.get_dashboard_summary(db)).model_dump()
+    finally:
+        db.close()
+
+
+class Outbox:
+    """
+    Side effects of one transaction's decisions that live outside the
+    database: velocity windows, profile updates, dashboard counters and
+    notifications. Staged while deciding, applied only once the transaction
+    commits, so a rolled back decision leaves nothing behind.
+    """
+    def __init__(self):
+        self.features = feature_store.staging()
+        self.profiles = profile_store.staging()
+        self.opened_cases = 0
+        self.notifications = [] # (user_id, action, message, priority)
+
+    def apply(self):
+        feature_store.record(self.features)
+        for old_level, new_level in profile_store.commit_staged(self.profiles):
+            dashboard_counters.record_risk_level_change(old_level, new_level)
+        if self.opened_cases:
+            dashboard_counters.record_case_status_change(None, "OPEN", self.opened_cases)
+        for user_id, action, message, priority in self.notifications:
+            notification_dispatcher.submit(user_id, action, message, priority)
+
 
 class RuleEngine:
-    def evaluate(self, db: Session, event: models.Event):
-        # 1. Fetch Active Rules
-        # No longer sorting by priority, capturing all.
-        rules = db.query(models.RiskRule).filter(models.RiskRule.is_active == 1).all()
-        
-        triggered_rules_ids = []
-        possible_actions = [] # List of tuples (priority_val, action_name, rule_id)
+    def evaluate(self, db: Session, event: models.Event, timings: dict = None):
+        """
+        Evaluates one event and commits its decision (and whatever else the
+        session holds, e.g. the pipeline's claim on the event).
+        If `timings` is given, per-stage seconds (context, rules,
+        side_effects, commit, publish) are accumulated into it.
+        """
+        # 1. Fetch compiled active rules (cached until a rule changes)
+        rule_set = rule_registry.get_rule_set(db)
+
+        outbox = Outbox()
+        decision = self._decide(db, event, rule_set, {}, outbox, timings)
+        started = time.perf_counter()
+        messages = _live_messages([event], [decision])
+        started = _stage_done(timings, "publish", started)
+        db.commit()
+        outbox.apply()
+        if decision is not None:
+            self._invalidate_read_caches()
+        started = _stage_done(timings, "commit", started)
+        self._publish_live(messages)
+        _stage_done(timings, "publish", started)
+        return decision
+
+    def evaluate_batch(self, db: Session, events: List[models.Event], timings: dict = None):
+        """
+        Evaluates a burst of events against a single rule snapshot and
+        writes every side effect in one transaction.
+        Returns the decision (or None) for each event, in input order.
+        """
+        rule_set = rule_registry.get_rule_set(db)
+
+        # Load the risk profiles of every user in the batch with one query
+        user_ids = {e.user_id for e in events}
+        profile_store.preload(db, user_ids)
+        # Same for their open fraud cases, which new cases are merged into
+        open_cases = crud.get_open_cases(db, user_ids)
+
+        outbox = Outbox()
+        decisions = [self._decide(db, event, rule_set, open_cases, outbox, timings) for event in events]
+        started = time.perf_counter()
+        messages = _live_messages(events, decisions)
+        started = _stage_done(timings, "publish", started)
+        db.commit()
+        outbox.apply()
+        if any(d is not None for d in decisions):
+            self._invalidate_read_caches()
+        started = _stage_done(timings, "commit", started)
+        self._publish_live(messages)
+        _stage_done(timings, "publish", started)
+        return decisions
+
+    def _publish_live(self, messages):
+        # Fanned out to every live dashboard once the transaction has committed
+        for kind, payload in messages:
+            live_feed.publish(kind, payload)
+        live_feed.publish_summary(_live_summary)
+
+    def _invalidate_read_caches(self):
+        # New decisions change the decision list and risk profiles; the dashboard
+        # is left to its short TTL so ingest bursts do not defeat its cache
+        response_cache.invalidate("decisions", "risk-profiles")
+
+    def _get_open_case(self, db: Session, user_id: str, open_cases: dict):
+        # Cases opened earlier in the same batch are not flushed yet, so the
+        # dict is the source of truth before falling back to a query
+        if user_id not in open_cases:
+            open_cases[user_id] = crud.get_open_case(db, user_id)
+        return open_cases[user_id]
+
+    def _decide(self, db: Session, event: models.Event, rule_set, open_cases: dict, outbox: Outbox, timings: dict = None):
+        """
+        Matches rules for one event and stages the decision and its side effects
+        (no commit). Effects outside the database are staged in `outbox`.
+        """
+        started = time.perf_counter()
+
+        # Only the rules indexed under this event's service / event type
+        rules = rule_set.candidates(event.service, event.event_type)
         
-        # Define Action Priority (Higher is more critical)
-        ACTION_HIERARCHY = {
-            "BLOCK": 100,
-            "SUSPEND_ACCOUNT": 95,
-            "TEMP_BLOCK": 90,
-            "OPEN_FRAUD_CASE": 80,
-            "FORCE_2FA": 70,
-            "RATE_LIMIT": 60,
-            "NOTIFY_USER": 50,
-            "ALERT": 40,
-            "MONITOR": 20,
-            "ALLOW": 0
-        }
+        # Update the sliding windows first so velocity features include this event
+        features = feature_store.observe(event, db, outbox.features)
 
         # Build Context using helper
-        context = build_evaluation_context(event)
+        context = build_evaluation_context(event, features)
+        started = _stage_done(timings, "context", started)
         
-        # Known services for optimization check
-        KNOWN_SERVICES = ['Paycell', 'BiP', 'TV+', 'Superonline']
-
-        # Optimized Loop
-        for rule in rules:
-            try:
-                # Service Matching Check
-                target_service = rule.condition.split('.')[0]
-                if target_service in KNOWN_SERVICES and target_service != event.service:
-                    continue
-
-                # Basic normalization
-                condition = rule.condition.replace(" AND ", " and ").replace(" OR ", " or ")
-                
-                # Basic normalization
-                condition = rule.condition.replace(" AND ", " and ").replace(" OR ", " or ")
-                
-                res = eval(condition, {"__builtins__": None}, context)
-                
-                if res:
-                    triggered_rules_ids.append(rule.rule_id)
-                    
-                    action = rule.action.upper()
-                    priority_val = ACTION_HIERARCHY.get(action, 10) # Default to low if unknown
-                    
-                    possible_actions.append({
-                        "action": action,
-                        "priority": priority_val,
-                        "rule_id": rule.rule_id
-                    })
-            except Exception as e:
-                print(f"Error evaluating rule {rule.rule_id}: {condition} - {e}")
-                continue
-
+        triggered_rules_ids, possible_actions = match_rules(rules, context)
+        started = _stage_done(timings, "rules", started)
 
         # If any rule triggered
         if triggered_rules_ids:
-            # Sort valid actions by priority desc
-            possible_actions.sort(key=lambda x: x["priority"], reverse=True)
-            
-            # Winner
-            selected_action = possible_actions[0]["action"]
-            
-            # Suppressed (All unique actions that correspond to ignored lower priorities)
-            # We filter out the selected action itself from suppressed list
-            suppressed_list = [a["action"] for a in possible_actions if a["action"] != selected_action]
-            # Deduplicate while preserving order (since possible_actions is already sorted by priority desc)
-            seen = set()
-            suppressed_ordered = []
-            for action in suppressed_list:
-                if action not in seen:
-                    suppressed_ordered.append(action)
-                    seen.add(action)
+            selected_action, suppressed_ordered = select_action(possible_actions)
             
             suppressed_str = ",".join(suppressed_ordered)
             
             # Collect signals
-            rule_map = {r.rule_id: r for r in rules}
+            rule_map = rule_set.by_id
             decision_signals = [rule_map[r_id].signal for r_id in triggered_rules_ids if r_id in rule_map and rule_map[r_id].signal]
             
-            timestamp = datetime.datetime.now().isoformat()
+            timestamp = to_iso(now_ms())
             decision = models.Decision(
                 decision_id=str(uuid.uuid4()),
                 user_id=event.user_id,
@@ -100,98 +273,70 @@ class RuleEngine:
                 signals=",".join(decision_signals),
                 selected_action=selected_action,
                 suppressed_actions=suppressed_str, # Explicitly storing suppressed
+                rule_set_version=rule_set.version,
                 timestamp=timestamp
             )
             db.add(decision)
+            (_DECISIONS.get(selected_action) or metrics.decisions.labels(selected_action)).inc()
             
             # --- SIDE EFFECTS ---
             
             # 1. Update Risk Profile (Signal Based Score)
-            profile = db.query(models.RiskProfile).filter(models.RiskProfile.user_id == event.user_id).first()
-            if not profile:
-                profile = models.RiskProfile(user_id=event.user_id, risk_score=0, risk_level="LOW", signals="")
-                db.add(profile)
-            
-            score_increase = 0
-            new_signals = []
-            
-            # Sum scores from ALL triggered rules
-            for r_id in triggered_rules_ids:
-                if r_id in rule_map:
-                    rule = rule_map[r_id]
-                    score_increase += rule.risk_score
-                    if rule.signal:
-                        new_signals.append(rule.signal)
-
-            profile.risk_score = min(100, profile.risk_score + score_increase)
-            
-            # Signal Management
-            existing_signals = profile.signals.split(",") if profile.signals else []
-            existing_signals = [s for s in existing_signals if s]
-            for sig in new_signals:
-                if sig not in existing_signals:
-                    existing_signals.append(sig)
-            
-            profile.signals = ",".join(existing_signals)
+            # Every triggered rule adds its score under its signal; older
+            # contributions decay first, so the score no longer only grows
+            contributions = [
+                (rule_map[r_id].signal, rule_map[r_id].risk_score or 0)
+                for r_id in triggered_rules_ids if r_id in rule_map
+            ]
 
-            # Update Level
-            if profile.risk_score >= 80: profile.risk_level = "CRITICAL"
-            elif profile.risk_score >= 50: profile.risk_level = "HIGH"
-            elif profile.risk_score >= 20: profile.risk_level = "MEDIUM"
-            else: profile.risk_level = "LOW"
+            # Applied in memory after commit; the profile store writes it back in batches
+            old_level, risk_level = profile_store.stage(db, event.user_id, contributions, outbox.profiles)
             
             # 2. Mock BiP Notification
             # Notify for any non-ALLOW action
             msg_content = None
             if selected_action != "ALLOW":
-                # Message Templates
-                MESSAGES = {
-                    "BLOCK": "Güvenlik riski nedeniyle hesabınız geçici olarak erişime kapatılmıştır.",
-                    "SUSPEND_ACCOUNT": "Hesabınız şüpheli aktiviteler nedeniyle askıya alınmıştır. Lütfen müşteri hizmetleri ile iletişime geçiniz.",
-                    "TEMP_BLOCK": "Geçici olarak işlem yapmanız kısıtlanmıştır.",
-                    "OPEN_FRAUD_CASE": "İşleminiz inceleme altına alınmıştır. Bilgilendirme yapılacaktır.",
-                    "FORCE_2FA": "Güvenlik nedeniyle ek doğrulama (2FA) zorunlu hale getirildi.",
-                    "RATE_LIMIT": "İşlem limitine ulaştınız. Lütfen daha sonra tekrar deneyiniz.",
-                    "ALERT": "Hesabınızda olağandışı hareketlilik tespit edildi.",
-                    "MONITOR": "İşleminiz güvenlik kontrolünden geçiyor."
-                }
-                
                 msg_content = MESSAGES.get(selected_action, f"Hesabınızda {selected_action} işlemi uygulandı.")
-                
-                notif = models.BipNotification(
-                    notification_id=str(uuid.uuid4()),
-                    user_id=event.user_id,
-                    channel="BiP",
-                    message=msg_content,
-                    sent_at=timestamp
-                )
-                db.add(notif)
-                # Mock Send Logic
-                print(f"[BiP MOCK SEND] To: {event.user_id} | Msg: {msg_content}")
-            
-            # 3. Automatic Fraud Case (Using Hierarchy logic)
-            # If action is OPEN_FRAUD_CASE or anything HIGHER than it (BLOCK, SUSPEND)
-            # OR if profile is CRITICAL
+                # Handed to the dispatcher after commit; it coalesces, dedups,
+                # rate-limits, delivers and records the outcome
+                outbox.notifications.append((event.user_id, selected_action, msg_content, ACTION_HIERARCHY.get(selected_action, 0)))
             
-            priority_threshold = ACTION_HIERARCHY["OPEN_FRAUD_CASE"]
+            # 3. Automatic Fraud Case
             selected_priority = ACTION_HIERARCHY.get(selected_action, 0)
             
             case_id = None
-            if selected_priority >= priority_threshold or profile.risk_level == "CRITICAL":
-                case_id = str(uuid.uuid4())
-                case = models.FraudCase(
-                    case_id=case_id,
-                    user_id=event.user_id,
-                    event_id=event.event_id,
-                    opened_by="SYSTEM",
-                    case_type="AUTOMATED_RISK",
-                    triggering_action=selected_action, # Added
-                    notification_log=msg_content, # Added
-                    status="OPEN",
-                    opened_at=timestamp,
-                    priority="HIGH"
-                )
-                db.add(case)
+            if opens_case(selected_action, risk_level):
+                # One open case per user: later events are attached to it
+                case = self._get_open_case(db, event.user_id, open_cases)
+                if case is None:
+                    case = models.FraudCase(
+                        case_id=str(uuid.uuid4()),
+                        user_id=event.user_id,
+                        event_id=event.event_id,
+                        opened_by="SYSTEM",
+                        case_type="AUTOMATED_RISK",
+                        triggering_action=selected_action, # Added
+                        notification_log=msg_content, # Added
+                        status="OPEN",
+                        opened_at=timestamp,
+                        priority="HIGH"
+                    )
+                    db.add(case)
+                    open_cases[event.user_id] = case
+                    outbox.opened_cases += 1
+                else:
+                    if selected_priority > ACTION_HIERARCHY.get(case.triggering_action, 0):
+                        case.triggering_action = selected_action
+                    db.add(models.CaseAction(
+                        action_id=str(uuid.uuid4()),
+                        case_id=case.case_id,
+                        event_id=event.event_id,
+                        action_type="EVENT_ATTACHED",
+                        actor="SYSTEM",
+                        note=f"{selected_action} ({','.join(triggered_rules_ids)})",
+                        timestamp=timestamp
+                    ))
+                case_id = case.case_id
             
             # 4. Create Traceability Log
             trace_log = models.TraceabilityLog(
@@ -203,6 +348,6 @@ class RuleEngine:
             )
             db.add(trace_log)
 
-            db.commit()
+            _stage_done(timings, "side_effects", started)
             return decision
         return None
@@ -0,0 +1,127 @@
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+# Stable storage codes. The API keeps speaking the string names; only the
+# database stores integers. Never renumber an existing entry.
+# UNKNOWN marks legacy rows whose string could not be mapped by a migration.
+
+ACTION_CODES = {
+    "UNKNOWN": -1,
+    "ALLOW": 0,
+    "MONITOR": 1,
+    "ALERT": 2,
+    "NOTIFY_USER": 3,
+    "RATE_LIMIT": 4,
+    "FORCE_2FA": 5,
+    "OPEN_FRAUD_CASE": 6,
+    "TEMP_BLOCK": 7,
+    "SUSPEND_ACCOUNT": 8,
+    "BLOCK": 9,
+    # Legacy names present in the imported CSV data
+    "ANOMALY_ALERT": 20,
+    "PAYMENT_REVIEW": 21,
+    "TEMPORARY_BLOCK": 22,
+    "CREATE_CASE": 23,
+}
+
+RISK_LEVEL_CODES = {
+    "UNKNOWN": -1,
+    "LOW": 0,
+    "MEDIUM": 1,
+    "HIGH": 2,
+    "CRITICAL": 3,
+}
+
+CASE_STATUS_CODES = {
+    "UNKNOWN": -1,
+    "OPEN": 0,
+    "IN_PROGRESS": 1,
+    "ESCALATED": 2,
+    "CLOSED": 3,
+    "FALSE_POSITIVE": 4,
+}
+
+CASE_PRIORITY_CODES = {
+    "UNKNOWN": -1,
+    "LOW": 0,
+    "MEDIUM": 1,
+    "HIGH": 2,
+    "CRITICAL": 3,
+}
+
+NOTIFICATION_STATUS_CODES = {
+    "UNKNOWN": -1,
+    "SENT": 0,
+    "FAILED": 1,
+    "DUPLICATE": 2,
+    "RATE_LIMITED": 3,
+}
+
+
+
+class CodedEnum(TypeDecorator):
+    """
+    Integer column exposed as an upper-case string name.
+    Binding an unknown name raises ValueError instead of storing it.
+    """
+    impl = Integer
+    cache_ok = True
+    codes = {}
+
+    @classmethod
+    def code(cls, name):
+        return cls.codes[name.upper()]
+
+    @classmethod
+    def is_valid(cls, name):
+        return isinstance(name, str) and name.upper() in cls.codes
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            return self.codes[value.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown {type(self).__name__} value: {value!r}")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            if not value.lstrip("-").isdigit():
+                return value # Legacy string row not migrated yet
+            value = int(value)
+        return self._names().get(value, "UNKNOWN")
+
+    @classmethod
+    def _names(cls):
+        names = cls.__dict__.get("_names_cache")
+        if names is None:
+            names = {code: name for name, code in cls.codes.items()}
+            cls._names_cache = names
+        return names
+
+
+class ActionType(CodedEnum):
+    cache_ok = True
+    codes = ACTION_CODES
+
+
+class RiskLevelType(CodedEnum):
+    cache_ok = True
+    codes = RISK_LEVEL_CODES
+
+
+class CaseStatusType(CodedEnum):
+    cache_ok = True
+    codes = CASE_STATUS_CODES
+
+
+class CasePriorityType(CodedEnum):
+    cache_ok = True
+    codes = CASE_PRIORITY_CODES
+
+
+class NotificationStatusType(CodedEnum):
+    cache_ok = True
+    codes = NOTIFICATION_STATUS_CODES
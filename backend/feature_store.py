@@ -0,0 +1,271 @@
+import datetime
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import BigInteger, type_coerce
+from . import models
+from .context_builder import parse_meta
+from .database import WORKERS
+from .timestamps import to_epoch_ms
+
+# Width of one ring-buffer slot; windows are whole multiples of it
+FEATURE_BUCKET_SECONDS = int(os.getenv("TRUSTSHIELD_FEATURE_BUCKET_SECONDS", "60"))
+# Exposed windows as name=seconds pairs, e.g. count_10m / sum_1h in rule conditions
+FEATURE_WINDOWS = os.getenv("TRUSTSHIELD_FEATURE_WINDOWS", "1m=60,10m=600,1h=3600")
+# Upper bound on tracked (user, service[, event_type]) keys before LRU eviction
+FEATURE_MAX_KEYS = int(os.getenv("TRUSTSHIELD_FEATURE_MAX_KEYS", "200000"))
+# "memory" keeps windows in this process; "database" computes them from the
+# events table so several API worker processes see each other's events
+FEATURE_STORE = os.getenv("TRUSTSHIELD_FEATURE_STORE", "database" if WORKERS > 1 else "memory")
+
+
+def parse_windows(spec):
+    windows = []
+    for part in spec.split(","):
+        name, _, seconds = part.strip().partition("=")
+        if name and seconds:
+            windows.append((name, int(seconds)))
+    return windows
+
+
+def event_epoch(timestamp):
+    """Epoch seconds of an ISO timestamp (with or without a trailing Z); None if unparseable."""
+    if not timestamp:
+        return None
+    try:
+        return to_epoch_ms(timestamp) / 1000.0
+    except ValueError:
+        return None
+
+
+class _RingWindow:
+    """Time-bucketed counters for one key: one slot per bucket, reused modulo size."""
+    __slots__ = ("bucket_ids", "counts", "sums", "merchants", "last_bucket")
+
+    def __init__(self, size):
+        self.bucket_ids = [-1] * size
+        self.counts = [0] * size
+        self.sums = [0.0] * size
+        self.merchants = [None] * size
+        self.last_bucket = -1
+
+    def _slot(self, bucket):
+        """Index of the bucket's slot (reset if it held an older bucket), or None if too old."""
+        size = len(self.bucket_ids)
+        i = bucket % size
+        current = self.bucket_ids[i]
+        if current > bucket or bucket <= self.last_bucket - size:
+            return None # Older than anything the ring still covers
+        if current != bucket:
+            self.bucket_ids[i] = bucket
+            self.counts[i] = 0
+            self.sums[i] = 0.0
+            self.merchants[i] = None
+        if bucket > self.last_bucket:
+            self.last_bucket = bucket
+        return i
+
+    def add(self, bucket, value, merchant):
+        i = self._slot(bucket)
+        if i is None:
+            return
+        self.counts[i] += 1
+        self.sums[i] += value
+        if merchant is not None:
+            if self.merchants[i] is None:
+                self.merchants[i] = set()
+            self.merchants[i].add(merchant)
+
+    def merge(self, other):
+        """Adds the slots of another ring, e.g. the events staged by one transaction."""
+        for j, bucket in enumerate(other.bucket_ids):
+            if bucket < 0:
+                continue
+            i = self._slot(bucket)
+            if i is None:
+                continue
+            self.counts[i] += other.counts[j]
+            self.sums[i] += other.sums[j]
+            if other.merchants[j]:
+                if self.merchants[i] is None:
+                    self.merchants[i] = set()
+                self.merchants[i].update(other.merchants[j])
+
+    def aggregate(self, now_bucket, spans):
+        """Returns [(count, sum, merchant_set)] for each span (in buckets) ending at now_bucket."""
+        totals = [[0, 0.0, set()] for _ in spans]
+        for i, bucket in enumerate(self.bucket_ids):
+            age = now_bucket - bucket
+            if bucket < 0 or age < 0:
+                continue
+            for t, span in zip(totals, spans):
+                if age < span:
+                    t[0] += self.counts[i]
+                    t[1] += self.sums[i]
+                    if self.merchants[i]:
+                        t[2].update(self.merchants[i])
+        return totals
+
+
+class SlidingWindowStore:
+    """
+    In-memory per-user velocity features.
+    Two rings are kept per event: one keyed by (user_id, service) and one by
+    (user_id, service, event_type). Memory is bounded by the ring size and
+    by FEATURE_MAX_KEYS; idle keys are evicted least-recently-used first.
+    """
+    def __init__(self, windows=None, bucket_seconds=FEATURE_BUCKET_SECONDS, max_keys=FEATURE_MAX_KEYS):
+        self.windows = windows if windows is not None else parse_windows(FEATURE_WINDOWS)
+        self.bucket_seconds = bucket_seconds
+        self.spans = [max(1, -(-seconds // bucket_seconds)) for _, seconds in self.windows]
+        self.size = max(self.spans) if self.spans else 1
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._rings = OrderedDict()
+
+    def __len__(self):
+        return len(self._rings)
+
+    def _point(self, event):
+        """(bucket, value, merchant) of an event as the rings count it."""
+        epoch = event_epoch(event.timestamp)
+        if epoch is None:
+            epoch = datetime.datetime.now().timestamp()
+        meta = parse_meta(event)
+        merchant = meta.get("merchant") if isinstance(meta, dict) else None
+        return int(epoch // self.bucket_seconds), event.value if event.value is not None else 0, merchant
+
+    def _features(self, service_totals, type_totals):
+        features = {}
+        for (name, _), svc, typ in zip(self.windows, service_totals, type_totals):
+            features[f"count_{name}"] = svc[0]
+            features[f"sum_{name}"] = svc[1]
+            features[f"distinct_merchants_{name}"] = len(svc[2])
+            features[f"type_count_{name}"] = typ[0]
+            features[f"type_sum_{name}"] = typ[1]
+        return features
+
+    def staging(self):
+        return {}
+
+    def observe(self, event, db=None, staged=None):
+        """
+        Records the event and returns its feature dict (the event itself included).
+        With `staged` (from staging(), one per transaction) the event is only
+        counted on top of the shared rings; record(staged) adds the staged
+        events once their transaction commits, so rolled back events are not counted.
+        """
+        bucket, value, merchant = self._point(event)
+
+        service_key = (event.user_id, event.service)
+        type_key = (event.user_id, event.service, event.event_type)
+
+        if staged is not None:
+            for key in (service_key, type_key):
+                ring = staged.get(key)
+                if ring is None:
+                    ring = staged[key] = _RingWindow(self.size)
+                ring.add(bucket, value, merchant)
+            with self._lock:
+                service_totals = self._totals(service_key, staged[service_key], bucket)
+                type_totals = self._totals(type_key, staged[type_key], bucket)
+            return self._features(service_totals, type_totals)
+
+        with self._lock:
+            service_ring = self._ring(service_key)
+            type_ring = self._ring(type_key)
+            service_ring.add(bucket, value, merchant)
+            type_ring.add(bucket, value, merchant)
+            service_totals = service_ring.aggregate(bucket, self.spans)
+            type_totals = type_ring.aggregate(bucket, self.spans)
+            self._evict(bucket)
+
+        return self._features(service_totals, type_totals)
+
+    def _totals(self, key, pending, bucket):
+        # Caller holds self._lock
+        totals = pending.aggregate(bucket, self.spans)
+        ring = self._rings.get(key)
+        if ring is not None:
+            for t, (count, total, merchants) in zip(totals, ring.aggregate(bucket, self.spans)):
+                t[0] += count
+                t[1] += total
+                t[2].update(merchants)
+        return totals
+
+    def record(self, staged):
+        """Adds the events staged by observe() for a committed transaction."""
+        if not staged:
+            return
+        with self._lock:
+            for key, pending in staged.items():
+                self._ring(key).merge(pending)
+            self._evict(max(pending.last_bucket for pending in staged.values()))
+
+    def _ring(self, key):
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = _RingWindow(self.size)
+        else:
+            self._rings.move_to_end(key)
+        return ring
+
+    def _evict(self, now_bucket):
+        # Least recently touched keys sit at the front: drop them while they are
+        # idle for longer than the largest window, or while over capacity
+        while self._rings:
+            key, ring = next(iter(self._rings.items()))
+            if len(self._rings) > self.max_keys or now_bucket - ring.last_bucket >= self.size:
+                del self._rings[key]
+            else:
+                break
+
+
+class DatabaseWindowStore(SlidingWindowStore):
+    """
+    The same features computed from the events table instead of process
+    memory, so every API worker counts the events ingested by all of them.
+    Each observe reads the user's events of the service within the largest
+    window (ix_events_user_timestamp) into throw-away rings.
+    """
+    def observe(self, event, db=None, staged=None):
+        # Uncommitted events of the caller's transaction are visible to its own query
+        bucket, value, merchant = self._point(event)
+        epoch_ms = type_coerce(models.Event.timestamp, BigInteger)
+        bucket_ms = self.bucket_seconds * 1000
+        rows = (
+            db.query(models.Event.event_type, models.Event.value, models.Event.meta, epoch_ms)
+            .filter(
+                models.Event.user_id == event.user_id,
+                models.Event.service == event.service,
+                epoch_ms >= (bucket - self.size + 1) * bucket_ms,
+                epoch_ms < (bucket + 1) * bucket_ms,
+                # Counted below whether or not it is stored yet
+                models.Event.event_id != event.event_id,
+            )
+            .all()
+        )
+        service_ring = _RingWindow(self.size)
+        type_ring = _RingWindow(self.size)
+        for event_type, row_value, meta, row_ms in rows:
+            meta = parse_meta(_Meta(meta))
+            row_merchant = meta.get("merchant") if isinstance(meta, dict) else None
+            row_bucket = row_ms // bucket_ms
+            service_ring.add(row_bucket, row_value if row_value is not None else 0, row_merchant)
+            if event_type == event.event_type:
+                type_ring.add(row_bucket, row_value if row_value is not None else 0, row_merchant)
+        service_ring.add(bucket, value, merchant)
+        type_ring.add(bucket, value, merchant)
+        return self._features(service_ring.aggregate(bucket, self.spans), type_ring.aggregate(bucket, self.spans))
+
+
+class _Meta:
+    # parse_meta reads the `meta` attribute of an event
+    __slots__ = ("meta",)
+
+    def __init__(self, meta):
+        self.meta = meta
+
+
+# Shared by the engine; updated on ingest before rule evaluation
+feature_store = DatabaseWindowStore() if FEATURE_STORE == "database" else SlidingWindowStore()
@@ -0,0 +1,278 @@
+"""
+Streaming bulk import of historical data.
+
+Each table is loaded from `<table>.csv` (or `<table>.parquet` when pyarrow is
+installed) in fixed-size chunks: source columns are mapped to the model
+columns once, every chunk goes through the same compiled INSERT in its own
+transaction, and the table's secondary indexes are dropped for the load and
+rebuilt at the end. The number of rows committed per table is checkpointed in
+the same transaction as the rows, so a failed import resumes where it stopped
+when run again:
+
+    python -m backend.importer --folder ./csv [--chunk-size 5000] [--reset]
+"""
+import csv
+import datetime
+import itertools
+import os
+import time
+
+from sqlalchemy import BigInteger, Boolean, Column, Float, Integer, MetaData, String, Table, select
+
+from . import migrations, models
+from .context_builder import normalize_service
+from .enums import CodedEnum
+from .timestamps import EpochTimestamp
+
+try:
+    import pyarrow.parquet as pq
+except ImportError: # Parquet sources are optional
+    pq = None
+
+IMPORT_DIR = os.getenv(
+    "TRUSTSHIELD_IMPORT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv"),
+)
+IMPORT_CHUNK_SIZE = int(os.getenv("TRUSTSHIELD_IMPORT_CHUNK_SIZE", "5000"))
+# Seconds between progress lines while a table loads
+PROGRESS_SECONDS = 5
+
+# Load order respects foreign keys
+IMPORT_TABLES = [
+    "users", "events", "risk_rules", "risk_profiles",
+    "fraud_cases", "case_actions", "decisions", "bip_notifications",
+]
+
+_import_meta = MetaData()
+import_checkpoints = Table(
+    "import_checkpoints", _import_meta,
+    Column("table_name", String, primary_key=True),
+    Column("source", String),
+    Column("rows_loaded", BigInteger),
+    Column("last_key", String), # Primary key of the last committed row, checked on resume
+    Column("completed", Integer),
+    Column("updated_at", String),
+)
+
+# Canonicalized like the API does on ingest, so rules and filters match imported rows
+NORMALIZED_COLUMNS = {"service": normalize_service}
+
+_TRUE = {"true", "t", "yes", "y", "1"}
+_FALSE = {"false", "f", "no", "n", "0"}
+
+
+class SourceChanged(Exception):
+    """A partly loaded table's source no longer matches its checkpoint."""
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        lowered = value.strip().lower()
+        if lowered in _TRUE:
+            return 1
+        if lowered in _FALSE:
+            return 0
+        return int(float(value))
+
+
+def _converter(column):
+    """Text cell -> bind value for `column`; empty cells become NULL."""
+    col_type = column.type
+    if isinstance(col_type, (CodedEnum, EpochTimestamp)):
+        convert = None # The column type parses names / ISO strings itself
+    elif isinstance(col_type, Boolean):
+        convert = lambda v: v.strip().lower() in _TRUE
+    elif isinstance(col_type, Integer): # Includes BigInteger
+        convert = _to_int
+    elif isinstance(col_type, Float):
+        convert = float
+    else:
+        convert = None
+    if convert is None:
+        return lambda v: v if v != "" else None
+    return lambda v: convert(v) if v != "" else None
+
+
+def find_source(folder, table_name):
+    """Absolute path of the table's source file (so checkpoints match across runs), or None."""
+    folder = os.path.abspath(folder)
+    if pq is not None:
+        path = os.path.join(folder, f"{table_name}.parquet")
+        if os.path.exists(path):
+            return path
+    path = os.path.join(folder, f"{table_name}.csv")
+    return path if os.path.exists(path) else None
+
+
+def read_csv_chunks(path, table, chunk_size, skip=0):
+    """Yields lists of row dicts for `table`, skipping the first `skip` data rows."""
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        mapping = [(i, name, _converter(table.c[name])) for i, name in enumerate(header) if name in table.c]
+        ignored = [name for name in header if name not in table.c]
+        if ignored:
+            print(f"- {os.path.basename(path)}: ignoring columns not in {table.name}: {', '.join(ignored)}")
+        width = len(header)
+        for _ in itertools.islice(reader, skip):
+            pass
+        chunk = []
+        for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            chunk.append({name: convert(row[i]) for i, name, convert in mapping})
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def read_parquet_chunks(path, table, chunk_size, skip=0):
+    """Parquet counterpart of read_csv_chunks; values keep their Arrow types."""
+    source = pq.ParquetFile(path)
+    columns = [name for name in source.schema_arrow.names if name in table.c]
+    for batch in source.iter_batches(batch_size=chunk_size, columns=columns):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        if skip:
+            batch = batch.slice(skip)
+            skip = 0
+        yield batch.to_pylist()
+
+
+def _read_chunks(path, table, chunk_size, skip, last_key):
+    """
+    Chunks after the first `skip` rows. On resume the last committed row is
+    re-read and compared with the checkpoint, so rows after it may have been
+    fixed in the meantime but rows before it must not have moved.
+    """
+    reader = read_parquet_chunks if path.endswith(".parquet") else read_csv_chunks
+    if not skip:
+        yield from reader(path, table, chunk_size)
+        return
+    key_name = table.primary_key.columns.values()[0].name
+    chunks = reader(path, table, chunk_size, skip - 1)
+    first = next(chunks, [])
+    if not first or str(first[0].get(key_name)) != last_key:
+        raise SourceChanged(
+            f"row {skip} of {path} is not the last row imported into {table.name} ({last_key}); "
+            f"rerun with --reset to start over"
+        )
+    if len(first) > 1:
+        yield first[1:]
+    yield from chunks
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def import_table(engine, table_name, path, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Loads one source file into `table_name`, resuming from its checkpoint.
+    Returns the number of rows inserted by this call.
+    """
+    table = models.Base.metadata.tables[table_name]
+    checkpoints = import_checkpoints
+    key_name = table.primary_key.columns.values()[0].name
+    with engine.begin() as conn:
+        checkpoint = conn.execute(select(checkpoints).where(checkpoints.c.table_name == table_name)).first()
+        if checkpoint is not None and checkpoint.source != path:
+            raise SourceChanged(
+                f"{table_name} was being loaded from {checkpoint.source}, not {path}; "
+                f"rerun with --reset to start over"
+            )
+        if checkpoint is not None and checkpoint.completed:
+            print(f"- {table_name}: already imported ({checkpoint.rows_loaded} rows), skipping")
+            return 0
+        if checkpoint is None:
+            conn.execute(checkpoints.insert().values(
+                table_name=table_name, source=path, rows_loaded=0, completed=0, updated_at=_now(),
+            ))
+        # Maintaining indexes row by row is the dominant cost of a bulk load
+        for index in table.indexes:
+            index.drop(bind=conn, checkfirst=True)
+
+    skip = checkpoint.rows_loaded if checkpoint is not None else 0
+    if skip:
+        print(f"- {table_name}: resuming after {skip} rows")
+    insert = table.insert()
+    normalizers = [(name, normalize) for name, normalize in NORMALIZED_COLUMNS.items() if name in table.c]
+    position = checkpoints.update().where(checkpoints.c.table_name == table_name)
+    loaded = skip
+    inserted = 0
+    started = reported = time.perf_counter()
+    last_key = checkpoint.last_key if checkpoint is not None else None
+    for chunk in _read_chunks(path, table, chunk_size, skip, last_key):
+        for name, normalize in normalizers:
+            for row in chunk:
+                if name in row:
+                    row[name] = normalize(row[name])
+        with engine.begin() as conn:
+            conn.execute(insert, chunk)
+            conn.execute(position.values(
+                rows_loaded=loaded + len(chunk), last_key=str(chunk[-1].get(key_name)), updated_at=_now(),
+            ))
+        loaded += len(chunk)
+        inserted += len(chunk)
+        now = time.perf_counter()
+        if now - reported >= PROGRESS_SECONDS:
+            reported = now
+            print(f"- {table_name}: {loaded} rows ({inserted / (now - started):.0f} rows/s)")
+    load_seconds = time.perf_counter() - started
+
+    index_started = time.perf_counter()
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+        conn.execute(position.values(completed=1, updated_at=_now()))
+    index_seconds = time.perf_counter() - index_started
+
+    rate = inserted / load_seconds if load_seconds > 0 else 0
+    print(f"- {table_name}: {inserted} rows in {load_seconds:.1f}s ({rate:.0f} rows/s), "
+          f"indexes rebuilt in {index_seconds:.1f}s")
+    return inserted
+
+
+def import_folder(engine, folder=IMPORT_DIR, chunk_size=IMPORT_CHUNK_SIZE, tables=IMPORT_TABLES):
+    """Imports every table that has a source file in `folder`; returns {table: rows inserted}."""
+    migrations.upgrade(engine)
+    _import_meta.create_all(bind=engine)
+    counts = {}
+    started = time.perf_counter()
+    for table_name in tables:
+        path = find_source(folder, table_name)
+        if path is None:
+            print(f"- {table_name}: no source file in {folder}, skipping")
+            continue
+        counts[table_name] = import_table(engine, table_name, path, chunk_size)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Imported {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+    return counts
+
+
+def reset(engine):
+    """Drops all data and import checkpoints; returns the schema version."""
+    _import_meta.drop_all(bind=engine)
+    return migrations.reset_schema(engine)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import engine
+    parser = argparse.ArgumentParser(description="Bulk import historical data from CSV / Parquet files")
+    parser.add_argument("--folder", default=IMPORT_DIR, help="directory containing <table>.csv or <table>.parquet files")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="rows per insert transaction")
+    parser.add_argument("--reset", action="store_true", help="drop all tables and checkpoints before importing")
+    parser.add_argument("--tables", nargs="*", default=IMPORT_TABLES, help="subset of tables to import")
+    args = parser.parse_args()
+    if args.reset:
+        print(f"Schema reset (version {reset(engine)})")
+    import_folder(engine, args.folder, args.chunk_size, args.tables)
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+LIVE_FEED_HISTORY = int(os.getenv("TRUSTSHIELD_LIVE_FEED_HISTORY", "2000"))
+# Summary snapshots are pushed at most this often, however fast events arrive
+LIVE_FEED_SUMMARY_INTERVAL = float(os.getenv("TRUSTSHIELD_LIVE_FEED_SUMMARY_INTERVAL", "1.0"))
+
+
+class LiveFeedHub:
+    """
+    Single fan-out point for the live dashboard stream.
+    Producers (engine threads) publish already-serialized messages once;
+    every SSE subscriber reads the same ring buffer, so N open dashboards
+    cost one serialization and no extra database reads.
+    Each message gets a monotonically increasing id that clients send back
+    as Last-Event-ID to resume after a reconnect.
+    """
+    def __init__(self, history=LIVE_FEED_HISTORY, summary_interval=LIVE_FEED_SUMMARY_INTERVAL):
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=history)
+        self._seq = 0
+        self._waiters = set()
+        self._last_summary_at = 0.0
+        self._latest_summary = None
+
+    @property
+    def cursor(self):
+        return self._seq
+
+    @property
+    def latest_summary(self):
+        return self._latest_summary
+
+    def publish(self, kind, payload):
+        data = json.dumps(payload, default=str)
+        with self._lock:
+            self._seq += 1
+            self._buffer.append((self._seq, kind, data))
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def publish_summary(self, produce, force=False):
+        """Publishes a fresh summary if the throttle window has passed; `produce` builds it."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_summary_at < self.summary_interval:
+                return
+            self._last_summary_at = now
+        summary = produce()
+        self._latest_summary = summary
+        self.publish("summary", summary)
+
+    def read_after(self, cursor):
+        """
+        Returns (messages, new_cursor, complete). `complete` is False when the
+        cursor is older than the buffer, i.e. some messages were dropped.
+        """
+        with self._lock:
+            if cursor > self._seq:
+                # Cursor from a previous server run: the client must resync
+                return [], self._seq, False
+            if cursor == self._seq:
+                return [], cursor, True
+            complete = cursor >= self._buffer[0][0] - 1
+            messages = [m for m in self._buffer if m[0] > cursor]
+            return messages, self._seq, complete
+
+    async def wait(self, cursor, timeout):
+        """Waits until a message newer than `cursor` exists or `timeout` passes."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            if self._seq > cursor:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def format_sse(seq, kind, data):
+    lines = [f"event: {kind}", f"data: {data}"]
+    if seq is not None:
+        lines.insert(0, f"id: {seq}")
+    return "\n".join(lines) + "\n\n"
+
+
+# Shared by the engine (publisher) and the /stream endpoint (subscribers)
+live_feed = LiveFeedHub()
@@ -1,14 +1,23 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from . import crud, models, schemas, auth
-from .database import SessionLocal, engine, get_db
+from . import crud, models, schemas, auth, migrations, metrics
+from .database import SessionLocal, engine, async_read_engine, get_db, get_read_db, get_async_read_db
+from .dashboard_stats import dashboard_counters
+from .response_cache import response_cache
+from .live_feed import live_feed, format_sse
 from datetime import timedelta
+import json
 
-# Create tables if they don't exist (though they should)
-models.Base.metadata.create_all(bind=engine)
+# Create missing tables and apply pending schema migrations
+migrations.upgrade(engine)
 
 app = FastAPI(title="Turkcell TrustShield API", version="1.0.0")
 
@@ -19,10 +28,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+# Outermost, so CORS and routing time is included
+app.add_middleware(metrics.MetricsMiddleware)
+
+def _cache_response(namespace: str, key: str, data, extra_headers=None):
+    body = json.dumps(jsonable_encoder(data)).encode("utf-8")
+    return response_cache.set(namespace, key, body, extra_headers(data) if extra_headers else None)
+
+def _cached_reply(request: Request, namespace: str, entry):
+    headers = {"ETag": entry.etag, "Cache-Control": f"private, max-age={int(response_cache.ttl(namespace))}", **entry.headers}
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def cached_json_response(request: Request, namespace: str, produce, extra_headers=None):
+    """
+    Serves a JSON body from the response cache, keyed by the query string.
+    `produce` is only called on a miss. Honors If-None-Match with a 304.
+    `extra_headers(data)` may derive headers (e.g. a next-page cursor) that
+    are cached along with the body.
+    """
+    key = str(request.url.query)
+    entry = response_cache.get(namespace, key)
+    if entry is None:
+        entry = _cache_response(namespace, key, produce(), extra_headers)
+    return _cached_reply(request, namespace, entry)
+
+async def cached_json_response_async(request: Request, namespace: str, produce, extra_headers=None):
+    """cached_json_response for async routes: `produce()` returns an awaitable."""
+    key = str(request.url.query)
+    entry = response_cache.get(namespace, key)
+    if entry is None:
+        entry = _cache_response(namespace, key, await produce(), extra_headers)
+    return _cached_reply(request, namespace, entry)
+
+async def run_on_writer(fn, *args):
+    """
+    Runs `fn(db, *args)` on a writer session in the threadpool and returns its
+    result. Async routes hand their writes over here, so waiting for the single
+    writer never blocks the event loop. The session is closed before the
+    result is returned, so `fn` must return data that does not lazy-load.
+    """
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
+
+def next_cursor_headers(rows, limit, id_attr, timestamp_attr="timestamp"):
+    # Only full pages can have a next page
+    if not rows or len(rows) < limit:
+        return {}
+    last = rows[-1]
+    return {"X-Next-Cursor": crud.make_cursor(getattr(last, timestamp_attr), getattr(last, id_attr))}
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
     user = db.query(models.Account).filter(models.Account.email == form_data.username).first()
     if not user or not auth.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
@@ -37,37 +102,186 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     return {"access_token": access_token, "token_type": "bearer"}
 
 from .engine import RuleEngine
+from . import pipeline
+from .retention import retention_job
+from .profile_store import profile_store
+from .notifications import notification_dispatcher
 
 rule_engine = RuleEngine()
+decision_pipeline = pipeline.DecisionPipeline(rule_engine)
 
-@app.post("/events", response_model=schemas.Event)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
-    # 1. Save Event
+metrics.registry.gauge("trustshield_pipeline_queue_depth", "Events waiting for the decision pipeline.",
+                       lambda: decision_pipeline.depth)
+metrics.registry.gauge("trustshield_notification_queue_depth", "Notifications waiting for the dispatcher.",
+                       notification_dispatcher.depth)
+metrics.registry.gauge("trustshield_notifications_dropped", "Notifications dropped because the queue was full.",
+                       lambda: notification_dispatcher.dropped)
+metrics.registry.gauge("trustshield_profile_pending_writes", "Risk profiles changed in memory but not flushed yet.",
+                       profile_store.pending)
+
+@app.on_event("startup")
+def start_decision_pipeline():
+    decision_pipeline.start()
+    # Events accepted before the last shutdown or crash but never evaluated
+    decision_pipeline.recover()
+    retention_job.start()
+    profile_store.start()
+    notification_dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_decision_pipeline():
+    decision_pipeline.stop()
+    retention_job.stop()
+    # After the pipeline has drained, so its profile updates and messages are included
+    profile_store.stop()
+    notification_dispatcher.stop()
+
+@app.on_event("shutdown")
+async def close_async_read_engine():
+    await async_read_engine.dispose()
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheus text exposition; unauthenticated like other scrape targets, so restrict it at the network edge."""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+# Ingest routes are async: they validate on the event loop and hand the write
+# and rule evaluation to the single sync writer through run_on_writer.
+# Reads that are only queries are async on the read-only async pool and await
+# the crud select_* statements. Admin writes and reads that touch in-process
+# state (profile store, rule registry, dashboard counters) stay sync routes.
+
+def ingest_event(db: Session, event: schemas.EventCreate):
+    # 1. Save Event (serialized now: evaluation commits again and expires it)
     db_event = crud.create_event(db=db, event=event)
-    
+    saved = schemas.Event.model_validate(db_event)
+
     # 2. Evaluate Rules (Synchronous)
     rule_engine.evaluate(db, db_event)
-    
-    return db_event
+
+    return saved
+
+@app.post("/events", response_model=schemas.Event)
+async def create_event(event: schemas.EventCreate):
+    return await run_on_writer(ingest_event, event)
+
+def queue_event(db: Session, event: schemas.EventCreate):
+    # 1. Save Event and its pending marker (durable before acknowledging)
+    try:
+        crud.create_event(db=db, event=event, queue_for_decision=True)
+    except IntegrityError:
+        db.rollback()
+        # A retry of an event still waiting for its decision: it was accepted already
+        if crud.is_event_pending(db, event.event_id):
+            return {"event_id": event.event_id, "status": pipeline.PENDING}
+        raise HTTPException(status_code=409, detail="Event already exists")
+
+    # 2. Hand evaluation to the worker pool
+    if not decision_pipeline.submit(event.event_id):
+        # Not acknowledged, so not kept: the producer's retry starts over
+        if crud.withdraw_pending_event(db, event.event_id):
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Decision queue is full, retry later")
+
+    return {"event_id": event.event_id, "status": pipeline.PENDING}
+
+@app.post("/events/async", response_model=schemas.EventDecisionStatus, status_code=status.HTTP_202_ACCEPTED)
+async def create_event_async(event: schemas.EventCreate):
+    # Check capacity first so a rejected event is not stored without evaluation
+    if decision_pipeline.is_full:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Decision queue is full, retry later")
+    return await run_on_writer(queue_event, event)
+
+@app.get("/events/{event_id}/decision", response_model=schemas.EventDecisionStatus)
+async def read_event_decision(event_id: str, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    decision = (await db.scalars(crud.select_decision_by_event(event_id))).first()
+    if decision:
+        return {"event_id": event_id, "status": pipeline.DECIDED, "decision": decision}
+
+    state = decision_pipeline.status(event_id)
+    if state is None and (await db.execute(crud.select_pending_event(event_id))).first() is not None:
+        # Queued by another worker process, or waiting for recovery
+        state = pipeline.PENDING
+    if state in (pipeline.PENDING, pipeline.FAILED):
+        if state == pipeline.PENDING:
+            response.status_code = status.HTTP_202_ACCEPTED
+        return {"event_id": event_id, "status": state}
+
+    if (await db.scalars(crud.select_event(event_id))).first() is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return {"event_id": event_id, "status": pipeline.NO_DECISION}
+
+# Upper bound on events accepted by a single batch request
+MAX_BATCH_SIZE = 5000
+
+def ingest_batch(db: Session, events: List[schemas.EventCreate]):
+    # 1. Bulk insert + 2. evaluate against one rule snapshot, single commit
+    try:
+        db_events = crud.create_events_bulk(db=db, events=events)
+        decisions = rule_engine.evaluate_batch(db, db_events)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Batch contains duplicate or existing event_id values")
+    dashboard_counters.record_events(db_events)
+
+    summaries = []
+    for db_event, decision in zip(db_events, decisions):
+        summaries.append(schemas.EventDecisionSummary(
+            event_id=db_event.event_id,
+            decision_id=decision.decision_id if decision else None,
+            selected_action=decision.selected_action if decision else None,
+            triggered_rules=decision.triggered_rules if decision else None,
+            rule_set_version=decision.rule_set_version if decision else None,
+        ))
+    return summaries
+
+@app.post("/events/batch", response_model=List[schemas.EventDecisionSummary])
+async def create_events_batch(events: List[schemas.EventCreate]):
+    if len(events) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} events)")
+    return await run_on_writer(ingest_batch, events)
 
 @app.get("/events", response_model=List[schemas.Event])
-def read_events(skip: int = 0, limit: int = 100, start_time: str = None, service: str = None, user_id: str = None, sort_by: str = 'timestamp_desc', db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_events(db, skip=skip, limit=limit, start_time=start_time, service=service, user_id=user_id, sort_by=sort_by)
+async def read_events(response: Response, skip: int = 0, limit: int = 100, start_time: str = None, service: str = None, user_id: str = None, sort_by: str = 'timestamp_desc', after: str = None, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    try:
+        statement = crud.select_events(skip=skip, limit=limit, start_time=start_time, service=service, user_id=user_id, sort_by=sort_by, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    events = (await db.scalars(statement)).all()
+    if sort_by not in ('value_desc', 'value_asc'):
+        response.headers.update(next_cursor_headers(events, limit, "event_id"))
+    return events
 
 @app.get("/users/{user_id}/risk-profile", response_model=schemas.RiskProfile)
-def read_risk_profile(user_id: str, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
+def read_risk_profile(user_id: str, db: Session = Depends(get_read_db), current_user: models.Account = Depends(auth.get_current_user)):
     db_profile = crud.get_risk_profile(db, user_id=user_id)
     if db_profile is None:
         raise HTTPException(status_code=404, detail="Risk profile not found")
     return db_profile
 
 @app.get("/risk-profiles", response_model=List[schemas.RiskProfile])
-def read_risk_profiles(risk_level: str = None, limit: int = 100, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_risk_profiles(db, risk_level=risk_level, limit=limit)
+def read_risk_profiles(request: Request, risk_level: str = None, limit: int = 100, db: Session = Depends(get_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    return cached_json_response(request, "risk-profiles", lambda: [
+        schemas.RiskProfile.model_validate(p) for p in crud.get_risk_profiles(db, risk_level=risk_level, limit=limit)
+    ])
+
+@app.post("/risk-profiles/rescore", response_model=schemas.RescoreResult)
+def rescore_risk_profiles(db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_active_admin)):
+    """Persists decayed scores and levels for every profile in one streaming pass."""
+    return crud.rescore_risk_profiles(db)
 
 @app.get("/risk-rules", response_model=List[schemas.RiskRule])
-def read_risk_rules(db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_risk_rules(db)
+async def read_risk_rules(request: Request, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    async def produce():
+        return [schemas.RiskRule.model_validate(r) for r in (await db.scalars(crud.select_risk_rules())).all()]
+    return await cached_json_response_async(request, "risk-rules", produce)
+
+@app.get("/risk-rules/stats", response_model=List[schemas.RuleStats])
+def read_risk_rule_stats(sort_by: str = "total_time", limit: int = 100, db: Session = Depends(get_read_db), current_user: models.Account = Depends(auth.get_current_active_admin)):
+    """Per-rule evaluation cost since start-up (or since the rule's condition last changed)."""
+    try:
+        return crud.get_rule_stats(db, sort_by=sort_by, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/risk-rules", response_model=schemas.RiskRule)
 def create_risk_rule(rule: schemas.RiskRuleCreate, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_active_admin)):
@@ -88,13 +302,78 @@ def delete_risk_rule(rule_id: str, db: Session = Depends(get_db), current_user:
     return db_rule
 
 @app.get("/fraud-cases", response_model=List[schemas.FraudCase])
-def read_fraud_cases(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_fraud_cases(db, skip=skip, limit=limit)
+async def read_fraud_cases(response: Response, skip: int = 0, limit: int = 100, status: str = None, priority: str = None, user_id: str = None, after: str = None, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    try:
+        statement = crud.select_fraud_cases(skip=skip, limit=limit, status=status, priority=priority, user_id=user_id, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cases = (await db.scalars(statement)).all()
+    response.headers.update(next_cursor_headers(cases, limit, "case_id", "opened_at"))
+    return cases
+
+@app.post("/fraud-cases/status", response_model=schemas.BulkCaseUpdateResult)
+def bulk_update_fraud_case_status(update: schemas.FraudCaseBulkStatusUpdate, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
+    """Sets the status of the listed cases, or of every case matching the filters, in one transaction."""
+    try:
+        return crud.bulk_update_case_status(db, update, actor=current_user.email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/fraud-cases/{case_id}/actions", response_model=List[schemas.CaseAction])
+async def read_case_actions(case_id: str, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    return (await db.scalars(crud.select_case_actions(case_id))).all()
+
+@app.get("/notifications", response_model=List[schemas.BipNotification])
+async def read_notifications(user_id: str = None, status: str = None, limit: int = 100, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    return (await db.scalars(crud.select_notifications(user_id=user_id, status=status, limit=limit))).all()
 
 @app.get("/decisions", response_model=List[schemas.Decision])
-def read_decisions(skip: int = 0, limit: int = 100, action: str = None, user_id: str = None, db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_decisions(db, skip=skip, limit=limit, action=action, user_id=user_id)
+async def read_decisions(request: Request, skip: int = 0, limit: int = 100, action: str = None, user_id: str = None, after: str = None, db: AsyncSession = Depends(get_async_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    try:
+        statement = crud.select_decisions(skip=skip, limit=limit, action=action, user_id=user_id, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    async def produce():
+        return [schemas.Decision.model_validate(d) for d in (await db.scalars(statement)).all()]
+    return await cached_json_response_async(
+        request, "decisions", produce,
+        extra_headers=lambda rows: next_cursor_headers(rows, limit, "decision_id"),
+    )
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+@app.get("/stream")
+async def stream_live_feed(request: Request, cursor: int = None, current_user: models.Account = Depends(auth.get_current_user_for_stream)):
+    """
+    Server-Sent Events feed of new events, decisions and dashboard summaries.
+    Reconnecting clients resume from Last-Event-ID (or ?cursor=); if the
+    cursor fell out of the buffer a `reset` event tells them to refetch.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if cursor is None and last_event_id and last_event_id.isdigit():
+        cursor = int(last_event_id)
+
+    async def event_stream():
+        position = cursor
+        if position is None:
+            # Fresh subscriber: start at the head with the latest snapshot
+            position = live_feed.cursor
+            if live_feed.latest_summary is not None:
+                yield format_sse(None, "summary", json.dumps(live_feed.latest_summary, default=str))
+
+        while not await request.is_disconnected():
+            messages, new_position, complete = live_feed.read_after(position)
+            if not complete:
+                yield format_sse(None, "reset", json.dumps({"cursor": new_position}))
+            for seq, kind, data in messages:
+                yield format_sse(seq, kind, data)
+            position = new_position
+            if not await live_feed.wait(position, STREAM_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/dashboard/summary", response_model=schemas.DashboardSummary)
-def read_dashboard_summary(db: Session = Depends(get_db), current_user: models.Account = Depends(auth.get_current_user)):
-    return crud.get_dashboard_summary(db)
+def read_dashboard_summary(request: Request, db: Session = Depends(get_read_db), current_user: models.Account = Depends(auth.get_current_user)):
+    return cached_json_response(request, "dashboard", lambda: schemas.DashboardSummary(**crud.get_dashboard_summary(db)))
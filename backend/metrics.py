@@ -0,0 +1,318 @@
+"""
+In-process metrics exposed in the Prometheus text format at GET /metrics.
+
+Counters and histograms keep fixed-size slots per label set. Hot paths resolve
+their label children once (see `labels`) and then only increment, so
+recording an observation allocates nothing. Gauges are read from callbacks at
+scrape time (queue depths, cache sizes).
+"""
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; tuned for sub-millisecond rule checks up to multi-second requests
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1) # Last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value, count=1):
+        """Records `count` observations of `value` (e.g. the mean of a vectorized batch)."""
+        slot = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[slot] += count
+            self._sum += value * count
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The child for one label set; resolve once and keep it on hot paths."""
+        # Stored under the rendered label values, so 1 and "1" share a child
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        # Exposed with the conventional _total suffix
+        super().__init__(name + "_total", documentation, labelnames)
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._items():
+            yield f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(float(bound)) + '"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+            labels = _label_text(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose value is read from `read()` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def _samples(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Metric {self.name} unavailable: {e}")
+            return
+        yield f"{self.name} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-registering (e.g. a module reload) keeps the original series
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read):
+        gauge = self.register(CallbackGauge(name, documentation, read))
+        gauge.read = read
+        return gauge
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "trustshield_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_requests = registry.counter(
+    "trustshield_http_requests", "HTTP requests by route template and status code.", ("method", "route", "status"))
+engine_stage_seconds = registry.histogram(
+    "trustshield_engine_stage_duration_seconds",
+    "Rule engine time per stage (context, rules, side_effects, commit, publish).", ("stage",))
+rule_eval_seconds = registry.histogram(
+    "trustshield_rule_evaluation_duration_seconds", "Time to evaluate one rule condition against one event.", ("rule_id",))
+rule_hits = registry.counter(
+    "trustshield_rule_hits", "Events for which a rule condition was true.", ("rule_id",))
+rule_errors = registry.counter(
+    "trustshield_rule_errors", "Rule conditions that raised while being evaluated.", ("rule_id",))
+decisions = registry.counter(
+    "trustshield_decisions", "Decisions recorded by selected action.", ("action",))
+pipeline_events = registry.counter(
+    "trustshield_pipeline_events", "Events processed by the decision pipeline by outcome.", ("status",))
+
+
+class RuleMetrics:
+    """
+    Profile of one rule: pre-resolved metric children plus the worst-case
+    evaluation time and last error, shared by every compiled copy of the rule.
+    """
+    __slots__ = ("rule_id", "seconds", "hits", "errors", "max_seconds", "last_error")
+
+    def __init__(self, rule_id):
+        self.rule_id = rule_id
+        self.seconds = rule_eval_seconds.labels(rule_id)
+        self.hits = rule_hits.labels(rule_id)
+        self.errors = rule_errors.labels(rule_id)
+        self.max_seconds = 0.0
+        self.last_error = None
+
+    def observe(self, elapsed, count=1):
+        """`elapsed` is the time of one evaluation (the mean one for `count` > 1)."""
+        self.seconds.observe(elapsed, count)
+        # Unlocked: a concurrent larger value may rarely be lost, which is fine for a profile
+        if elapsed > self.max_seconds:
+            self.max_seconds = elapsed
+
+    def failed(self, elapsed, error):
+        """Records a raising evaluation; returns True if the error differs from the last one."""
+        self.observe(elapsed)
+        self.errors.inc()
+        message = f"{type(error).__name__}: {error}"
+        changed = message != self.last_error
+        self.last_error = message
+        return changed
+
+    def stats(self):
+        counts, total_seconds = self.seconds.snapshot()
+        evaluations = sum(counts)
+        return {
+            "rule_id": self.rule_id,
+            "evaluations": evaluations,
+            "matches": self.hits.value,
+            "errors": self.errors.value,
+            "total_seconds": total_seconds,
+            "mean_seconds": total_seconds / evaluations if evaluations else 0.0,
+            "max_seconds": self.max_seconds,
+            "last_error": self.last_error,
+        }
+
+
+_rule_metrics = {}
+_rule_metrics_lock = threading.Lock()
+
+
+def rule_metrics(rule_id):
+    """The profile of `rule_id`, kept across rule set rebuilds."""
+    profile = _rule_metrics.get(rule_id)
+    if profile is None:
+        with _rule_metrics_lock:
+            profile = _rule_metrics.setdefault(rule_id, RuleMetrics(rule_id))
+    return profile
+
+
+def forget_rule(rule_id):
+    """Drops a rule's profile and series, e.g. after its condition changed or it was deleted."""
+    with _rule_metrics_lock:
+        _rule_metrics.pop(rule_id, None)
+    for metric in (rule_eval_seconds, rule_hits, rule_errors):
+        metric.remove(rule_id)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and status per route template, so
+    /users/U1/risk-profile and /users/U2/risk-profile share one series.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_seconds.labels(method, path).observe(time.perf_counter() - started)
+            http_requests.labels(method, path, str(status_code[0])).inc()
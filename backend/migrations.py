@@ -0,0 +1,216 @@
+"""
+Versioned schema migrations.
+
+`models.py` is the single source of the schema. `upgrade()` creates any
+missing tables, then applies the numbered migrations below that are not yet
+recorded in `schema_migrations`. Every migration is idempotent, so databases
+created by older builds (ad hoc create_all, create_db.py DDL) converge on the
+same schema. Run directly to upgrade the configured database:
+
+    python -m backend.migrations
+"""
+import datetime
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, inspect, text
+
+from . import models
+from .context_builder import normalize_service
+from .enums import ACTION_CODES, RISK_LEVEL_CODES, CASE_STATUS_CODES, CASE_PRIORITY_CODES
+from .timestamps import DAY_MS, to_epoch_ms
+
+_migration_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _migration_meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", String),
+)
+
+# (table, column, codes) recoded from free-form strings to integer codes
+ENUM_COLUMNS = [
+    ("risk_rules", "action", ACTION_CODES),
+    ("risk_profiles", "risk_level", RISK_LEVEL_CODES),
+    ("fraud_cases", "triggering_action", ACTION_CODES),
+    ("fraud_cases", "status", CASE_STATUS_CODES),
+    ("fraud_cases", "priority", CASE_PRIORITY_CODES),
+    ("decisions", "selected_action", ACTION_CODES),
+]
+
+
+def _add_missing_columns(conn):
+    """Adds model columns missing from tables created by older builds."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+
+def _create_indexes(conn):
+    # create_all skips indexes of tables that already exist
+    for table in models.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _add_columns_and_indexes(conn):
+    _add_missing_columns(conn)
+    _create_indexes(conn)
+
+
+def _canonicalize_services(conn):
+    """Rewrites legacy service spellings ('paycell', 'TV') to the canonical names."""
+    rows = conn.execute(text("SELECT DISTINCT service FROM events WHERE service IS NOT NULL")).fetchall()
+    for (raw,) in rows:
+        canonical = normalize_service(raw)
+        if canonical != raw:
+            conn.execute(text("UPDATE events SET service = :canonical WHERE service = :raw"),
+                         {"canonical": canonical, "raw": raw})
+
+
+def _case_expression(column, codes, fallback):
+    whens = " ".join(f"WHEN '{name}' THEN {code}" for name, code in codes.items())
+    return f"CASE UPPER({column}) {whens} ELSE {fallback} END"
+
+
+def _recode_enums(conn):
+    """Converts string actions / levels / statuses / priorities to integer codes."""
+    inspector = inspect(conn)
+    for table, column, codes in ENUM_COLUMNS:
+        if conn.dialect.name == "sqlite":
+            # SQLite cannot alter column types; integer values are stored as-is
+            # in the old TEXT columns and mapped back by the enum types
+            conn.execute(text(
+                f"UPDATE {table} SET {column} = {_case_expression(column, codes, column)} "
+                f"WHERE typeof({column}) = 'text'"
+            ))
+            continue
+        col_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == column)
+        if col_type.python_type is int:
+            continue
+        conn.execute(text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE INTEGER "
+            f"USING {_case_expression(column, codes, codes['UNKNOWN'])}"
+        ))
+
+
+# (table, column, primary key) converted from ISO strings to epoch milliseconds
+TIMESTAMP_COLUMNS = [
+    ("events", "timestamp", "event_id"),
+    ("decisions", "timestamp", "decision_id"),
+    ("fraud_cases", "opened_at", "case_id"),
+    ("traceability_logs", "created_at", "trace_id"),
+    ("traceability_logs", "timestamp", "trace_id"),
+    ("bip_notifications", "sent_at", "notification_id"),
+    ("case_actions", "timestamp", "action_id"),
+]
+
+
+def _parse_epoch_ms(value):
+    try:
+        return to_epoch_ms(value)
+    except ValueError:
+        return None # Unparseable legacy value: kept as NULL rather than guessed
+
+
+def _convert_timestamps(conn):
+    """
+    Rebuilds string time columns as BIGINT epoch milliseconds and fills the
+    events.event_day partition key. Naive legacy strings are read as local time.
+    """
+    inspector = inspect(conn)
+    for table, column, pk in TIMESTAMP_COLUMNS:
+        col_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == column)
+        if col_type.python_type is int:
+            continue
+        # Indexes on the old column block DROP COLUMN; _create_indexes restores them
+        for index in inspector.get_indexes(table):
+            if column in index["column_names"]:
+                conn.execute(text(f"DROP INDEX {index['name']}"))
+        staging = f"{column}__epoch_ms"
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {staging} BIGINT"))
+        rows = conn.execute(text(f"SELECT {pk}, {column} FROM {table} WHERE {column} IS NOT NULL")).fetchall()
+        if rows:
+            conn.execute(
+                text(f"UPDATE {table} SET {staging} = :epoch_ms WHERE {pk} = :pk"),
+                [{"epoch_ms": _parse_epoch_ms(value), "pk": key} for key, value in rows],
+            )
+        conn.execute(text(f'ALTER TABLE {table} DROP COLUMN "{column}"'))
+        conn.execute(text(f'ALTER TABLE {table} RENAME COLUMN {staging} TO "{column}"'))
+
+    _add_missing_columns(conn)
+    conn.execute(text(f"UPDATE events SET event_day = timestamp / {DAY_MS} WHERE event_day IS NULL AND timestamp IS NOT NULL"))
+    _create_indexes(conn)
+
+
+def _seed_rule_set_state(conn):
+    # create_all has created the table; the row itself is also inserted on the first rule change
+    exists = conn.execute(text("SELECT 1 FROM rule_set_state WHERE id = 1")).first()
+    if exists is None:
+        conn.execute(text("INSERT INTO rule_set_state (id, version) VALUES (1, 0)"))
+
+
+# Append only: never renumber or edit an applied migration
+MIGRATIONS = [
+    (1, "Add columns missing from pre-model databases", _add_missing_columns),
+    (2, "Create model indexes", _create_indexes),
+    (3, "Canonicalize events.service", _canonicalize_services),
+    (4, "Store actions, risk levels and case states as integer codes", _recode_enums),
+    (5, "Store timestamps as epoch milliseconds and add the event day partition", _convert_timestamps),
+    (6, "Add per-signal decaying risk score columns", _add_missing_columns),
+    (7, "Track notification delivery status", _add_columns_and_indexes),
+    (8, "Index fraud case filters and link case actions to events", _add_columns_and_indexes),
+    (9, "Add the shared rule set version", _seed_rule_set_state),
+    (10, "Track events waiting for the decision pipeline", _create_indexes),
+]
+
+
+def current_version(engine):
+    _migration_meta.create_all(bind=engine)
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar()
+    return version or 0
+
+
+def upgrade(engine):
+    """Brings the database up to the latest schema version. Safe to call on every start."""
+    fresh = not set(inspect(engine).get_table_names()) & set(models.Base.metadata.tables)
+    models.Base.metadata.create_all(bind=engine)
+    applied = current_version(engine)
+    if fresh and not applied:
+        # create_all already built the latest schema: record it without replaying
+        with engine.begin() as conn:
+            conn.execute(schema_migrations.insert(), [
+                {"version": version, "description": description, "applied_at": datetime.datetime.now().isoformat()}
+                for version, description, _ in MIGRATIONS
+            ])
+        return MIGRATIONS[-1][0]
+    for version, description, migrate in MIGRATIONS:
+        if version <= applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description,
+                applied_at=datetime.datetime.now().isoformat(),
+            ))
+        print(f"Applied migration {version}: {description}")
+    return MIGRATIONS[-1][0]
+
+
+def reset_schema(engine):
+    """Drops and recreates every table at the latest version (used by create_db.py)."""
+    models.Base.metadata.drop_all(bind=engine)
+    _migration_meta.drop_all(bind=engine)
+    return upgrade(engine)
+
+
+if __name__ == "__main__":
+    from .database import engine
+    print(f"Schema version: {upgrade(engine)}")
@@ -1,6 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .database import Base
+from .enums import ActionType, RiskLevelType, CaseStatusType, CasePriorityType, NotificationStatusType
+from .timestamps import EpochTimestamp, epoch_day, to_epoch_ms
+
+
+def _event_day(context):
+    # Partition key derived from the event timestamp on every insert path
+    return epoch_day(to_epoch_ms(context.get_current_parameters().get("timestamp")))
 
 class User(Base):
     __tablename__ = "users"
@@ -11,6 +18,14 @@ class User(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # Keyset pagination: (timestamp, event_id) is the listing sort key
+        Index("ix_events_timestamp_id", "timestamp", "event_id"),
+        Index("ix_events_user_timestamp", "user_id", "timestamp"),
+        Index("ix_events_service_timestamp", "service", "timestamp"),
+        # Day partitions: retention drops whole days through this index
+        Index("ix_events_day", "event_day"),
+    )
     event_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.user_id"))
     service = Column(String)
@@ -18,13 +33,14 @@ class Event(Base):
     value = Column(Float)
     unit = Column(String)
     meta = Column(String)
-    timestamp = Column(String)
+    timestamp = Column(EpochTimestamp)
+    event_day = Column(Integer, default=_event_day)
 
 class RiskRule(Base):
     __tablename__ = "risk_rules"
     rule_id = Column(String, primary_key=True, index=True)
     condition = Column(String)
-    action = Column(String)
+    action = Column(ActionType)
     priority = Column(Integer)
     is_active = Column(Integer) # SQLite stores boolean as Integer
     signal = Column(String, default="Generic Risk") # Added
@@ -34,32 +50,48 @@ class RiskProfile(Base):
     __tablename__ = "risk_profiles"
     user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
     risk_score = Column(Integer)
-    risk_level = Column(String)
+    risk_level = Column(RiskLevelType)
     signals = Column(String)
+    signal_scores = Column(String) # JSON {signal: score} decayed from updated_at
+    updated_at = Column(EpochTimestamp)
 
 class FraudCase(Base):
     __tablename__ = "fraud_cases"
+    __table_args__ = (
+        # Case queue listings: filter by status / priority / user, newest first
+        Index("ix_fraud_cases_opened_id", "opened_at", "case_id"),
+        Index("ix_fraud_cases_status_opened", "status", "opened_at"),
+        Index("ix_fraud_cases_priority_opened", "priority", "opened_at"),
+        Index("ix_fraud_cases_user_status", "user_id", "status"),
+    )
     case_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.user_id"))
     event_id = Column(String, ForeignKey("events.event_id")) # Added
     opened_by = Column(String)
     case_type = Column(String)
-    triggering_action = Column(String)
+    triggering_action = Column(ActionType)
     notification_log = Column(String) # Added
-    status = Column(String)
-    opened_at = Column(String)
-    priority = Column(String)
+    status = Column(CaseStatusType)
+    opened_at = Column(EpochTimestamp)
+    priority = Column(CasePriorityType)
 
 class Decision(Base):
     __tablename__ = "decisions"
+    __table_args__ = (
+        Index("ix_decisions_timestamp_id", "timestamp", "decision_id"),
+        Index("ix_decisions_action_timestamp", "selected_action", "timestamp"),
+        Index("ix_decisions_user_timestamp", "user_id", "timestamp"),
+        Index("ix_decisions_event_id", "event_id"),
+    )
     decision_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.user_id"))
     event_id = Column(String, ForeignKey("events.event_id")) # Added
     triggered_rules = Column(String)
     signals = Column(String) # Added: To store human-readable signals
-    selected_action = Column(String)
+    selected_action = Column(ActionType)
     suppressed_actions = Column(String) # For auditing/debugging
-    timestamp = Column(String)
+    rule_set_version = Column(Integer, nullable=True) # Compiled rule set that produced the decision
+    timestamp = Column(EpochTimestamp)
 
 class TraceabilityLog(Base): # Fixed inheritance
     __tablename__ = "traceability_logs"
@@ -67,9 +99,9 @@ class TraceabilityLog(Base): # Fixed inheritance
     event_id = Column(String, index=True)
     decision_id = Column(String)
     case_id = Column(String, nullable=True) # Can be null if no case opened
-    created_at = Column(String)
+    created_at = Column(EpochTimestamp)
     suppressed_actions = Column(String)
-    timestamp = Column(String)
+    timestamp = Column(EpochTimestamp)
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -81,17 +113,39 @@ class Account(Base):
 
 class BipNotification(Base):
     __tablename__ = "bip_notifications"
+    __table_args__ = (
+        Index("ix_bip_notifications_user_sent", "user_id", "sent_at"),
+    )
     notification_id = Column(String, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.user_id"))
     channel = Column(String)
     message = Column(String)
-    sent_at = Column(String)
+    sent_at = Column(EpochTimestamp)
+    action = Column(ActionType)
+    status = Column(NotificationStatusType) # Delivery outcome, NULL for imported rows
+    attempts = Column(Integer)
+    coalesced = Column(Integer) # Notifications merged into this message
 
 class CaseAction(Base):
     __tablename__ = "case_actions"
+    __table_args__ = (
+        Index("ix_case_actions_case_timestamp", "case_id", "timestamp"),
+    )
     action_id = Column(String, primary_key=True, index=True)
     case_id = Column(String, ForeignKey("fraud_cases.case_id"))
+    event_id = Column(String, ForeignKey("events.event_id"), nullable=True) # Event attached to an open case
     action_type = Column(String)
     actor = Column(String)
     note = Column(String)
-    timestamp = Column(String)
+    timestamp = Column(EpochTimestamp)
+
+class PendingEvent(Base):
+    __tablename__ = "pending_events"
+    # Accepted by /events/async and not evaluated yet; claimed (deleted) by the pipeline
+    event_id = Column(String, ForeignKey("events.event_id"), primary_key=True)
+    queued_at = Column(EpochTimestamp)
+
+class RuleSetState(Base):
+    __tablename__ = "rule_set_state"
+    id = Column(Integer, primary_key=True) # Single row (id 1)
+    version = Column(Integer) # Bumped with every rule change, polled by each API worker
@@ -0,0 +1,330 @@
+"""
+Outbound user notifications, delivered off the request path.
+
+The engine only enqueues. A background worker groups a user's notifications
+into a coalescing window, keeps the most severe action per window, drops
+actions already delivered to the user within the dedup window, enforces a
+per-user hourly cap, delivers through a pluggable channel and records one
+`bip_notifications` row per outcome (SENT, FAILED, DUPLICATE, RATE_LIMITED).
+
+With several API worker processes (TRUSTSHIELD_WORKERS > 1) the dedup and
+rate history is read from `bip_notifications` instead of this process, so
+the cap holds per user across workers. Coalescing windows stay per worker:
+notifications for one user ingested by two workers within a window make two
+candidate messages, of which dedup and the cap still let through at most
+what a single process would. Dedup across workers is by the delivered
+action only, not by the less severe actions merged into it.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from sqlalchemy import BigInteger, type_coerce
+
+from . import models
+from .database import WORKERS, SessionLocal
+from .timestamps import now_ms
+
+NOTIFY_QUEUE_SIZE = int(os.getenv("TRUSTSHIELD_NOTIFY_QUEUE_SIZE", "10000"))
+# A user's notifications within this window are merged into one message
+NOTIFY_COALESCE_SECONDS = float(os.getenv("TRUSTSHIELD_NOTIFY_COALESCE_SECONDS", "30"))
+# The same action is not re-sent to a user within this window
+NOTIFY_DEDUP_SECONDS = float(os.getenv("TRUSTSHIELD_NOTIFY_DEDUP_SECONDS", "300"))
+NOTIFY_MAX_PER_HOUR = int(os.getenv("TRUSTSHIELD_NOTIFY_MAX_PER_HOUR", "5"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("TRUSTSHIELD_NOTIFY_MAX_ATTEMPTS", "3"))
+NOTIFY_CHANNEL = os.getenv("TRUSTSHIELD_NOTIFY_CHANNEL", "BiP")
+# Dedup and rate history from bip_notifications, shared by worker processes
+NOTIFY_SHARED_HISTORY = os.getenv("TRUSTSHIELD_NOTIFY_SHARED_HISTORY", "1" if WORKERS > 1 else "0") == "1"
+
+RATE_WINDOW_SECONDS = 3600
+PRUNE_INTERVAL_SECONDS = 60
+# Worker wake-up period: how late a window may close past its deadline
+TICK_SECONDS = 0.5
+
+
+class Channel:
+    """Delivery backend. `send` raises on failure; the dispatcher retries."""
+    name = None
+
+    def send(self, user_id, message):
+        raise NotImplementedError
+
+
+class MockBipChannel(Channel):
+    name = "BiP"
+
+    def send(self, user_id, message):
+        print(f"[BiP MOCK SEND] To: {user_id} | Msg: {message}")
+
+
+class MemorySink(Channel):
+    """Collects messages in memory; for tests and benchmarks."""
+    name = "memory"
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, user_id, message):
+        self.sent.append((user_id, message))
+
+
+class _Window:
+    __slots__ = ("opened_at", "actions", "submitted")
+
+    def __init__(self, opened_at):
+        self.opened_at = opened_at
+        self.actions = {} # action -> (priority, message)
+        self.submitted = 0
+
+
+class NotificationDispatcher:
+    def __init__(self, channel=None, coalesce_seconds=NOTIFY_COALESCE_SECONDS, dedup_seconds=NOTIFY_DEDUP_SECONDS,
+                 max_per_hour=NOTIFY_MAX_PER_HOUR, max_attempts=NOTIFY_MAX_ATTEMPTS, queue_size=NOTIFY_QUEUE_SIZE,
+                 shared_history=NOTIFY_SHARED_HISTORY):
+        self.channels = {c.name: c for c in (MockBipChannel(), MemorySink())}
+        self.channel = channel or self.channels.get(NOTIFY_CHANNEL) or self.channels["BiP"]
+        self.coalesce_seconds = coalesce_seconds
+        self.dedup_seconds = dedup_seconds
+        self.max_per_hour = max_per_hour
+        self.max_attempts = max_attempts
+        self.shared_history = shared_history
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        # Worker-owned state
+        self._windows = {} # user_id -> _Window
+        self._last_sent = {} # (user_id, action) -> monotonic time
+        self._sent_times = {} # user_id -> deque of monotonic send times
+        self._pruned_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def register_channel(self, channel, use=False):
+        self.channels[channel.name] = channel
+        if use:
+            self.channel = channel
+
+    def submit(self, user_id, action, message, priority=0):
+        """Queues a notification; returns False if the queue is full and it was dropped."""
+        self.start()
+        try:
+            self._queue.put_nowait((user_id, action, message, priority))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"Notification queue full, dropped {action} for {user_id}")
+            return False
+
+    def depth(self):
+        return self._queue.qsize()
+
+    # --- Worker ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Stops the worker after delivering everything queued or still coalescing."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            self._drain_queue(block=not stopping)
+            now = time.monotonic()
+            due = [
+                user_id for user_id, window in self._windows.items()
+                if stopping or now - window.opened_at >= self.coalesce_seconds
+            ]
+            if due:
+                self._deliver([(user_id, self._windows.pop(user_id)) for user_id in due], now)
+            if stopping and self._queue.empty() and not self._windows:
+                return
+
+    def _drain_queue(self, block):
+        try:
+            item = self._queue.get(timeout=TICK_SECONDS) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return
+        now = time.monotonic()
+        while item is not None:
+            user_id, action, message, priority = item
+            window = self._windows.get(user_id)
+            if window is None:
+                window = self._windows[user_id] = _Window(now)
+            window.submitted += 1
+            # Dedup by action within the window
+            window.actions.setdefault(action, (priority, message))
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                item = None
+
+    def _deliver(self, windows, now):
+        if self.shared_history:
+            self._deliver_shared(windows)
+            return
+        rows = []
+        timestamp = now_ms()
+        for user_id, window in windows:
+            fresh = {
+                action: value for action, value in window.actions.items()
+                if now - self._last_sent.get((user_id, action), float("-inf")) >= self.dedup_seconds
+            }
+            if not fresh:
+                action, (_, message) = max(window.actions.items(), key=lambda kv: kv[1][0])
+                rows.append(self._row(user_id, action, message, "DUPLICATE", 0, window.submitted, timestamp))
+                continue
+            # One message per window: the most severe action wins
+            action, (_, message) = max(fresh.items(), key=lambda kv: kv[1][0])
+            sent_times = self._sent_times.setdefault(user_id, deque())
+            while sent_times and now - sent_times[0] >= RATE_WINDOW_SECONDS:
+                sent_times.popleft()
+            if len(sent_times) >= self.max_per_hour:
+                rows.append(self._row(user_id, action, message, "RATE_LIMITED", 0, window.submitted, timestamp))
+                continue
+            status, attempts = self._send(user_id, message)
+            if status == "SENT":
+                sent_times.append(now)
+                for sent_action in fresh:
+                    self._last_sent[(user_id, sent_action)] = now
+            rows.append(self._row(user_id, action, message, status, attempts, window.submitted, timestamp))
+        self._prune(now)
+        self._record(rows)
+
+    def _deliver_shared(self, windows):
+        """
+        `_deliver` against the history in bip_notifications. A send is reserved
+        as a SENT row in the transaction that read the history, with the users'
+        rows locked, and marked FAILED afterwards if delivery fails.
+        """
+        timestamp = now_ms()
+        user_ids = [user_id for user_id, _ in windows]
+        rows, sends = [], []
+        db = SessionLocal()
+        try:
+            users = models.User.__table__
+            # A no-op write locks the users (the whole database on SQLite) so
+            # workers delivering to the same user take turns
+            db.execute(users.update().where(users.c.user_id.in_(user_ids)).values(user_id=users.c.user_id))
+            last_sent, sent_counts = self._sent_history(db, user_ids, timestamp)
+            for user_id, window in windows:
+                fresh = {
+                    action: value for action, value in window.actions.items()
+                    if timestamp - last_sent.get((user_id, action.upper()), float("-inf")) >= self.dedup_seconds * 1000
+                }
+                if not fresh:
+                    action, (_, message) = max(window.actions.items(), key=lambda kv: kv[1][0])
+                    rows.append(self._row(user_id, action, message, "DUPLICATE", 0, window.submitted, timestamp))
+                    continue
+                action, (_, message) = max(fresh.items(), key=lambda kv: kv[1][0])
+                if sent_counts.get(user_id, 0) >= self.max_per_hour:
+                    rows.append(self._row(user_id, action, message, "RATE_LIMITED", 0, window.submitted, timestamp))
+                    continue
+                row = self._row(user_id, action, message, "SENT", 0, window.submitted, timestamp)
+                rows.append(row)
+                sends.append(row)
+            db.bulk_insert_mappings(models.BipNotification, rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            db.close()
+            print(f"Failed to record {len(rows)} notifications: {e}")
+            return
+
+        outcomes = []
+        for row in sends:
+            status, attempts = self._send(row["user_id"], row["message"])
+            outcomes.append({"notification_id": row["notification_id"], "status": status, "attempts": attempts})
+        try:
+            db.bulk_update_mappings(models.BipNotification, outcomes)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Failed to record the outcome of {len(outcomes)} notifications: {e}")
+        finally:
+            db.close()
+
+    def _sent_history(self, db, user_ids, timestamp):
+        """Last SENT time per (user, action) and SENT count in the rate window, per user."""
+        notifications = models.BipNotification
+        sent_at = type_coerce(notifications.sent_at, BigInteger)
+        horizon = timestamp - int(max(self.dedup_seconds, RATE_WINDOW_SECONDS) * 1000)
+        history = (
+            db.query(notifications.user_id, notifications.action, sent_at)
+            .filter(notifications.user_id.in_(user_ids), notifications.status == "SENT", sent_at > horizon)
+            .all()
+        )
+        # Keyed by stored action names, which are upper case
+        last_sent, sent_counts = {}, {}
+        for user_id, action, sent_ms in history:
+            key = (user_id, action)
+            last_sent[key] = max(last_sent.get(key, sent_ms), sent_ms)
+            if timestamp - sent_ms < RATE_WINDOW_SECONDS * 1000:
+                sent_counts[user_id] = sent_counts.get(user_id, 0) + 1
+        return last_sent, sent_counts
+
+    def _send(self, user_id, message):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.channel.send(user_id, message)
+                return "SENT", attempt
+            except Exception as e:
+                print(f"Notification to {user_id} via {self.channel.name} failed (attempt {attempt}): {e}")
+        return "FAILED", self.max_attempts
+
+    def _row(self, user_id, action, message, status, attempts, coalesced, timestamp):
+        return {
+            "notification_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "channel": self.channel.name,
+            "message": message,
+            "sent_at": timestamp,
+            "action": action,
+            "status": status,
+            "attempts": attempts,
+            "coalesced": coalesced,
+        }
+
+    def _record(self, rows):
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(models.BipNotification, rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Failed to record {len(rows)} notifications: {e}")
+        finally:
+            db.close()
+
+    def _prune(self, now):
+        # Keeps per-user history bounded to the dedup and rate windows
+        if now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = now
+        horizon = max(self.dedup_seconds, RATE_WINDOW_SECONDS)
+        for key in [k for k, t in self._last_sent.items() if now - t >= horizon]:
+            del self._last_sent[key]
+        for user_id in [u for u, times in self._sent_times.items() if not times or now - times[-1] >= RATE_WINDOW_SECONDS]:
+            del self._sent_times[user_id]
+
+
+# Shared by the engine (producer) and the API lifecycle hooks
+notification_dispatcher = NotificationDispatcher()
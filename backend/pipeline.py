@@ -0,0 +1,155 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+from . import metrics, models
+from .database import SessionLocal
+
+# Status values reported by GET /events/{event_id}/decision
+PENDING = "PENDING"
+DECIDED = "DECIDED"
+NO_DECISION = "NO_DECISION"
+FAILED = "FAILED"
+
+PIPELINE_WORKERS = int(os.getenv("TRUSTSHIELD_PIPELINE_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("TRUSTSHIELD_PIPELINE_QUEUE_SIZE", "1000"))
+# How many finished event ids we remember for status polling
+PIPELINE_STATUS_HISTORY = int(os.getenv("TRUSTSHIELD_PIPELINE_STATUS_HISTORY", "10000"))
+
+
+class DecisionPipeline:
+    """
+    In-process worker pool that runs RuleEngine.evaluate for events that
+    were already committed by the ingest endpoint.
+    The queue is bounded: submit() returns False instead of blocking when
+    it is full, so the API can answer 429 and let the producer back off.
+    Every queued event has a `pending_events` row, committed with it; a
+    worker claims the event by deleting that row in the transaction of its
+    decision, and recover() re-queues the rows left by a shutdown or crash.
+    """
+    def __init__(self, engine, workers=PIPELINE_WORKERS, max_queue=PIPELINE_QUEUE_SIZE,
+                 session_factory=SessionLocal, history=PIPELINE_STATUS_HISTORY):
+        self.engine = engine
+        self.workers = workers
+        self.session_factory = session_factory
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._status = OrderedDict()
+        self._outcomes = {s: metrics.pipeline_events.labels(s) for s in (DECIDED, NO_DECISION, FAILED)}
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def is_full(self):
+        return self._queue.full()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"decision-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        # One sentinel per worker; queued events ahead of them are still processed
+        for _ in threads:
+            self._queue.put(None)
+        for t in threads:
+            t.join(timeout)
+
+    def submit(self, event_id):
+        if not self._threads:
+            self.start()
+        # Mark as pending first so a fast worker cannot be overwritten by it
+        self._set_status(event_id, PENDING)
+        try:
+            self._queue.put_nowait(event_id)
+        except queue.Full:
+            with self._lock:
+                self._status.pop(event_id, None)
+            return False
+        return True
+
+    def recover(self):
+        """
+        Re-queues events that were accepted but never evaluated. Runs in the
+        background and waits for queue space, so a large backlog neither
+        blocks startup nor gets dropped.
+        """
+        if not self._threads:
+            self.start()
+        thread = threading.Thread(target=self._recover, name="decision-recovery", daemon=True)
+        thread.start()
+        return thread
+
+    def _recover(self):
+        db = self.session_factory()
+        try:
+            event_ids = [
+                event_id for (event_id,) in
+                db.query(models.PendingEvent.event_id).order_by(models.PendingEvent.queued_at).all()
+            ]
+        except Exception as e:
+            print(f"Error loading events pending a decision: {e}")
+            return
+        finally:
+            db.close()
+        if event_ids:
+            print(f"Re-queueing {len(event_ids)} events pending a decision")
+        for event_id in event_ids:
+            self._set_status(event_id, PENDING)
+            self._queue.put(event_id)
+
+    def status(self, event_id):
+        with self._lock:
+            return self._status.get(event_id)
+
+    def _set_status(self, event_id, value):
+        with self._lock:
+            self._status[event_id] = value
+            self._status.move_to_end(event_id)
+            while len(self._status) > self.history:
+                self._status.popitem(last=False)
+
+    def _run(self):
+        while True:
+            event_id = self._queue.get()
+            if event_id is None:
+                break
+            db = self.session_factory()
+            try:
+                # Committed with the decision; a failed evaluation leaves it for recovery
+                claimed = db.query(models.PendingEvent).filter(
+                    models.PendingEvent.event_id == event_id
+                ).delete(synchronize_session=False)
+                if not claimed:
+                    # Already evaluated, e.g. by another worker process recovering the same backlog
+                    db.rollback()
+                    outcome = None
+                else:
+                    event = db.query(models.Event).filter(models.Event.event_id == event_id).first()
+                    # evaluate() commits the claim with the decision
+                    decision = self.engine.evaluate(db, event) if event else None
+                    if event is None:
+                        db.commit()
+                    outcome = DECIDED if decision else NO_DECISION
+            except Exception as e:
+                db.rollback()
+                print(f"Error evaluating event {event_id} in pipeline: {e}")
+                outcome = FAILED
+            finally:
+                db.close()
+            if outcome is None:
+                with self._lock:
+                    self._status.pop(event_id, None)
+                continue
+            self._set_status(event_id, outcome)
+            self._outcomes[outcome].inc()
@@ -0,0 +1,444 @@
+"""
+In-memory risk profile store with write-behind persistence.
+
+The engine updates profiles here instead of doing a read-modify-write on the
+`risk_profiles` row for every triggering event; updates are staged per
+transaction and applied once its decisions are committed. Each profile is a small
+slotted record (score, level code, signal bitset over a shared signal
+vocabulary, per-signal score components). Scores decay lazily through
+`scoring.score_model`: stored values are as of the last update and reads
+apply the decay since then. Changed profiles are written back in one batched statement every
+TRUSTSHIELD_PROFILE_FLUSH_SECONDS and on shutdown / interpreter exit; a hard
+crash loses at most one flush interval of profile updates.
+
+When several API worker processes share the database, each would otherwise
+update its own copy of a profile. In write-through mode (the default with
+TRUSTSHIELD_WORKERS > 1) nothing is cached: every update locks the profile
+row, reads it, and writes it back in the caller's transaction, and reads go
+to the table.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import models
+from .database import WORKERS, SessionLocal
+from .enums import RISK_LEVEL_CODES
+from .scoring import UNATTRIBUTED, format_signal_scores, level_for_score, score_model
+from .timestamps import now_ms, to_epoch_ms
+
+PROFILE_FLUSH_SECONDS = float(os.getenv("TRUSTSHIELD_PROFILE_FLUSH_SECONDS", "1.0"))
+# Clean profiles beyond this many are evicted (dirty ones are kept until flushed)
+PROFILE_CACHE_SIZE = int(os.getenv("TRUSTSHIELD_PROFILE_CACHE_SIZE", "500000"))
+# Update profiles in the database instead of in memory (required with several worker processes)
+PROFILE_WRITE_THROUGH = os.getenv("TRUSTSHIELD_PROFILE_WRITE_THROUGH", "1" if WORKERS > 1 else "0") == "1"
+
+_LEVEL_NAMES = {code: name for name, code in RISK_LEVEL_CODES.items()}
+# Component key of unattributed score (components are otherwise keyed by signal bit)
+_UNATTRIBUTED_BIT = -1
+
+
+class SignalVocabulary:
+    """Assigns each distinct signal name a bit, in first-seen order."""
+    def __init__(self):
+        self._bits = {}
+        self._names = []
+
+    def bit(self, name):
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = len(self._names)
+            self._bits[name] = bit
+            self._names.append(name)
+        return bit
+
+    def encode(self, signals):
+        mask = 0
+        for name in signals:
+            if name:
+                mask |= 1 << self.bit(name)
+        return mask
+
+    def name(self, bit):
+        return self._names[bit] if bit >= 0 else UNATTRIBUTED
+
+    def decode(self, mask):
+        names = []
+        bit = 0
+        while mask:
+            if mask & 1:
+                names.append(self._names[bit])
+            mask >>= 1
+            bit += 1
+        return names
+
+
+class ProfileEntry:
+    __slots__ = ("score", "level", "signal_bits", "components", "updated_ms", "persisted", "flushed_level")
+
+    def __init__(self, score, level, signal_bits, components, updated_ms, persisted):
+        # Score and level as of updated_ms; reads decay them to the current time
+        self.score = score
+        self.level = level # RISK_LEVEL_CODES value, None until first decision
+        self.signal_bits = signal_bits
+        self.components = components # {signal bit: score}
+        self.updated_ms = updated_ms
+        self.persisted = persisted
+        self.flushed_level = level # Level the risk_profiles row currently holds
+
+
+class StagedProfiles:
+    """Profile contributions of one transaction's decisions, applied by commit_staged()."""
+    __slots__ = ("entries", "level_changes")
+
+    def __init__(self):
+        self.entries = {} # user_id -> (base entry or None, working copy, [(contributions, ms)])
+        self.level_changes = [] # Write-through mode: (old_level, new_level) per decision
+
+
+class ProfileStore:
+    def __init__(self, flush_interval=PROFILE_FLUSH_SECONDS, max_entries=PROFILE_CACHE_SIZE,
+                 write_through=PROFILE_WRITE_THROUGH):
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.write_through = write_through
+        self.vocabulary = SignalVocabulary()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._in_flight = set() # Taken from _dirty by a flush not committed yet
+        # Flush progress, so readers can combine table counts with pending changes
+        self._flushing = False
+        self._generation = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Loading ---
+
+    def _entry_from_row(self, row):
+        level = RISK_LEVEL_CODES.get(row.risk_level) if row.risk_level else None
+        signals = row.signals.split(",") if row.signals else []
+        components = {
+            self._component_key(name): value
+            for name, value in score_model.row_components(row.risk_score, row.signal_scores).items()
+        }
+        updated_ms = to_epoch_ms(row.updated_at) if row.updated_at else now_ms()
+        return ProfileEntry(row.risk_score or 0, level, self.vocabulary.encode(signals), components, updated_ms, True)
+
+    def _component_key(self, signal):
+        return self.vocabulary.bit(signal) if signal else _UNATTRIBUTED_BIT
+
+    def preload(self, db, user_ids):
+        """Loads every missing profile of `user_ids` with one query."""
+        if self.write_through:
+            return
+        with self._lock:
+            missing = [u for u in user_ids if u not in self._entries]
+        if not missing:
+            return
+        rows = db.query(models.RiskProfile).filter(models.RiskProfile.user_id.in_(missing)).all()
+        with self._lock:
+            for row in rows:
+                if row.user_id not in self._entries:
+                    self._entries[row.user_id] = self._entry_from_row(row)
+            self._evict()
+
+    def _get(self, db, user_id):
+        if not self.write_through:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None:
+                    self._entries.move_to_end(user_id)
+                    return entry
+        row = db.query(models.RiskProfile).filter(models.RiskProfile.user_id == user_id).first()
+        if row is None:
+            return None
+        with self._lock:
+            if self.write_through:
+                return self._entry_from_row(row)
+            # Another thread may have loaded (and changed) it meanwhile
+            entry = self._entries.setdefault(user_id, self._entry_from_row(row))
+            self._evict()
+            return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            for user_id in self._entries:
+                if user_id not in self._dirty:
+                    del self._entries[user_id]
+                    break
+            else:
+                return
+
+    @staticmethod
+    def _copy(entry):
+        copy = ProfileEntry(entry.score, entry.level, entry.signal_bits, dict(entry.components), entry.updated_ms, entry.persisted)
+        copy.flushed_level = entry.flushed_level
+        return copy
+
+    # --- Engine side ---
+
+    def staging(self):
+        return StagedProfiles()
+
+    def stage(self, db, user_id, contributions, staged, current_ms=None):
+        """
+        Decays the user's profile to now and adds a decision's (signal, score)
+        contributions, creating the profile if needed. Returns (old_level, new_level) names.
+        The decision is not committed yet: the update goes to a private copy
+        in `staged` and reaches the shared profile through commit_staged(), so
+        a rolled back decision leaves no trace.
+        """
+        current_ms = current_ms if current_ms is not None else now_ms()
+        if self.write_through:
+            # Part of the caller's transaction, rolled back with it
+            levels = self._apply_to_row(db, user_id, contributions, current_ms)
+            staged.level_changes.append(levels)
+            return levels
+        item = staged.entries.get(user_id)
+        if item is None:
+            entry = self._get(db, user_id)
+            with self._lock:
+                if entry is None:
+                    entry = self._entries.get(user_id)
+                base = self._copy(entry) if entry is not None else None
+            working = self._copy(base) if base is not None else ProfileEntry(0, None, 0, {}, current_ms, False)
+            item = staged.entries[user_id] = (base, working, [])
+        _, working, updates = item
+        with self._lock:
+            levels = self._update(working, contributions, current_ms)
+        updates.append((contributions, current_ms))
+        return levels
+
+    def commit_staged(self, staged):
+        """
+        Applies the contributions staged by committed decisions to the shared
+        profiles. Returns the (old_level, new_level) change of each decision.
+        """
+        if self.write_through:
+            return staged.level_changes
+        if not staged.entries:
+            return []
+        changes = []
+        with self._lock:
+            for user_id, (base, _, updates) in staged.entries.items():
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    # New, or evicted while clean, i.e. still equal to the base copy
+                    entry = self._copy(base) if base is not None else ProfileEntry(0, None, 0, {}, updates[0][1], False)
+                    self._entries[user_id] = entry
+                else:
+                    self._entries.move_to_end(user_id)
+                for contributions, current_ms in updates:
+                    changes.append(self._update(entry, contributions, current_ms))
+                self._dirty.add(user_id)
+            self._evict()
+        self.start()
+        return changes
+
+    def _update(self, entry, contributions, current_ms):
+        # Caller holds self._lock (the vocabulary is shared)
+        old_level = _LEVEL_NAMES.get(entry.level)
+        components = self._decayed(entry, current_ms)
+        for signal, score in contributions:
+            key = self._component_key(signal)
+            if score:
+                components[key] = components.get(key, 0.0) + score
+            if signal:
+                entry.signal_bits |= 1 << key
+        entry.components = score_model.cap(components)
+        entry.updated_ms = current_ms
+        entry.score = score_model.total(entry.components)
+        new_level = level_for_score(entry.score)
+        entry.level = RISK_LEVEL_CODES[new_level]
+        return old_level, new_level
+
+    def _apply_to_row(self, db, user_id, contributions, current_ms):
+        """Write-through update, committed with the caller's decision."""
+        profiles = models.RiskProfile.__table__
+        # Profiles added earlier in the same batch must be visible to the query below
+        db.flush()
+        # A no-op write locks the row (the whole database on SQLite) before it
+        # is read, so workers updating the same user take turns
+        db.execute(profiles.update().where(profiles.c.user_id == user_id).values(user_id=profiles.c.user_id))
+        row = db.query(models.RiskProfile).filter(models.RiskProfile.user_id == user_id).populate_existing().first()
+        with self._lock:
+            entry = self._entry_from_row(row) if row is not None else ProfileEntry(0, None, 0, {}, current_ms, False)
+            levels = self._update(entry, contributions, current_ms)
+            values = self._row(user_id, entry)
+        if row is None:
+            db.add(models.RiskProfile(**values))
+        else:
+            for name, value in values.items():
+                setattr(row, name, value)
+        return levels
+
+    # --- Read side ---
+
+    def _decayed(self, entry, current_ms):
+        return score_model.decay(entry.components, entry.updated_ms, current_ms, name_of=self.vocabulary.name)
+
+    def _snapshot(self, user_id, entry):
+        """API view: score and level decayed to the current time."""
+        score = score_model.total(self._decayed(entry, now_ms()))
+        return {
+            "user_id": user_id,
+            "risk_score": score,
+            "risk_level": level_for_score(score) if entry.level is not None else None,
+            "signals": ",".join(self.vocabulary.decode(entry.signal_bits)),
+        }
+
+    def _row(self, user_id, entry):
+        """Stored form: values as of the last update, decayed again on load."""
+        return {
+            "user_id": user_id,
+            "risk_score": entry.score,
+            "risk_level": _LEVEL_NAMES.get(entry.level),
+            "signals": ",".join(self.vocabulary.decode(entry.signal_bits)),
+            "signal_scores": format_signal_scores(
+                {self.vocabulary.name(key): value for key, value in entry.components.items()}
+            ),
+            "updated_at": entry.updated_ms,
+        }
+
+    def get_profile(self, db, user_id):
+        """Current profile as a dict (including unflushed updates), or None."""
+        entry = self._get(db, user_id)
+        if entry is None:
+            return None
+        with self._lock:
+            return self._snapshot(user_id, entry)
+
+    def view(self, row):
+        """API view of a risk_profiles row: the in-memory copy if cached, else the row decayed to now."""
+        with self._lock:
+            entry = self._entries.get(row.user_id)
+            if entry is None:
+                entry = self._entry_from_row(row)
+            return self._snapshot(row.user_id, entry)
+
+    def unflushed(self):
+        """API views of the profiles whose changes the table does not hold yet, by user_id."""
+        with self._lock:
+            return {
+                user_id: self._snapshot(user_id, self._entries[user_id])
+                for user_id in self._dirty | self._in_flight if user_id in self._entries
+            }
+
+    def level_counts(self, count_rows):
+        """
+        Risk level distribution: `count_rows()` returns {level: count} from the
+        table, corrected here for level changes not flushed yet. Retries if a
+        flush lands while the table is being read.
+        """
+        for _ in range(3):
+            with self._lock:
+                generation = None if self._flushing else self._generation
+            if generation is None:
+                time.sleep(0.01)
+                continue
+            counts = count_rows()
+            with self._lock:
+                if self._flushing or self._generation != generation:
+                    continue
+                for user_id in self._dirty:
+                    entry = self._entries[user_id]
+                    if entry.level == entry.flushed_level:
+                        continue
+                    old, new = _LEVEL_NAMES.get(entry.flushed_level), _LEVEL_NAMES.get(entry.level)
+                    if old is not None:
+                        counts[old] = counts.get(old, 0) - 1
+                    if new is not None:
+                        counts[new] = counts.get(new, 0) + 1
+                return counts
+        return count_rows()
+
+    def pending(self):
+        """Number of changed profiles waiting for the next flush."""
+        with self._lock:
+            return len(self._dirty)
+
+    # --- Write-behind ---
+
+    def flush(self):
+        """Writes every changed profile in one transaction; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                self._flushing = True
+                dirty = self._in_flight = self._dirty
+                self._dirty = set()
+                inserts, updates = [], []
+                for user_id in dirty:
+                    entry = self._entries.get(user_id)
+                    if entry is None:
+                        continue
+                    row = self._row(user_id, entry)
+                    (updates if entry.persisted else inserts).append(row)
+            db = SessionLocal()
+            try:
+                if inserts:
+                    db.bulk_insert_mappings(models.RiskProfile, inserts)
+                if updates:
+                    db.bulk_update_mappings(models.RiskProfile, updates)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"Profile flush failed, retrying next interval: {e}")
+                with self._lock:
+                    self._dirty |= dirty
+                    self._in_flight = set()
+                    self._flushing = False
+                    self._generation += 1
+                return 0
+            finally:
+                db.close()
+            with self._lock:
+                for row in inserts + updates:
+                    entry = self._entries.get(row["user_id"])
+                    if entry is not None:
+                        entry.persisted = True
+                        entry.flushed_level = RISK_LEVEL_CODES.get(row["risk_level"]) if row["risk_level"] else None
+                self._in_flight = set()
+                self._flushing = False
+                self._generation += 1
+            return len(inserts) + len(updates)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profile-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Stops the flusher and writes any remaining changes."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def invalidate(self):
+        """Drops clean cached profiles so they are reloaded from the database."""
+        self.flush()
+        with self._lock:
+            for user_id in [u for u in self._entries if u not in self._dirty]:
+                del self._entries[user_id]
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+# Shared by the engine and the profile read endpoints
+profile_store = ProfileStore()
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Per-endpoint time-to-live in seconds, overridable per namespace through
+# TRUSTSHIELD_CACHE_TTL_<NAMESPACE> (e.g. TRUSTSHIELD_CACHE_TTL_DASHBOARD=2)
+DEFAULT_TTLS = {
+    "dashboard": 5,
+    "risk-rules": 60,
+    "risk-profiles": 10,
+    "decisions": 5,
+}
+CACHE_MAX_ENTRIES = int(os.getenv("TRUSTSHIELD_CACHE_MAX_ENTRIES", "512"))
+
+
+def _env_ttl(namespace, default):
+    env_name = "TRUSTSHIELD_CACHE_TTL_" + namespace.upper().replace("-", "_")
+    return float(os.getenv(env_name, default))
+
+
+class CacheEntry:
+    __slots__ = ("namespace", "body", "etag", "expires_at", "headers")
+
+    def __init__(self, namespace, body, etag, expires_at, headers=None):
+        self.namespace = namespace
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+        self.headers = headers or {}
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of serialized JSON responses.
+    Entries expire after their namespace TTL and whole namespaces can be
+    dropped explicitly when the underlying data changes.
+    """
+    def __init__(self, ttls=None, max_entries=CACHE_MAX_ENTRIES):
+        ttls = ttls if ttls is not None else DEFAULT_TTLS
+        self.ttls = {ns: _env_ttl(ns, ttl) for ns, ttl in ttls.items()}
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def ttl(self, namespace):
+        return self.ttls.get(namespace, 0)
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[(namespace, key)]
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry
+
+    def set(self, namespace, key, body, headers=None):
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CacheEntry(namespace, body, etag, time.monotonic() + self.ttl(namespace), headers)
+        if self.ttl(namespace) <= 0:
+            return entry
+        with self._lock:
+            self._entries[(namespace, key)] = entry
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, *namespaces):
+        with self._lock:
+            if not namespaces:
+                self._entries.clear()
+                return
+            for cache_key in [k for k in self._entries if k[0] in namespaces]:
+                del self._entries[cache_key]
+
+
+# Shared by the API layer (reads) and the engine / CRUD layer (invalidation)
+response_cache = ResponseCache()
@@ -0,0 +1,104 @@
+"""
+Retention pruning for the day-partitioned events table.
+
+Events are keyed by `event_day` (UTC days since epoch). Pruning deletes whole
+days below the retention horizon through the day index, so its cost depends
+on the number of expired rows, not on the size of the table. Events and
+decisions that back a fraud case are kept as case evidence.
+
+    python -m backend.retention --days 90
+"""
+import os
+import threading
+
+from sqlalchemy import not_, or_
+from . import models
+from .dashboard_stats import dashboard_counters
+from .database import SessionLocal
+from .response_cache import response_cache
+from .timestamps import DAY_MS, epoch_day, now_ms
+
+# Days of events to keep; 0 disables pruning
+EVENT_RETENTION_DAYS = int(os.getenv("TRUSTSHIELD_EVENT_RETENTION_DAYS", "0"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("TRUSTSHIELD_RETENTION_INTERVAL_SECONDS", "3600"))
+
+
+def prune_expired(db, retention_days, current_ms=None):
+    """Drops event days older than `retention_days`; returns deleted row counts per table."""
+    cutoff_day = epoch_day(current_ms if current_ms is not None else now_ms()) - retention_days
+    cutoff_ms = cutoff_day * DAY_MS
+    case_events = db.query(models.FraudCase.event_id).filter(models.FraudCase.event_id.isnot(None)).union(
+        db.query(models.CaseAction.event_id).filter(models.CaseAction.event_id.isnot(None))
+    )
+
+    deleted = {}
+    deleted["decisions"] = db.query(models.Decision).filter(
+        models.Decision.timestamp < cutoff_ms,
+        or_(models.Decision.event_id.is_(None), not_(models.Decision.event_id.in_(case_events.scalar_subquery()))),
+    ).delete(synchronize_session=False)
+    deleted["traceability_logs"] = db.query(models.TraceabilityLog).filter(
+        models.TraceabilityLog.created_at < cutoff_ms,
+        models.TraceabilityLog.case_id.is_(None),
+    ).delete(synchronize_session=False)
+    deleted["events"] = db.query(models.Event).filter(
+        models.Event.event_day < cutoff_day,
+        not_(models.Event.event_id.in_(case_events.scalar_subquery())),
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    if any(deleted.values()):
+        dashboard_counters.invalidate()
+        response_cache.invalidate("dashboard", "decisions")
+    return deleted
+
+
+class RetentionJob:
+    """Background thread that prunes expired event days every `interval` seconds."""
+    def __init__(self, retention_days=EVENT_RETENTION_DAYS, interval=RETENTION_INTERVAL_SECONDS):
+        self.retention_days = retention_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.retention_days <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            deleted = prune_expired(db, self.retention_days)
+            if any(deleted.values()):
+                print(f"Retention: pruned {deleted}")
+            return deleted
+        except Exception as e:
+            db.rollback()
+            print(f"Retention pruning failed: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+retention_job = RetentionJob()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Prune events older than the retention window")
+    parser.add_argument("--days", type=int, default=EVENT_RETENTION_DAYS or 90)
+    args = parser.parse_args()
+    print(RetentionJob(retention_days=args.days).run_once())
@@ -0,0 +1,236 @@
+import ast
+import os
+import threading
+import time
+from . import models
+from .context_builder import KNOWN_SERVICES
+from .enums import ActionType
+from .metrics import forget_rule, rule_metrics
+from .response_cache import response_cache
+
+# Upper bound on memoized (service, event_type) candidate lists
+CANDIDATE_CACHE_SIZE = 1024
+# Seconds between checks of the shared rule set version, i.e. how long a rule
+# change made through another API worker takes to reach this one
+RULE_VERSION_POLL_SECONDS = float(os.getenv("TRUSTSHIELD_RULE_VERSION_POLL_SECONDS", "1.0"))
+
+_state = models.RuleSetState.__table__
+
+
+def read_version(db):
+    """Shared rule set version (0 before the first rule change)."""
+    return db.execute(_state.select().with_only_columns(_state.c.version).where(_state.c.id == 1)).scalar() or 0
+
+
+def bump_version(db):
+    """
+    Advances the shared rule set version in the caller's transaction; call it
+    with every rule change, before the commit, so all workers rebuild.
+    """
+    updated = db.execute(_state.update().where(_state.c.id == 1).values(version=_state.c.version + 1))
+    if not updated.rowcount:
+        db.execute(_state.insert().values(id=1, version=1))
+
+
+def normalize_condition(condition):
+    """
+    Converts the analyst-facing rule syntax into a Python expression.
+    Rules are written with upper-case AND / OR operators in the UI.
+    """
+    return condition.replace(" AND ", " and ").replace(" OR ", " or ")
+
+
+class CompiledRule:
+    """
+    Immutable snapshot of a RiskRule row with its condition compiled
+    to a code object, so evaluation never touches the ORM or the parser.
+    """
+    __slots__ = ("rule_id", "condition", "action", "priority", "signal", "risk_score", "code",
+                 "services", "event_types", "metrics")
+
+    def __init__(self, rule_id, condition, action, priority, signal, risk_score, code,
+                 services=None, event_types=None):
+        self.rule_id = rule_id
+        self.condition = condition
+        self.action = action
+        self.priority = priority
+        self.signal = signal
+        self.risk_score = risk_score
+        self.code = code
+        # None means the rule is not restricted on that dimension
+        self.services = services
+        self.event_types = event_types
+        # Evaluation profile, resolved once per compile
+        self.metrics = rule_metrics(rule_id)
+
+
+class RuleSet:
+    """
+    A compiled, read-only set of active rules tagged with the version
+    of the registry that produced it.
+    Rules are indexed by (service, event_type) so an event is only
+    evaluated against the buckets that can possibly match it; rules
+    without a restriction live in the shared None bucket.
+    """
+    def __init__(self, version, rules):
+        self.version = version
+        self.rules = rules
+        self.by_id = {r.rule_id: r for r in rules}
+
+        self._buckets = {}
+        for position, rule in enumerate(rules):
+            for service in rule.services or (None,):
+                for event_type in rule.event_types or (None,):
+                    self._buckets.setdefault((service, event_type), []).append((position, rule))
+
+        self._candidates = {}
+
+    def candidates(self, service, event_type):
+        """Rules that may match an event, in the original rule order."""
+        key = (service, event_type)
+        cached = self._candidates.get(key)
+        if cached is not None:
+            return cached
+
+        entries = []
+        for bucket_key in {(service, event_type), (service, None), (None, event_type), (None, None)}:
+            entries.extend(self._buckets.get(bucket_key, ()))
+        entries.sort(key=lambda entry: entry[0])
+        result = tuple(rule for _, rule in entries)
+
+        if len(self._candidates) < CANDIDATE_CACHE_SIZE:
+            self._candidates[key] = result
+        return result
+
+
+def _string_constants(node):
+    """Returns the string literal(s) of a constant or a tuple/list/set of them, else None."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return (node.value,)
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        values = [_string_constants(elt) for elt in node.elts]
+        if values and all(v is not None and len(v) == 1 for v in values):
+            return tuple(v[0] for v in values)
+    return None
+
+
+def _pinned_values(tree, name):
+    """
+    Finds a top-level conjunct of the form `name == 'X'` or `name in ('X', 'Y')`
+    and returns the allowed values. Anything else (OR, negation, other
+    operators) leaves the rule unrestricted.
+    """
+    node = tree.body if isinstance(tree, ast.Expression) else tree
+    conjuncts = node.values if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And) else [node]
+
+    for part in conjuncts:
+        if not isinstance(part, ast.Compare) or len(part.ops) != 1:
+            continue
+        if not (isinstance(part.left, ast.Name) and part.left.id == name):
+            continue
+        values = _string_constants(part.comparators[0])
+        if values is None:
+            continue
+        if isinstance(part.ops[0], ast.Eq) and len(values) == 1:
+            return values
+        if isinstance(part.ops[0], ast.In):
+            return values
+    return None
+
+
+def _rule_services(condition, tree):
+    # Service prefix (e.g. "Paycell.amount > 100") as used by the original engine check
+    target_service = condition.split('.')[0]
+    if target_service in KNOWN_SERVICES:
+        return (target_service,)
+    return _pinned_values(tree, "service")
+
+
+def compile_rule(rule):
+    action = (rule.action or "").upper()
+    if not ActionType.is_valid(action) or action == "UNKNOWN":
+        raise ValueError(f"unknown action {rule.action!r}")
+    condition = normalize_condition(rule.condition or "")
+    tree = ast.parse(condition, f"<rule {rule.rule_id}>", "eval")
+    code = compile(tree, f"<rule {rule.rule_id}>", "eval")
+    return CompiledRule(
+        rule_id=rule.rule_id,
+        condition=condition,
+        action=action,
+        priority=rule.priority,
+        signal=rule.signal,
+        risk_score=rule.risk_score or 0,
+        code=code,
+        services=_rule_services(condition, tree),
+        event_types=_pinned_values(tree, "event_type"),
+    )
+
+
+class RuleRegistry:
+    """
+    Holds the compiled active rule set in memory.
+    The set is rebuilt lazily on the first evaluation after invalidate()
+    is called by the rule CRUD functions, or after the shared version in
+    `rule_set_state` moved (a rule changed through another worker process),
+    which is checked at most every RULE_VERSION_POLL_SECONDS.
+    """
+    def __init__(self, poll_seconds=RULE_VERSION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._rule_set = None
+        self._last = None # Last built set, kept across invalidate() to detect changed conditions
+        self._next_check = 0.0
+
+    @property
+    def version(self):
+        return self._last.version if self._last is not None else 0
+
+    def invalidate(self):
+        with self._lock:
+            self._rule_set = None
+
+    def get_rule_set(self, db):
+        rule_set = self._rule_set
+        if rule_set is not None and time.monotonic() < self._next_check:
+            return rule_set
+
+        # While one thread checks the version the others keep using the current set
+        if not self._lock.acquire(blocking=rule_set is None):
+            return rule_set
+        try:
+            if self._rule_set is not None and time.monotonic() < self._next_check:
+                return self._rule_set
+            # Version first: a change committed while the rows load is picked up by the next check
+            version = read_version(db)
+            self._next_check = time.monotonic() + self.poll_seconds
+            if self._rule_set is None or self._rule_set.version != version:
+                remote = self._rule_set is not None
+                self._rule_set = self._last = self._build(db, version)
+                if remote:
+                    # Changed through another worker: its cached rule listings are stale here too
+                    response_cache.invalidate("risk-rules", "dashboard")
+            return self._rule_set
+        finally:
+            self._lock.release()
+
+    def _build(self, db, version):
+        rows = db.query(models.RiskRule).filter(models.RiskRule.is_active == 1).all()
+
+        previous = self._last.by_id if self._last is not None else {}
+        compiled = []
+        for row in rows:
+            old = previous.get(row.rule_id)
+            if old is not None and old.condition != normalize_condition(row.condition or ""):
+                # Edited in another worker; the old condition's profile says nothing about the new one
+                forget_rule(row.rule_id)
+            try:
+                compiled.append(compile_rule(row))
+            except (SyntaxError, ValueError) as e:
+                # Invalid rules are skipped, same as a failing eval() used to be
+                print(f"Error compiling rule {row.rule_id}: {row.condition} - {e}")
+
+        return RuleSet(version, compiled)
+
+
+# Shared by the engine and the rule CRUD functions
+rule_registry = RuleRegistry()
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, List
+from .enums import ActionType, CaseStatusType
+from .timestamps import to_epoch_ms
 
 # --- Auth Schemas ---
 class Token(BaseModel):
@@ -37,11 +39,25 @@ class EventBase(BaseModel):
 class EventCreate(EventBase):
     event_id: str
 
+    @field_validator("timestamp")
+    @classmethod
+    def timestamp_must_parse(cls, v):
+        # Stored as epoch milliseconds: reject anything that cannot be converted
+        to_epoch_ms(v)
+        return v
+
 class Event(EventBase):
     event_id: str
     class Config:
         from_attributes = True
 
+class EventDecisionSummary(BaseModel):
+    event_id: str
+    decision_id: Optional[str] = None
+    selected_action: Optional[str] = None
+    triggered_rules: Optional[str] = None
+    rule_set_version: Optional[int] = None
+
 # Risk Rule Schemas
 class RiskRuleBase(BaseModel):
     condition: str
@@ -49,6 +65,15 @@ class RiskRuleBase(BaseModel):
     priority: int
     is_active: bool
 
+    @field_validator("action")
+    @classmethod
+    def action_must_be_known(cls, v):
+        # Actions are stored as integer codes, so only known names are accepted
+        v = v.upper()
+        if v == "UNKNOWN" or not ActionType.is_valid(v):
+            raise ValueError(f"Unknown action {v}")
+        return v
+
 class RiskRuleCreate(RiskRuleBase):
     rule_id: str
 
@@ -57,6 +82,19 @@ class RiskRule(RiskRuleBase):
     class Config:
         from_attributes = True
 
+class RuleStats(BaseModel):
+    rule_id: str
+    condition: str
+    action: str
+    evaluations: int
+    matches: int
+    errors: int
+    total_seconds: float
+    mean_seconds: float
+    max_seconds: float
+    time_share: float # Fraction of all rule evaluation time
+    last_error: Optional[str] = None
+
 # Risk Profile Schemas
 class RiskProfile(BaseModel):
     user_id: str
@@ -66,6 +104,23 @@ class RiskProfile(BaseModel):
     class Config:
         from_attributes = True
 
+class BipNotification(BaseModel):
+    notification_id: str
+    user_id: str
+    channel: Optional[str] = None
+    message: Optional[str] = None
+    sent_at: Optional[str] = None
+    action: Optional[str] = None
+    status: Optional[str] = None
+    attempts: Optional[int] = None
+    coalesced: Optional[int] = None
+    class Config:
+        from_attributes = True
+
+class RescoreResult(BaseModel):
+    profiles: int
+    level_changes: int
+
 # Fraud Case Schemas
 class FraudCase(BaseModel):
     case_id: str
@@ -81,6 +136,38 @@ class FraudCase(BaseModel):
     class Config:
         from_attributes = True
 
+class CaseAction(BaseModel):
+    action_id: str
+    case_id: str
+    event_id: Optional[str] = None
+    action_type: Optional[str] = None
+    actor: Optional[str] = None
+    note: Optional[str] = None
+    timestamp: Optional[str] = None
+    class Config:
+        from_attributes = True
+
+class FraudCaseBulkStatusUpdate(BaseModel):
+    status: str
+    # Either explicit case ids or filters selecting the cases
+    case_ids: Optional[List[str]] = None
+    current_status: Optional[str] = None
+    priority: Optional[str] = None
+    user_id: Optional[str] = None
+    note: Optional[str] = None
+
+    @field_validator("status")
+    @classmethod
+    def status_must_be_known(cls, v):
+        v = v.upper()
+        if v == "UNKNOWN" or not CaseStatusType.is_valid(v):
+            raise ValueError(f"Unknown case status {v}")
+        return v
+
+class BulkCaseUpdateResult(BaseModel):
+    matched: int
+    updated: int
+
 # Decision Schemas
 class Decision(BaseModel):
     decision_id: str
@@ -90,11 +177,16 @@ class Decision(BaseModel):
     signals: Optional[str] = None # Added
     selected_action: Optional[str] = None
     suppressed_actions: Optional[str] = None
+    rule_set_version: Optional[int] = None
     timestamp: str
     class Config:
         from_attributes = True
 
-# Dashboard Summary Schema
+class EventDecisionStatus(BaseModel):
+    event_id: str
+    status: str # PENDING, DECIDED, NO_DECISION or FAILED
+    decision: Optional[Decision] = None
+
 # Dashboard Summary Schema
 class TrafficPoint(BaseModel):
     time: str
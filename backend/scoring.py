@@ -0,0 +1,168 @@
+"""
+Time-aware risk scoring.
+
+A profile's score is the sum of per-signal components, each decaying
+exponentially with its own half-life since the profile was last updated.
+Decay is applied lazily (on read and on the next decision), so no periodic
+table rewrite is needed; `rescore_all` persists decayed scores in one
+streaming pass when stored levels should catch up (e.g. nightly):
+
+    python -m backend.scoring --rescore
+"""
+import json
+import os
+
+from sqlalchemy import select
+from . import models
+from .timestamps import HOUR_MS, now_ms, to_epoch_ms
+
+# Default half-life of a signal's score contribution; 0 disables decay
+SCORE_HALF_LIFE_HOURS = float(os.getenv("TRUSTSHIELD_SCORE_HALF_LIFE_HOURS", "168"))
+# Per-signal overrides as name=hours pairs, e.g. "Suspicious Login=24,Account Sharing=720"
+SIGNAL_HALF_LIVES = os.getenv("TRUSTSHIELD_SIGNAL_HALF_LIVES", "")
+RESCORE_BATCH_SIZE = int(os.getenv("TRUSTSHIELD_RESCORE_BATCH_SIZE", "1000"))
+
+MAX_RISK_SCORE = 100
+# Contributions that decayed below this are dropped
+MIN_COMPONENT = 0.01
+# Component key for score that predates per-signal tracking or has no signal
+UNATTRIBUTED = ""
+
+
+def level_for_score(score):
+    if score >= 80: return "CRITICAL"
+    elif score >= 50: return "HIGH"
+    elif score >= 20: return "MEDIUM"
+    return "LOW"
+
+
+def parse_half_lives(spec):
+    half_lives = {}
+    for part in spec.split(","):
+        name, _, hours = part.rpartition("=")
+        if name.strip() and hours.strip():
+            half_lives[name.strip()] = float(hours)
+    return half_lives
+
+
+def parse_signal_scores(text):
+    """Stored JSON {signal: score} -> dict; empty for legacy rows."""
+    if not text:
+        return {}
+    try:
+        scores = json.loads(text)
+    except ValueError:
+        return {}
+    return {str(k): float(v) for k, v in scores.items()} if isinstance(scores, dict) else {}
+
+
+def format_signal_scores(scores):
+    return json.dumps({name: round(value, 3) for name, value in scores.items()}, separators=(",", ":"))
+
+
+class ScoreModel:
+    def __init__(self, default_half_life_hours=SCORE_HALF_LIFE_HOURS, signal_half_lives=None):
+        self.default_half_life_ms = default_half_life_hours * HOUR_MS
+        overrides = signal_half_lives if signal_half_lives is not None else parse_half_lives(SIGNAL_HALF_LIVES)
+        self.half_lives_ms = {name: hours * HOUR_MS for name, hours in overrides.items()}
+
+    def half_life_ms(self, signal):
+        return self.half_lives_ms.get(signal, self.default_half_life_ms)
+
+    def decay(self, components, from_ms, to_ms, name_of=None):
+        """
+        Components decayed from `from_ms` to `to_ms`. Keys are signal names, or
+        any key that `name_of` maps to a name. Negligible components are dropped.
+        """
+        elapsed = (to_ms - from_ms) if from_ms is not None else 0
+        if elapsed <= 0:
+            return dict(components)
+        decayed = {}
+        for key, value in components.items():
+            half_life = self.half_life_ms(name_of(key) if name_of else key)
+            if half_life > 0:
+                value *= 0.5 ** (elapsed / half_life)
+            if value >= MIN_COMPONENT:
+                decayed[key] = value
+        return decayed
+
+    @staticmethod
+    def cap(components):
+        """Scales components down proportionally so they never sum above the maximum score."""
+        total = sum(components.values())
+        if total <= MAX_RISK_SCORE:
+            return components
+        ratio = MAX_RISK_SCORE / total
+        return {key: value * ratio for key, value in components.items()}
+
+    @staticmethod
+    def total(components):
+        return min(MAX_RISK_SCORE, int(round(sum(components.values()))))
+
+    def row_components(self, risk_score, signal_scores):
+        """Components of a stored profile; legacy rows carry their score unattributed."""
+        components = parse_signal_scores(signal_scores)
+        if not components and risk_score:
+            components = {UNATTRIBUTED: float(risk_score)}
+        return components
+
+
+score_model = ScoreModel()
+
+
+def rescore_all(db, model=score_model, current_ms=None, batch_size=RESCORE_BATCH_SIZE):
+    """
+    Recomputes every stored profile's decayed score and level in one pass,
+    paging through risk_profiles by user_id so memory stays bounded.
+    Returns (profiles_scanned, levels_changed).
+    """
+    current_ms = current_ms if current_ms is not None else now_ms()
+    table = models.RiskProfile.__table__
+    scanned = changed = 0
+    last_user = None
+    while True:
+        query = select(
+            table.c.user_id, table.c.risk_score, table.c.risk_level, table.c.signal_scores, table.c.updated_at
+        ).order_by(table.c.user_id).limit(batch_size)
+        if last_user is not None:
+            query = query.where(table.c.user_id > last_user)
+        rows = db.execute(query).fetchall()
+        if not rows:
+            break
+        updates = []
+        for user_id, risk_score, risk_level, signal_scores, updated_at in rows:
+            components = model.decay(
+                model.row_components(risk_score, signal_scores),
+                to_epoch_ms(updated_at) if updated_at else current_ms, current_ms,
+            )
+            score = model.total(components)
+            level = level_for_score(score)
+            changed += level != risk_level
+            updates.append({
+                "user_id": user_id, "risk_score": score, "risk_level": level,
+                "signal_scores": format_signal_scores(components), "updated_at": current_ms,
+            })
+        db.bulk_update_mappings(models.RiskProfile, updates)
+        db.commit()
+        scanned += len(rows)
+        last_user = rows[-1][0]
+    # Ends the last (empty) page's transaction so the connection is released
+    db.commit()
+    return scanned, changed
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import SessionLocal
+    parser = argparse.ArgumentParser(description="Risk score maintenance")
+    parser.add_argument("--rescore", action="store_true", help="persist decayed scores and levels for every profile")
+    args = parser.parse_args()
+    if args.rescore:
+        session = SessionLocal()
+        try:
+            scanned, changed = rescore_all(session)
+        finally:
+            session.close()
+        print(f"Rescored {scanned} profiles, {changed} level changes")
+    else:
+        parser.print_help()
@@ -0,0 +1,57 @@
+"""
+Multi-process API server.
+
+Rule evaluation is CPU-bound and a single process uses one core, so this
+starts the API under several uvicorn worker processes sharing one database:
+
+    python -m backend.serve --workers 4 [--host 0.0.0.0] [--port 8000]
+
+Migrations run once here, before the workers start. The workers then agree
+through the database:
+
+- rules: every rule change bumps `rule_set_state.version`; each worker polls
+  it (TRUSTSHIELD_RULE_VERSION_POLL_SECONDS) and recompiles its rule set, so
+  decisions from all workers carry the same rule_set_version
+- risk profiles: updated write-through under a row lock instead of in a
+  per-process cache (see profile_store)
+- velocity features: computed from the events table on every decision
+  (DatabaseWindowStore) rather than from per-process windows
+- notifications: dedup and the hourly cap are checked against
+  bip_notifications with the users' rows locked; coalescing windows are
+  still per worker, so one user's notifications arriving through two
+  workers may be delivered as two messages, within the same dedup and cap
+  (see notifications)
+- dashboard counters: a snapshot of the tables reloaded every
+  TRUSTSHIELD_DASHBOARD_RESYNC_SECONDS (10 by default) rather than counted
+  per worker
+
+The live feed and the FAILED status of /events/async evaluations are per
+worker.
+"""
+import os
+
+import uvicorn
+
+from . import migrations
+from .database import engine
+
+APP = "backend.main:app"
+SERVE_WORKERS = int(os.getenv("TRUSTSHIELD_SERVE_WORKERS", str(os.cpu_count() or 1)))
+
+
+def serve(workers=SERVE_WORKERS, host="127.0.0.1", port=8000):
+    print(f"Schema version: {migrations.upgrade(engine)}")
+    # Workers are spawned, not forked: they reconnect and read their settings from the environment
+    engine.dispose()
+    os.environ["TRUSTSHIELD_WORKERS"] = str(workers)
+    uvicorn.run(APP, host=host, port=port, workers=workers)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port)
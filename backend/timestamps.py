@@ -0,0 +1,65 @@
+import datetime
+
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+DAY_MS = 24 * 60 * 60 * 1000
+HOUR_MS = 60 * 60 * 1000
+
+
+def to_epoch_ms(value):
+    """
+    Epoch milliseconds of an ISO string ('...Z', '+03:00' or naive local time),
+    a datetime or a number. Raises ValueError if the value cannot be parsed.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        return int(round(value.timestamp() * 1000))
+    text = str(value).strip()
+    if text.lstrip("-").isdigit():
+        return int(text)
+    try:
+        dt = datetime.datetime.fromisoformat(text.replace("Z", "+00:00").replace(" ", "T", 1))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return int(round(dt.timestamp() * 1000))
+
+
+def to_iso(epoch_ms):
+    """UTC ISO-8601 string with millisecond precision, e.g. 2025-01-31T09:15:00.000Z."""
+    dt = datetime.datetime.fromtimestamp(epoch_ms / 1000.0, tz=datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def epoch_day(epoch_ms):
+    """UTC day number (days since 1970-01-01), the event partition key."""
+    return epoch_ms // DAY_MS if epoch_ms is not None else None
+
+
+def now_ms():
+    return int(round(datetime.datetime.now().timestamp() * 1000))
+
+
+class EpochTimestamp(TypeDecorator):
+    """
+    BIGINT epoch-millisecond column exposed as a UTC ISO string.
+    Accepts ISO strings in any of the formats the API and CSVs use, so range
+    filters compare numbers instead of mixed-format strings.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_epoch_ms(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str) and not value.lstrip("-").isdigit():
+            return value # Legacy string row not migrated yet
+        return to_iso(int(value))
@@ -0,0 +1,266 @@
+"""
+Columnar rule evaluation for blocks of events (backtests, bulk scoring).
+
+Conditions built from comparisons of one feature with constants, joined by
+and / or, e.g. `Paycell.amount > 20000 and event_type == 'TRANSFER'`, are
+evaluated as NumPy masks over a block: each referenced feature becomes one
+array built from the events' evaluation contexts. Everything else (calls,
+arithmetic, chained comparisons, unknown names) and any block whose values
+do not compare cleanly falls back to the scalar `eval` path, so results are
+the same as evaluating event by event, including the cases where `eval` would
+raise (a missing attribute in an ordering comparison, a service proxy that is
+absent for the event). Without NumPy every rule takes the scalar path.
+"""
+import ast
+import time
+
+from .engine import ACTION_HIERARCHY, match_rules
+
+try:
+    import numpy as np
+except ImportError: # Vectorized evaluation is optional
+    np = None
+
+# Bare names the scalar context always defines (see build_evaluation_context)
+CONTEXT_NAMES = ("value", "service", "event_type", "unit")
+_ORDERING = (ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+
+class Unvectorizable(Exception):
+    """A condition, or a block of values, that must take the scalar path."""
+
+
+# --- Condition compilation ---
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, SyntaxError):
+        raise Unvectorizable("comparator is not a constant")
+
+
+def _operand(node):
+    """Column key of a comparison's left side: ('context', name) or ('feature', service, name)."""
+    if isinstance(node, ast.Name) and node.id in CONTEXT_NAMES:
+        return ("context", node.id)
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id not in CONTEXT_NAMES:
+        return ("feature", node.value.id, node.attr)
+    raise Unvectorizable("left side is not a feature")
+
+
+def _compile(node):
+    """Nested tuples: ('and'|'or', [children]) or ('cmp', column key, op, constant)."""
+    if isinstance(node, ast.BoolOp):
+        kind = "and" if isinstance(node.op, ast.And) else "or"
+        return (kind, [_compile(value) for value in node.values])
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        op = node.ops[0]
+        constant = _literal(node.comparators[0])
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(constant, (tuple, list, set, frozenset)):
+                raise Unvectorizable("membership test on a non-collection")
+            constant = tuple(constant)
+        elif not isinstance(op, (ast.Eq, ast.NotEq) + _ORDERING):
+            raise Unvectorizable(f"unsupported operator {type(op).__name__}")
+        return ("cmp", _operand(node.left), op, constant)
+    raise Unvectorizable(f"unsupported expression {type(node).__name__}")
+
+
+def compile_vector(rule):
+    """Vectorized form of a compiled rule's condition, or None if it needs the scalar path."""
+    try:
+        return _compile(ast.parse(rule.condition, mode="eval").body)
+    except (Unvectorizable, SyntaxError):
+        return None
+
+
+# --- Columns ---
+
+class _Column:
+    __slots__ = ("values", "missing", "numeric")
+
+    def __init__(self, raw):
+        self.missing = np.fromiter((v is None for v in raw), dtype=bool, count=len(raw))
+        self.numeric = all(v is None or isinstance(v, (int, float)) for v in raw)
+        if self.numeric:
+            self.values = np.fromiter((np.nan if v is None else v for v in raw), dtype=np.float64, count=len(raw))
+        else:
+            self.values = np.empty(len(raw), dtype=object)
+            self.values[:] = raw
+
+
+class Block:
+    """Columns of one block of events, built on first use from their contexts."""
+    def __init__(self, events, contexts):
+        self.events = events
+        self.contexts = contexts
+        self.size = len(events)
+        self._columns = {}
+        self._services = None
+        self._event_types = None
+
+    def _objects(self, values):
+        array = np.empty(self.size, dtype=object)
+        array[:] = values
+        return array
+
+    def services(self):
+        if self._services is None:
+            self._services = self._objects([e.service for e in self.events])
+        return self._services
+
+    def event_types(self):
+        if self._event_types is None:
+            self._event_types = self._objects([e.event_type for e in self.events])
+        return self._event_types
+
+    def column(self, key):
+        column = self._columns.get(key)
+        if column is None:
+            if key[0] == "context":
+                raw = [ctx.get(key[1]) for ctx in self.contexts]
+            else:
+                proxies = [ctx.get(key[1]) if e.service == key[1] else None for e, ctx in zip(self.events, self.contexts)]
+                # ServiceProxy returns None for attributes the feature map lacks
+                raw = [vars(p).get(key[2]) if p is not None else None for p in proxies]
+            column = self._columns[key] = _Column(raw)
+        return column
+
+    def absent(self, key):
+        """Rows where the scalar path raises NameError for the operand's name."""
+        if key[0] == "context":
+            return np.zeros(self.size, dtype=bool)
+        return self.services() != key[1]
+
+
+def _isin(values, items):
+    # Element-wise ==, like Python's `in`; np.isin sorts and fails on mixed objects
+    mask = np.zeros(len(values), dtype=bool)
+    for item in items:
+        mask |= np.asarray(values == item, dtype=bool)
+    return mask
+
+
+def _compare(column, op, constant):
+    values = column.values
+    if isinstance(op, (ast.In, ast.NotIn)):
+        mask = _isin(values, constant)
+        if None in constant:
+            mask |= column.missing # NaN stands for None in numeric columns
+        return mask if isinstance(op, ast.In) else ~mask
+    if isinstance(op, ast.Eq):
+        mask = np.asarray(values == constant, dtype=bool)
+        return mask | column.missing if constant is None else mask
+    if isinstance(op, ast.NotEq):
+        mask = np.asarray(values != constant, dtype=bool)
+        return mask & ~column.missing if constant is None else mask
+    if constant is None:
+        raise Unvectorizable("ordering against None")
+    if isinstance(op, ast.Lt):
+        return np.asarray(values < constant, dtype=bool)
+    if isinstance(op, ast.LtE):
+        return np.asarray(values <= constant, dtype=bool)
+    if isinstance(op, ast.Gt):
+        return np.asarray(values > constant, dtype=bool)
+    return np.asarray(values >= constant, dtype=bool)
+
+
+def _evaluate(node, block):
+    """(value mask, raise mask) with Python's short-circuit semantics."""
+    kind = node[0]
+    if kind == "cmp":
+        _, key, op, constant = node
+        column = block.column(key)
+        try:
+            with np.errstate(invalid="ignore"):
+                value = _compare(column, op, constant)
+        except TypeError:
+            raise Unvectorizable("values do not compare with the constant")
+        raised = block.absent(key)
+        if isinstance(op, _ORDERING):
+            # None < 5 raises in Python; NaN < 5 is just False
+            raised = raised | column.missing
+        return value, raised
+    value, raised = _evaluate(node[1][0], block)
+    for child in node[1][1:]:
+        child_value, child_raised = _evaluate(child, block)
+        # The next operand only runs where the previous ones did not decide
+        reached = ~raised & (value if kind == "and" else ~value)
+        raised = raised | (reached & child_raised)
+        value = np.where(reached, child_value, value)
+    return value, raised
+
+
+# --- Batch evaluator ---
+
+class BatchEvaluator:
+    """
+    Evaluates a RuleSet over blocks of events. `evaluate` returns the same
+    (triggered rule ids, candidate actions) per event as `engine.match_rules`
+    over the event's candidate rules.
+    """
+    def __init__(self, rule_set):
+        self.rule_set = rule_set
+        self.position = {rule.rule_id: i for i, rule in enumerate(rule_set.rules)}
+        self.vectors = {}
+        if np is not None:
+            for rule in rule_set.rules:
+                vector = compile_vector(rule)
+                if vector is not None:
+                    self.vectors[rule.rule_id] = vector
+
+    def _applies(self, rule, block):
+        """Rows for which `rule` is among the event's candidates."""
+        mask = np.ones(block.size, dtype=bool)
+        if rule.services is not None:
+            mask &= _isin(block.services(), rule.services)
+        if rule.event_types is not None:
+            mask &= _isin(block.event_types(), rule.event_types)
+        return mask
+
+    def evaluate(self, events, contexts):
+        hits = [[] for _ in events] # Positions of matching rules per event
+        scalar = set(self.rule_set.by_id) - set(self.vectors)
+        if self.vectors:
+            block = Block(events, contexts)
+            for rule in self.rule_set.rules:
+                vector = self.vectors.get(rule.rule_id)
+                if vector is None:
+                    continue
+                applies = self._applies(rule, block)
+                count = int(applies.sum())
+                if not count:
+                    continue
+                started = time.perf_counter()
+                try:
+                    value, raised = _evaluate(vector, block)
+                except Unvectorizable:
+                    scalar.add(rule.rule_id)
+                    continue
+                matched = value & ~raised & applies
+                rule.metrics.observe((time.perf_counter() - started) / count, count)
+                errors = int((raised & applies).sum())
+                if errors:
+                    rule.metrics.errors.inc(errors)
+                position = self.position[rule.rule_id]
+                rows = np.flatnonzero(matched)
+                for i in rows:
+                    hits[i].append(position)
+                rule.metrics.hits.inc(len(rows))
+
+        results = []
+        for event, context, positions in zip(events, contexts, hits):
+            if scalar:
+                rules = [r for r in self.rule_set.candidates(event.service, event.event_type) if r.rule_id in scalar]
+                if rules:
+                    triggered, _ = match_rules(rules, context)
+                    positions.extend(self.position[rule_id] for rule_id in triggered)
+            positions.sort()
+            rules = [self.rule_set.rules[p] for p in positions]
+            possible_actions = [
+                {"action": r.action, "priority": ACTION_HIERARCHY.get(r.action, 10), "rule_id": r.rule_id}
+                for r in rules
+            ]
+            possible_actions.sort(key=lambda x: x["priority"], reverse=True)
+            results.append(([r.rule_id for r in rules], possible_actions))
+        return results
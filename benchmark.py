@@ -0,0 +1,213 @@
+"""
+Reproducible in-process benchmark for the rule engine and the ingest path.
+
+Runs against a throw-away SQLite database in a temp directory, so it never
+touches trustshield.db. Examples:
+
+    python benchmark.py --mode engine --rules 200 --events 5000
+    python benchmark.py --mode api --users 50 --mix "Paycell=0.7,BiP=0.3"
+    python benchmark.py --mode batch --batch-size 500 --events 20000
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Event templates per service: (event_type, unit, value range, meta choices)
+SERVICE_EVENTS = {
+    "Paycell": [
+        ("TRANSFER", "TRY", (10, 50000), [{"merchant": m} for m in ["CryptoExchange", "Market", "Clothing", "OnlineStore"]]),
+        ("PAYMENT", "TRY", (10, 5000), [{"merchant": m} for m in ["GasStation", "Pharmacy", "Restaurant"]]),
+    ],
+    "BiP": [
+        ("MESSAGE", "count", (1, 300), [{"device_status": "known"}, {"device_status": "new", "ip_risk": "high"}]),
+        ("LOGIN", "count", (1, 5), [{"device_status": "new", "ip_risk": "medium"}, {"device_status": "known"}]),
+    ],
+    "TV+": [
+        ("STREAM", "Minutes", (1, 600), [{"watch_type": "STREAM"}, {"watch_type": "ACCOUNT_SHARE"}]),
+    ],
+    "Superonline": [
+        ("BANDWIDTH_SPIKE", "Mbps", (1, 2000), [{}]),
+        ("PORT_SCAN", "count", (1, 500), [{}]),
+    ],
+}
+
+ACTIONS = ["BLOCK", "TEMP_BLOCK", "OPEN_FRAUD_CASE", "FORCE_2FA", "RATE_LIMIT", "ALERT", "MONITOR"]
+FEATURES = {"Paycell": "amount", "BiP": "count", "TV+": "duration", "Superonline": "bandwidth"}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SERVICE_EVENTS:
+            raise SystemExit(f"Unknown service in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def generate_rules(count, rng):
+    """Synthetic rule set: thresholds, event-type pinned rules, velocity and shared rules."""
+    rules = []
+    services = list(SERVICE_EVENTS)
+    for i in range(count):
+        service = services[i % len(services)]
+        event_type, _, (low, high), _ = rng.choice(SERVICE_EVENTS[service])
+        threshold = rng.randint(low, high)
+        kind = i % 5
+        if kind == 0:
+            condition = f"{service}.{FEATURES[service]} > {threshold}"
+        elif kind == 1:
+            condition = f"{service}.{FEATURES[service]} > {threshold} AND event_type == '{event_type}'"
+        elif kind == 2:
+            condition = f"{service}.count_10m > {rng.randint(3, 20)}"
+        elif kind == 3:
+            condition = f"value > {threshold} AND service == '{service}'"
+        else:
+            condition = f"{service}.merchant == 'CryptoExchange' OR {service}.ip_risk == 'high'"
+        rules.append({
+            "rule_id": f"BENCH-{i:04d}",
+            "condition": condition,
+            "action": rng.choice(ACTIONS),
+            "priority": rng.randint(1, 5),
+            "is_active": 1,
+            "signal": f"Bench Signal {i % 25}",
+            "risk_score": rng.randint(0, 15),
+        })
+    return rules
+
+
+def generate_events(count, users, mix, rng):
+    services = list(mix)
+    weights = [mix[s] for s in services]
+    now = datetime.datetime.now()
+    for i in range(count):
+        service = rng.choices(services, weights)[0]
+        event_type, unit, (low, high), metas = rng.choice(SERVICE_EVENTS[service])
+        yield {
+            "event_id": f"BENCH-EV-{i}-{uuid.uuid4().hex[:8]}",
+            "user_id": f"U{rng.randint(1, users)}",
+            "service": service,
+            "event_type": event_type,
+            "value": float(rng.randint(low, high)),
+            "unit": unit,
+            "meta": json.dumps(rng.choice(metas)),
+            "timestamp": (now + datetime.timedelta(milliseconds=i)).isoformat(),
+        }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def report(mode, latencies, elapsed, processed, timings, decisions):
+    latencies.sort()
+    print(f"\n=== {mode} benchmark ===")
+    print(f"events processed : {processed}")
+    print(f"decisions        : {decisions}")
+    print(f"wall time        : {elapsed:.3f} s")
+    print(f"throughput       : {processed / elapsed if elapsed else 0:,.0f} events/s")
+    unit = "batch" if mode == "batch" else "event"
+    print(f"latency per {unit:<5}: p50 {percentile(latencies, 50) * 1000:.3f} ms | "
+          f"p95 {percentile(latencies, 95) * 1000:.3f} ms | p99 {percentile(latencies, 99) * 1000:.3f} ms | "
+          f"max {latencies[-1] * 1000 if latencies else 0:.3f} ms")
+    if timings:
+        total = sum(timings.values()) or 1.0
+        print("stage breakdown (per event):")
+        for stage, seconds in sorted(timings.items(), key=lambda x: -x[1]):
+            print(f"  {stage:<13} {seconds / processed * 1e6:10.1f} us  {seconds / total * 100:5.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrustShield rule engine benchmark")
+    parser.add_argument("--mode", choices=["engine", "api", "batch"], default="engine",
+                        help="engine: RuleEngine.evaluate; api: POST /events writer path (ingest_event); batch: POST /events/batch writer path (ingest_batch)")
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500, help="distinct user_id cardinality")
+    parser.add_argument("--mix", default="Paycell=0.4,BiP=0.3,TV+=0.15,Superonline=0.15")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=100, help="events evaluated before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--show-output", action="store_true", help="keep engine prints and deliver notifications to the BiP mock")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+
+    # The backend resolves its SQLite path relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="trustshield-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    from backend import crud, main as api, models, schemas
+    from backend.database import SessionLocal
+    from backend.rule_registry import rule_registry
+    from backend.notifications import MemorySink, notification_dispatcher
+
+    if not args.show_output:
+        # Notifications are delivered by a background thread: keep them off stdout
+        notification_dispatcher.register_channel(MemorySink(), use=True)
+
+    db = SessionLocal()
+    db.bulk_insert_mappings(models.RiskRule, generate_rules(args.rules, rng))
+    db.commit()
+    rule_registry.invalidate()
+
+    events = [schemas.EventCreate(**e) for e in generate_events(args.warmup + args.events, args.users, mix, rng)]
+    warmup, events = events[:args.warmup], events[args.warmup:]
+
+    sink = contextlib.nullcontext() if args.show_output else contextlib.redirect_stdout(open(os.devnull, "w"))
+    latencies = []
+    timings = {}
+    decisions = 0
+
+    with sink:
+        for event in warmup:
+            api.ingest_event(db, event)
+
+        decisions_before = db.query(models.Decision).count()
+        started = time.perf_counter()
+        if args.mode == "engine":
+            for event in events:
+                t0 = time.perf_counter()
+                db_event = crud.create_event(db, event)
+                t1 = time.perf_counter()
+                if api.rule_engine.evaluate(db, db_event, timings=timings) is not None:
+                    decisions += 1
+                latencies.append(time.perf_counter() - t0)
+                timings["insert_event"] = timings.get("insert_event", 0.0) + (t1 - t0)
+        elif args.mode == "api":
+            for event in events:
+                t0 = time.perf_counter()
+                api.ingest_event(db, event)
+                latencies.append(time.perf_counter() - t0)
+        else:
+            for i in range(0, len(events), args.batch_size):
+                chunk = events[i:i + args.batch_size]
+                t0 = time.perf_counter()
+                summaries = api.ingest_batch(db, chunk)
+                latencies.append(time.perf_counter() - t0)
+                decisions += sum(1 for s in summaries if s.decision_id)
+        elapsed = time.perf_counter() - started
+
+    if args.mode == "api":
+        decisions = db.query(models.Decision).count() - decisions_before
+    report(args.mode, latencies, elapsed, len(events), timings, decisions)
+    db.close()
+    print(f"\ntemp database: {os.path.join(workdir, 'trustshield.db')}")
+
+
+if __name__ == "__main__":
+    main()
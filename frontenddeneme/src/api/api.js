@@ -12,17 +12,20 @@ export const getRiskProfiles = (riskLevel = null) => {
     if (riskLevel) url += `?risk_level=${encodeURIComponent(riskLevel)}`;
     return axiosClient.get(url);
 };
-export const getEvents = (skip = 0, limit = 100, startTime = null, service = null, sortBy = null, userId = null) => {
+// `after` is the X-Next-Cursor header of the previous page (keyset pagination)
+export const getEvents = (skip = 0, limit = 100, startTime = null, service = null, sortBy = null, userId = null, after = null) => {
     let url = `/events?skip=${skip}&limit=${limit}`;
     if (startTime) url += `&start_time=${encodeURIComponent(startTime)}`;
     if (service) url += `&service=${encodeURIComponent(service)}`;
     if (sortBy) url += `&sort_by=${encodeURIComponent(sortBy)}`;
     if (userId) url += `&user_id=${encodeURIComponent(userId)}`;
+    if (after) url += `&after=${encodeURIComponent(after)}`;
     return axiosClient.get(url);
 };
-export const getDecisions = (skip = 0, limit = 100, action = null, userId = null) => {
+export const getDecisions = (skip = 0, limit = 100, action = null, userId = null, after = null) => {
     let url = `/decisions?skip=${skip}&limit=${limit}`;
     if (action) url += `&action=${encodeURIComponent(action)}`;
     if (userId) url += `&user_id=${encodeURIComponent(userId)}`;
+    if (after) url += `&after=${encodeURIComponent(after)}`;
     return axiosClient.get(url);
 };
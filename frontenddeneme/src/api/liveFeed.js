@@ -0,0 +1,22 @@
+import axiosClient from './axiosClient';
+
+// Opens the server-push feed (/stream). The browser's EventSource reconnects on its own
+// and sends Last-Event-ID, so the backend resumes from where the connection dropped.
+// Returns a function that closes the stream.
+export const subscribeLiveFeed = ({ onSummary, onEvent, onDecision, onReset } = {}) => {
+    const token = localStorage.getItem('token');
+    const url = `${axiosClient.defaults.baseURL}/stream?access_token=${encodeURIComponent(token || '')}`;
+    const source = new EventSource(url);
+
+    const listen = (name, handler) => {
+        if (!handler) return;
+        source.addEventListener(name, (msg) => handler(JSON.parse(msg.data)));
+    };
+
+    listen('summary', onSummary);
+    listen('event', onEvent);
+    listen('decision', onDecision);
+    listen('reset', onReset);
+
+    return () => source.close();
+};
@@ -1,9 +1,19 @@
+// Sliding-window velocity features computed per user and service by the backend feature store
+const VELOCITY_FEATURES = [
+    { name: 'Events in last 10 min', key: 'count_10m', type: 'numeric' },
+    { name: 'Events in last 1 hour', key: 'count_1h', type: 'numeric' },
+    { name: 'Same-type events in last 10 min', key: 'type_count_10m', type: 'numeric' },
+    { name: 'Value sum in last 1 hour', key: 'sum_1h', type: 'numeric' }
+];
+
 export const RULE_SCHEMA = {
     Paycell: {
         features: [
             { name: 'Transaction Type', key: 'type', type: 'categorical', options: ['TRANSFER', 'PAYMENT', 'QR_PAYMENT', 'TOP_UP', 'WITHDRAWAL'] },
             { name: 'Amount', key: 'amount', type: 'numeric', unit: 'TRY' },
-            { name: 'Merchant', key: 'merchant', type: 'categorical', options: ['GamblingWebsite', 'CryptoExchange', 'GasStation', 'Pharmacy', 'Market', 'Clothing', 'OnlineStore', 'Restaurant'] }
+            { name: 'Merchant', key: 'merchant', type: 'categorical', options: ['GamblingWebsite', 'CryptoExchange', 'GasStation', 'Pharmacy', 'Market', 'Clothing', 'OnlineStore', 'Restaurant'] },
+            { name: 'Distinct merchants in last 1 hour', key: 'distinct_merchants_1h', type: 'numeric' },
+            ...VELOCITY_FEATURES
         ]
     },
     BiP: {
@@ -11,21 +21,24 @@ export const RULE_SCHEMA = {
             { name: 'Event Type', key: 'event_type', type: 'categorical', options: ['MESSAGE', 'CALL', 'FILE_SHARE', 'GROUP_CREATE', 'LOGIN'] },
             { name: 'IP Risk Level', key: 'ip_risk', type: 'categorical', options: ['low', 'medium', 'high'] },
             { name: 'Device Status', key: 'device_status', type: 'categorical', options: ['new', 'known'] },
-            { name: 'Transaction Count', key: 'count', type: 'numeric' }
+            { name: 'Transaction Count', key: 'count', type: 'numeric' },
+            ...VELOCITY_FEATURES
         ]
     },
     'TV+': {
         features: [
             { name: 'Concurrent Streams', key: 'concurrent_streams', type: 'numeric', limit: { min: 1, max: 6 } },
             { name: 'Watch Type', key: 'watch_type', type: 'categorical', options: ['STREAM', 'DOWNLOAD', 'ACCOUNT_SHARE', 'PREMIUM_ACCESS'] },
-            { name: 'Duration', key: 'duration', type: 'numeric', unit: 'Minutes' }
+            { name: 'Duration', key: 'duration', type: 'numeric', unit: 'Minutes' },
+            ...VELOCITY_FEATURES
         ]
     },
     Superonline: {
         features: [
             { name: 'Traffic Type', key: 'traffic_type', type: 'categorical', options: ['PORT_SCAN', 'DNS_QUERY', 'BANDWIDTH_SPIKE', 'CONNECTION'] },
             { name: 'Bandwidth', key: 'bandwidth', type: 'numeric', unit: 'Mbps' },
-            { name: 'Data Amount', key: 'data_amount', type: 'numeric', unit: 'MB' }
+            { name: 'Data Amount', key: 'data_amount', type: 'numeric', unit: 'MB' },
+            ...VELOCITY_FEATURES
         ]
     }
 };
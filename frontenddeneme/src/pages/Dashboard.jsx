@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { getDashboardSummary, getEvents } from '../api/api';
+import { subscribeLiveFeed } from '../api/liveFeed';
 import { Activity, Shield, AlertTriangle, Users, Clock } from 'lucide-react';
 import {
     AreaChart, Area, BarChart, Bar, PieChart, Pie, Cell,
@@ -24,10 +25,13 @@ const Dashboard = () => {
             }
         };
 
-        fetchStats(); // Initial fetch
-        const interval = setInterval(fetchStats, 5000); // Poll every 5s
+        fetchStats(); // Initial snapshot, then live summaries pushed by the server
+        const unsubscribe = subscribeLiveFeed({
+            onSummary: (summary) => setStats(summary),
+            onReset: fetchStats,
+        });
 
-        return () => clearInterval(interval);
+        return () => unsubscribe();
     }, []);
 
     if (loading) return <div className="p-10 text-center text-blue-600 font-semibold">Loading TrustShield Dashboard...</div>;
@@ -230,8 +234,26 @@ const RecentTransactions = () => {
 
         setLoading(true);
         fetchEvents();
-        const interval = setInterval(fetchEvents, 5000);
-        return () => clearInterval(interval);
+
+        // Newest-first lists are patched in place from the live feed; other
+        // sort orders refetch, at most once per 5s burst
+        let refetchTimer = null;
+        const unsubscribe = subscribeLiveFeed({
+            onEvent: (evt) => {
+                if (serviceFilter !== 'ALL' && (evt.service || '').toUpperCase() !== serviceFilter) return;
+                if (sortFilter === 'timestamp_desc') {
+                    setEvents((prev) => [evt, ...prev.filter((e) => e.event_id !== evt.event_id)].slice(0, 50));
+                } else if (!refetchTimer) {
+                    refetchTimer = setTimeout(() => { refetchTimer = null; fetchEvents(); }, 5000);
+                }
+            },
+            onReset: fetchEvents,
+        });
+
+        return () => {
+            unsubscribe();
+            if (refetchTimer) clearTimeout(refetchTimer);
+        };
     }, [timeFilter, serviceFilter, sortFilter]);
 
     return (
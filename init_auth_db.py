@@ -1,8 +1,8 @@
 from backend.database import SessionLocal, engine
-from backend import models, auth
+from backend import models, auth, migrations
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+# Create tables / apply pending migrations
+migrations.upgrade(engine)
 
 db = SessionLocal()
 
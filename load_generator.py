@@ -0,0 +1,201 @@
+"""
+High-throughput load generator for the TrustShield ingest API.
+
+Either replays a recorded trace (CSV in the csv/trustshield_events.csv
+layout) with time compression, or synthesizes a service mix at a target
+rate. Uses an async HTTP client with a pooled connection set and a fixed
+number of concurrent senders. Requires httpx (pip install httpx).
+
+    python load_generator.py --replay csv/trustshield_events.csv --speed 600
+    python load_generator.py --rate 2000 --duration 30 --concurrency 200
+    python load_generator.py --rate 5000 --duration 10 --batch-size 100
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import random
+import time
+import uuid
+
+from benchmark import generate_events, parse_mix
+
+DEFAULT_URL = "http://localhost:8000"
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def parse_meta(raw):
+    """Trace files store meta as 'k=v;k2=v2'; the API expects a JSON object."""
+    if not raw:
+        return None
+    if raw.lstrip().startswith("{"):
+        return raw
+    pairs = dict(part.split("=", 1) for part in raw.split(";") if "=" in part)
+    return json.dumps(pairs) if pairs else None
+
+
+def parse_time(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def replay_schedule(path, speed, fresh_ids):
+    """Yields (offset_seconds, event) pairs from a CSV trace, compressed by `speed`."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    rows.sort(key=lambda r: r["timestamp"])
+    if not rows:
+        return
+    origin = parse_time(rows[0]["timestamp"])
+    for row in rows:
+        offset = (parse_time(row["timestamp"]) - origin).total_seconds() / speed
+        event = {
+            "event_id": f"{row['event_id']}-{uuid.uuid4().hex[:8]}" if fresh_ids else row["event_id"],
+            "user_id": row["user_id"],
+            "service": row["service"],
+            "event_type": row["event_type"],
+            "value": float(row["value"]) if row.get("value") else None,
+            "unit": row.get("unit") or None,
+            "meta": parse_meta(row.get("meta")),
+            "timestamp": row["timestamp"],
+        }
+        yield offset, event
+
+
+def synthetic_schedule(rate, duration, users, mix, seed):
+    rng = random.Random(seed)
+    total = int(rate * duration)
+    for i, event in enumerate(generate_events(total, users, mix, rng)):
+        yield i / rate, event
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.errors = {}
+        self.latencies = []
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def record(self, events, latency, status):
+        self.sent += events
+        if status is not None and 200 <= status < 300:
+            self.ok += events
+        else:
+            key = str(status) if status is not None else "connection_error"
+            self.errors[key] = self.errors.get(key, 0) + events
+        self.latencies.append(latency)
+        ms = latency * 1000
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def report(self, elapsed):
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(round(p / 100.0 * (len(lat) - 1))))] * 1000 if lat else 0.0
+
+        failed = self.sent - self.ok
+        print("\n=== load summary ===")
+        print(f"events sent     : {self.sent}")
+        print(f"wall time       : {elapsed:.2f} s")
+        print(f"achieved rate   : {self.sent / elapsed if elapsed else 0:,.0f} events/s")
+        print(f"error rate      : {failed / self.sent * 100 if self.sent else 0:.2f}% {self.errors or ''}")
+        print(f"request latency : p50 {pct(50):.1f} ms | p95 {pct(95):.1f} ms | p99 {pct(99):.1f} ms | max {pct(100):.1f} ms")
+        print("latency histogram:")
+        bounds = [f"<= {b} ms" for b in HISTOGRAM_BUCKETS_MS] + [f"> {HISTOGRAM_BUCKETS_MS[-1]} ms"]
+        peak = max(self.histogram) or 1
+        for label, count in zip(bounds, self.histogram):
+            print(f"  {label:>11} {count:8d} {'#' * int(40 * count / peak)}")
+
+
+async def run(args, schedule):
+    import httpx
+
+    stats = Stats()
+    queue = asyncio.Queue(maxsize=args.concurrency * 4)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    endpoint = "/events/batch" if args.batch_size > 1 else "/events"
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+
+        async def producer():
+            batch, batch_offset = [], 0.0
+            for offset, event in schedule:
+                if not args.keep_timestamps:
+                    event["timestamp"] = None # Stamped at send time
+                if args.batch_size > 1:
+                    if not batch:
+                        batch_offset = offset
+                    batch.append(event)
+                    if len(batch) >= args.batch_size:
+                        await queue.put((batch_offset, batch))
+                        batch = []
+                else:
+                    await queue.put((offset, event))
+            if batch:
+                await queue.put((batch_offset, batch))
+            for _ in range(args.concurrency):
+                await queue.put(None)
+
+        async def sender():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                offset, payload = item
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                events = payload if isinstance(payload, list) else [payload]
+                now = datetime.datetime.now().isoformat()
+                for event in events:
+                    if event["timestamp"] is None:
+                        event["timestamp"] = now
+                t0 = time.perf_counter()
+                try:
+                    response = await client.post(endpoint, json=payload)
+                    code = response.status_code
+                except httpx.HTTPError:
+                    code = None
+                stats.record(len(events), time.perf_counter() - t0, code)
+
+        await asyncio.gather(producer(), *(sender() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    stats.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrustShield load generator / trace replay")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--replay", help="CSV trace to replay (event_id,user_id,service,...,timestamp)")
+    parser.add_argument("--speed", type=float, default=60.0, help="replay time compression factor")
+    parser.add_argument("--keep-ids", action="store_true", help="replay original event_id values")
+    parser.add_argument("--keep-timestamps", action="store_true", help="send trace/synthetic timestamps instead of send time")
+    parser.add_argument("--rate", type=float, default=100.0, help="synthetic events per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="synthetic run length in seconds")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mix", default="Paycell=0.4,BiP=0.3,TV+=0.15,Superonline=0.15")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent in-flight requests")
+    parser.add_argument("--batch-size", type=int, default=1, help=">1 posts to /events/batch")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.replay:
+        schedule = replay_schedule(args.replay, args.speed, fresh_ids=not args.keep_ids)
+    else:
+        schedule = synthetic_schedule(args.rate, args.duration, args.users, parse_mix(args.mix), args.seed)
+
+    asyncio.run(run(args, schedule))
+
+
+if __name__ == "__main__":
+    main()
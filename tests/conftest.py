@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+# Point the backend at a throw-away database before it is imported
+_DB_DIR = tempfile.mkdtemp(prefix="trustshield-tests-")
+os.environ.setdefault("TRUSTSHIELD_DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}")
+os.environ.setdefault("TRUSTSHIELD_NOTIFY_CHANNEL", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from backend import migrations
+from backend.dashboard_stats import dashboard_counters
+from backend.database import SessionLocal, engine
+from backend.profile_store import profile_store
+from backend.rule_registry import rule_registry
+
+
+@pytest.fixture
+def db():
+    """A session on an empty database at the latest schema version."""
+    # Profiles left by earlier tests go to the old tables, then out of the cache
+    profile_store.flush()
+    migrations.reset_schema(engine)
+    profile_store.invalidate()
+    rule_registry.invalidate()
+    dashboard_counters.invalidate()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
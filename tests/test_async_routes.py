@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend import auth, crud, main, models, schemas
+
+
+def _event(user_id, value=500):
+    return {
+        "event_id": f"E-{uuid.uuid4().hex}",
+        "user_id": user_id,
+        "service": "Paycell",
+        "event_type": "TRANSFER",
+        "value": value,
+        "unit": "TRY",
+        "meta": None,
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(
+        rule_id="R1", condition="Paycell.amount > 1000", action="ALERT", priority=1, is_active=True,
+    ))
+    db.add(models.Account(email="analyst@x", hashed_password=auth.get_password_hash("p"), full_name="A", role="USER"))
+    db.commit()
+    # Give the single writer connection back to the API
+    db.close()
+
+    def no_run_sync(*args, **kwargs):
+        raise AssertionError("async routes must await their statements, not wrap sync code")
+    monkeypatch.setattr(AsyncSession, "run_sync", no_run_sync)
+
+    # The writer is only ever opened off the event loop, in the threadpool
+    session_local = main.SessionLocal
+    def writer_session():
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return session_local()
+    monkeypatch.setattr(main, "SessionLocal", writer_session)
+
+    token = auth.create_access_token({"sub": "analyst@x", "role": "USER"})
+    return TestClient(main.app, headers={"Authorization": f"Bearer {token}"})
+
+
+def test_ingest_hands_writes_to_the_writer(client):
+    user_id = f"U-{uuid.uuid4().hex}"
+    event = _event(user_id, value=5000)
+    created = client.post("/events", json=event)
+    assert created.status_code == 200
+    assert created.json()["event_id"] == event["event_id"]
+
+    batch = [_event(user_id), _event(user_id, value=5000)]
+    summaries = client.post("/events/batch", json=batch).json()
+    assert [s["triggered_rules"] for s in summaries] == [None, "R1"]
+
+    status = client.get(f"/events/{event['event_id']}/decision").json()
+    assert status["status"] == "DECIDED"
+    assert status["decision"]["triggered_rules"] == "R1"
+
+
+def test_async_reads_match_the_sync_queries(client, db):
+    user_id = f"U-{uuid.uuid4().hex}"
+    client.post("/events/batch", json=[_event(user_id), _event(user_id, value=5000), _event(user_id, value=7000)])
+
+    events = client.get("/events", params={"user_id": user_id, "limit": 2})
+    decisions = client.get("/decisions", params={"user_id": user_id})
+    cases = client.get("/fraud-cases", params={"user_id": user_id}).json()
+    assert client.get("/decisions", params={"action": "NOPE"}).json() == []
+    assert client.get("/events", params={"after": "bad"}).status_code == 400
+    assert client.get(f"/events/E-{uuid.uuid4().hex}/decision").status_code == 404
+
+    assert [e["event_id"] for e in events.json()] == [e.event_id for e in crud.get_events(db, user_id=user_id, limit=2)]
+    assert events.headers["X-Next-Cursor"]
+    assert [d["decision_id"] for d in decisions.json()] == [d.decision_id for d in crud.get_decisions(db, user_id=user_id)]
+    assert [c["case_id"] for c in cases] == [c.case_id for c in crud.get_fraud_cases(db, user_id=user_id)]
+    assert [r["rule_id"] for r in client.get("/risk-rules").json()] == ["R1"]
@@ -0,0 +1,27 @@
+from backend import crud, models, schemas
+
+
+def _event(event_id, timestamp):
+    return schemas.EventCreate(
+        event_id=event_id, user_id="U1", service="paycell", event_type="TRANSFER", value=500,
+        unit="TRY", meta=None, timestamp=timestamp,
+    )
+
+
+def test_batch_events_match_single_ingest_payloads(db):
+    for timestamp in ("2025-01-31T12:15:00+03:00", "2025-01-31T09:15:00Z", "1738314900000"):
+        single = crud.create_event(db, _event("single", timestamp))
+        batched, = crud.create_events_bulk(db, [_event("batched", timestamp)])
+        db.commit()
+        payloads = [schemas.Event.model_validate(e).model_dump() for e in (single, batched)]
+        assert payloads[0] == {**payloads[1], "event_id": "single"}
+        assert payloads[1]["timestamp"] == "2025-01-31T09:15:00.000Z"
+        db.query(models.Event).delete()
+        db.commit()
+
+
+def test_batch_insert_stores_the_event_day(db):
+    crud.create_events_bulk(db, [_event("E1", "2025-01-31T09:15:00Z")])
+    db.commit()
+    stored = db.query(models.Event).one()
+    assert (stored.timestamp, stored.event_day) == ("2025-01-31T09:15:00.000Z", 20119)
@@ -0,0 +1,33 @@
+import datetime
+import json
+
+from backend import crud, schemas
+from backend.feature_store import DatabaseWindowStore, SlidingWindowStore
+
+
+def _event(i, service="Paycell", event_type="TRANSFER", minutes_ago=0, merchant=None, user_id="U1"):
+    timestamp = datetime.datetime.now() - datetime.timedelta(minutes=minutes_ago)
+    return schemas.EventCreate(
+        event_id=f"E{i}", user_id=user_id, service=service, event_type=event_type, value=10 * (i + 1), unit="TRY",
+        meta=json.dumps({"merchant": merchant}) if merchant else None, timestamp=timestamp.isoformat(),
+    )
+
+
+def test_database_windows_match_in_memory_windows(db):
+    history = [
+        _event(0, minutes_ago=90, merchant="A"),
+        _event(1, minutes_ago=30, merchant="B"),
+        _event(2, event_type="PAYMENT", minutes_ago=8, merchant="A"),
+        _event(3, minutes_ago=5, merchant="C"),
+        _event(4, service="BiP", minutes_ago=2),
+        _event(5, user_id="U2", minutes_ago=1),
+        _event(6, minutes_ago=0, merchant="B"),
+    ]
+    memory = SlidingWindowStore()
+    for event in history:
+        stored = crud.create_event(db, event)
+        expected = memory.observe(stored)
+
+    # Every worker process sees the same stored events
+    assert DatabaseWindowStore().observe(stored, db) == expected
+    assert (expected["count_1h"], expected["type_count_1h"], expected["distinct_merchants_1h"]) == (4, 3, 3)
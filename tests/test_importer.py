@@ -0,0 +1,68 @@
+import csv
+
+import pytest
+
+from backend import importer, models
+from backend.database import engine
+
+EVENT_COLUMNS = ["event_id", "user_id", "service", "event_type", "value", "unit", "timestamp"]
+
+
+@pytest.fixture
+def folder(db, tmp_path):
+    importer.reset(engine)
+    _write(tmp_path / "users.csv", ["user_id", "name"], [["U1", "One"]])
+    return tmp_path
+
+
+def _write(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def _events(values, service="Paycell"):
+    return [
+        [f"E{i}", "U1", service, "TRANSFER", value, "TRY", f"2025-01-01T10:00:0{i}"]
+        for i, value in enumerate(values)
+    ]
+
+
+def _checkpoint(table_name):
+    with engine.connect() as conn:
+        return conn.execute(
+            importer.import_checkpoints.select().where(importer.import_checkpoints.c.table_name == table_name)
+        ).first()
+
+
+def test_import_normalizes_service(db, folder):
+    _write(folder / "events.csv", EVENT_COLUMNS, _events([1, 2], service=" PAYCELL "))
+    assert importer.import_folder(engine, str(folder), chunk_size=2) == {"users": 1, "events": 2}
+    assert {s for (s,) in db.query(models.Event.service)} == {"Paycell"}
+
+
+def test_failed_import_resumes_after_last_committed_chunk(db, folder):
+    _write(folder / "events.csv", EVENT_COLUMNS, _events([1, 2, 3, "bad", 5]))
+    with pytest.raises(ValueError):
+        importer.import_folder(engine, str(folder), chunk_size=2)
+    checkpoint = _checkpoint("events")
+    assert (checkpoint.rows_loaded, checkpoint.last_key, checkpoint.completed) == (2, "E1", 0)
+
+    # Rows after the checkpoint may be fixed before the rerun
+    _write(folder / "events.csv", EVENT_COLUMNS, _events([1, 2, 3, 4, 5]))
+    assert importer.import_folder(engine, str(folder), chunk_size=2) == {"users": 0, "events": 3}
+    assert _checkpoint("events").completed == 1
+    assert db.query(models.Event).count() == 5
+
+
+def test_resume_refuses_a_source_whose_imported_rows_moved(db, folder):
+    _write(folder / "events.csv", EVENT_COLUMNS, _events([1, 2, "bad", 4]))
+    with pytest.raises(ValueError):
+        importer.import_folder(engine, str(folder), chunk_size=2)
+
+    rows = _events([1, 2, 3, 4])
+    rows.insert(0, ["E9", "U1", "Paycell", "TRANSFER", 9, "TRY", "2025-01-01T09:00:00"])
+    _write(folder / "events.csv", EVENT_COLUMNS, rows)
+    with pytest.raises(importer.SourceChanged):
+        importer.import_folder(engine, str(folder), chunk_size=2)
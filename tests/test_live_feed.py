@@ -0,0 +1,51 @@
+import datetime
+import json
+import uuid
+
+from sqlalchemy import event as sa_event
+
+from backend import crud, models, schemas
+from backend.database import engine
+from backend.engine import RuleEngine
+from backend.live_feed import live_feed
+
+
+def _event(user_id):
+    return schemas.EventCreate(
+        event_id=f"E-{uuid.uuid4().hex}", user_id=user_id, service="Paycell", event_type="TRANSFER", value=500,
+        unit="TRY", meta=None, timestamp=datetime.datetime.now().isoformat(),
+    )
+
+
+def test_publishing_does_not_touch_the_writer(db, monkeypatch):
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(
+        rule_id="R1", condition="Paycell.amount > 100", action="ALERT", priority=1, is_active=True,
+    ))
+    db.commit()
+    monkeypatch.setattr(live_feed, "summary_interval", 0)
+
+    # Statements sent through the writer while the live feed is published
+    publishing, on_writer = [], []
+    def record(conn, cursor, statement, *args):
+        if publishing:
+            on_writer.append(statement)
+    publish_live = RuleEngine._publish_live
+    def tracked(self, *args):
+        publishing.append(True)
+        try:
+            publish_live(self, *args)
+        finally:
+            publishing.clear()
+    monkeypatch.setattr(RuleEngine, "_publish_live", tracked)
+    sa_event.listen(engine, "before_cursor_execute", record)
+    cursor = live_feed.cursor
+    try:
+        decision, = RuleEngine().evaluate_batch(db, crud.create_events_bulk(db, [_event(f"U-{uuid.uuid4().hex}")]))
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", record)
+    assert on_writer == []
+
+    messages, _, _ = live_feed.read_after(cursor)
+    published = {kind: json.loads(data) for _, kind, data in messages}
+    assert published["decision"] == schemas.Decision.model_validate(decision).model_dump()
+    assert published["summary"]["total_events"] == db.query(models.Event).count()
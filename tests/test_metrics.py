@@ -0,0 +1,36 @@
+import threading
+
+from backend.metrics import Counter
+
+
+class _CountingLock:
+    def __init__(self):
+        self.acquired = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.acquired += 1
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self._lock.__exit__(*exc)
+
+
+def test_labels_resolve_to_one_child_per_rendered_value():
+    counter = Counter("test_hits", "Hits", ["rule_id"])
+    child = counter.labels(7)
+    assert counter.labels(7) is child
+    assert counter.labels("7") is child
+
+    counter.labels(7).inc()
+    counter.labels("7").inc()
+    assert list(counter._samples()) == ['test_hits_total{rule_id="7"} 2']
+
+
+def test_existing_child_is_found_without_the_lock():
+    counter = Counter("test_hits", "Hits", ["rule_id"])
+    counter.labels(7)
+    counter._lock = _CountingLock()
+    counter.labels(7)
+    counter.labels("7")
+    assert counter._lock.acquired == 0
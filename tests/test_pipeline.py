@@ -0,0 +1,110 @@
+import datetime
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import crud, main, models, pipeline, schemas
+from backend.engine import RuleEngine
+
+
+def _event(user_id="U1", value=500):
+    return {
+        "event_id": f"E-{uuid.uuid4().hex}",
+        "user_id": user_id,
+        "service": "Paycell",
+        "event_type": "TRANSFER",
+        "value": value,
+        "unit": "TRY",
+        "meta": None,
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+
+
+@pytest.fixture
+def idle_pipeline(db, monkeypatch):
+    # No workers: accepted events stay queued
+    idle = pipeline.DecisionPipeline(main.rule_engine, workers=0, max_queue=10)
+    monkeypatch.setattr(main, "decision_pipeline", idle)
+    return idle
+
+
+def _stored(db, event_id):
+    counts = (
+        db.query(models.Event).filter(models.Event.event_id == event_id).count(),
+        db.query(models.PendingEvent).filter(models.PendingEvent.event_id == event_id).count(),
+    )
+    # Give the single writer connection back to the API
+    db.close()
+    return counts
+
+
+def test_async_ingest_stores_event_with_pending_marker(db, idle_pipeline):
+    event = _event()
+    response = TestClient(main.app).post("/events/async", json=event)
+    assert response.status_code == 202
+    assert response.json()["status"] == pipeline.PENDING
+    assert _stored(db, event["event_id"]) == (1, 1)
+
+
+def test_rejected_submit_withdraws_event_so_retry_is_accepted(db, idle_pipeline, monkeypatch):
+    client = TestClient(main.app)
+    event = _event()
+    monkeypatch.setattr(idle_pipeline, "submit", lambda event_id: False)
+    assert client.post("/events/async", json=event).status_code == 429
+    assert _stored(db, event["event_id"]) == (0, 0)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(main, "decision_pipeline", idle_pipeline)
+    assert client.post("/events/async", json=event).status_code == 202
+    assert _stored(db, event["event_id"]) == (1, 1)
+
+
+def test_retry_of_pending_event_is_accepted(db, idle_pipeline):
+    client = TestClient(main.app)
+    event = _event()
+    assert client.post("/events/async", json=event).status_code == 202
+    retry = client.post("/events/async", json=event)
+    assert retry.status_code == 202
+    assert retry.json() == {"event_id": event["event_id"], "status": pipeline.PENDING, "decision": None}
+    assert _stored(db, event["event_id"]) == (1, 1)
+
+
+def test_duplicate_of_evaluated_event_conflicts(db, idle_pipeline):
+    event = _event()
+    crud.create_event(db, schemas.EventCreate(**event))
+    db.close()
+    assert TestClient(main.app).post("/events/async", json=event).status_code == 409
+
+
+def test_recover_evaluates_events_left_pending(db):
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(
+        rule_id="R1", condition="Paycell.amount > 100", action="ALERT", priority=1, is_active=True,
+    ))
+    high = crud.create_event(db, schemas.EventCreate(**_event(value=500)), queue_for_decision=True).event_id
+    low = crud.create_event(db, schemas.EventCreate(**_event(value=5)), queue_for_decision=True).event_id
+    db.close()
+
+    recovering = pipeline.DecisionPipeline(RuleEngine(), workers=1)
+    recovering.recover().join(5)
+    recovering.stop()
+
+    assert recovering.status(high) == pipeline.DECIDED
+    assert recovering.status(low) == pipeline.NO_DECISION
+    assert db.query(models.PendingEvent).count() == 0
+    assert crud.get_decision_by_event(db, high).triggered_rules == "R1"
+
+
+def test_event_claimed_elsewhere_is_not_evaluated_twice(db):
+    event_id = crud.create_event(db, schemas.EventCreate(**_event()), queue_for_decision=True).event_id
+    db.close()
+    first = pipeline.DecisionPipeline(RuleEngine(), workers=1)
+    first.submit(event_id)
+    first.stop()
+    # A second process replaying the same backlog finds the marker gone
+    second = pipeline.DecisionPipeline(RuleEngine(), workers=1)
+    second.submit(event_id)
+    second.stop()
+
+    assert first.status(event_id) == pipeline.NO_DECISION
+    assert second.status(event_id) is None
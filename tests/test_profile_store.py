@@ -0,0 +1,60 @@
+import datetime
+import uuid
+
+import pytest
+
+from backend import crud, models, schemas
+from backend.engine import RuleEngine
+from backend.profile_store import profile_store
+
+
+def _event(user_id):
+    return schemas.EventCreate(
+        event_id=f"E-{uuid.uuid4().hex}", user_id=user_id, service="Paycell", event_type="TRANSFER", value=500,
+        unit="TRY", meta=None, timestamp=datetime.datetime.now().isoformat(),
+    )
+
+
+def _rules(db):
+    for rule_id, condition in (("R1", "Paycell.amount > 100"), ("R2", "Paycell.count_10m >= 2")):
+        crud.create_risk_rule(db, schemas.RiskRuleCreate(
+            rule_id=rule_id, condition=condition, action="ALERT", priority=1, is_active=True,
+        ))
+        db.query(models.RiskRule).filter(models.RiskRule.rule_id == rule_id).update({"risk_score": 30, "signal": "S"})
+    db.commit()
+    crud.rule_registry.invalidate()
+
+
+def test_rolled_back_batch_leaves_no_profile_or_window_changes(db, monkeypatch):
+    _rules(db)
+    user_id = f"U-{uuid.uuid4().hex}"
+    event = _event(user_id)
+
+    def fail():
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(db, "commit", fail)
+    with pytest.raises(RuntimeError):
+        RuleEngine().evaluate_batch(db, crud.create_events_bulk(db, [event]))
+    monkeypatch.undo()
+    db.rollback()
+    assert user_id not in profile_store.unflushed()
+    assert crud.get_risk_profile(db, user_id) is None
+
+    # The retry is the user's first counted event: only R1 triggers
+    decision, = RuleEngine().evaluate_batch(db, crud.create_events_bulk(db, [event]))
+    assert decision.triggered_rules == "R1"
+    assert crud.get_risk_profile(db, user_id)["risk_score"] == 30
+
+
+def test_listing_includes_unflushed_profiles_without_flushing(db, monkeypatch):
+    _rules(db)
+    monkeypatch.setattr(profile_store, "flush", lambda: 0)
+    user_id = f"U-{uuid.uuid4().hex}"
+    RuleEngine().evaluate_batch(db, crud.create_events_bulk(db, [_event(user_id)]))
+
+    listed = {p["user_id"]: p for p in crud.get_risk_profiles(db, limit=1000)}
+    assert listed[user_id]["risk_score"] == 30
+    assert listed[user_id] == crud.get_risk_profile(db, user_id)
+    assert crud.get_risk_profiles(db, risk_level="MEDIUM", limit=1000)[0]["user_id"] == user_id
+    assert db.query(models.RiskProfile).filter(models.RiskProfile.user_id == user_id).count() == 0
@@ -0,0 +1,49 @@
+import time
+
+from backend import crud, schemas
+from backend.response_cache import response_cache
+from backend.rule_registry import RuleRegistry, read_version
+
+
+def _rule(condition="Paycell.amount > 100"):
+    return dict(condition=condition, action="ALERT", priority=1, is_active=True)
+
+
+def test_rule_changes_bump_shared_version(db):
+    assert read_version(db) == 0
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(rule_id="R1", **_rule()))
+    assert read_version(db) == 1
+    crud.update_risk_rule(db, "R1", schemas.RiskRuleBase(**_rule("Paycell.amount > 500")))
+    assert read_version(db) == 2
+    crud.delete_risk_rule(db, "R1")
+    assert read_version(db) == 3
+
+
+def test_second_registry_rebuilds_on_version_bump(db):
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(rule_id="R1", **_rule()))
+    # Stands in for another worker process: crud only invalidates the module registry
+    other = RuleRegistry(poll_seconds=0)
+    before = other.get_rule_set(db)
+    assert before.version == 1
+    assert before.by_id["R1"].condition == "Paycell.amount > 100"
+
+    response_cache.set("risk-rules", "listing", b"[]")
+    crud.update_risk_rule(db, "R1", schemas.RiskRuleBase(**_rule("Paycell.amount > 500")))
+    after = other.get_rule_set(db)
+    assert after.version == 2
+    assert after.by_id["R1"].condition == "Paycell.amount > 500"
+    # Its cached listings predate the change as well
+    assert response_cache.get("risk-rules", "listing") is None
+
+
+def test_second_registry_checks_version_once_per_poll_interval(db):
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(rule_id="R1", **_rule()))
+    other = RuleRegistry(poll_seconds=0.2)
+    assert other.get_rule_set(db).version == 1
+
+    crud.create_risk_rule(db, schemas.RiskRuleCreate(rule_id="R2", **_rule()))
+    assert other.get_rule_set(db).version == 1
+    time.sleep(0.25)
+    rule_set = other.get_rule_set(db)
+    assert rule_set.version == 2
+    assert set(rule_set.by_id) == {"R1", "R2"}
@@ -0,0 +1,71 @@
+import pytest
+
+from backend import crud, models
+from backend.scoring import (
+    MAX_RISK_SCORE, UNATTRIBUTED, ScoreModel, format_signal_scores, level_for_score, parse_half_lives, rescore_all,
+)
+from backend.timestamps import HOUR_MS, now_ms
+
+DAY_MS = 24 * HOUR_MS
+
+
+@pytest.mark.parametrize("score,level", [(0, "LOW"), (19, "LOW"), (20, "MEDIUM"), (49, "MEDIUM"),
+                                         (50, "HIGH"), (79, "HIGH"), (80, "CRITICAL"), (100, "CRITICAL")])
+def test_level_for_score(score, level):
+    assert level_for_score(score) == level
+
+
+def test_decay_halves_each_half_life_per_signal():
+    model = ScoreModel(default_half_life_hours=24, signal_half_lives={"Fast": 12})
+    decayed = model.decay({"Slow": 40.0, "Fast": 40.0}, 0, DAY_MS)
+    assert decayed == pytest.approx({"Slow": 20.0, "Fast": 10.0})
+
+
+def test_decay_drops_negligible_components_and_ignores_clock_skew():
+    model = ScoreModel(default_half_life_hours=1)
+    assert model.decay({"S": 1.0}, 0, 20 * HOUR_MS) == {}
+    assert model.decay({"S": 1.0}, DAY_MS, 0) == {"S": 1.0}
+    assert ScoreModel(default_half_life_hours=0).decay({"S": 5.0}, 0, DAY_MS) == {"S": 5.0}
+
+
+def test_cap_scales_components_to_the_maximum():
+    capped = ScoreModel.cap({"A": 150.0, "B": 50.0})
+    assert capped == pytest.approx({"A": 75.0, "B": 25.0})
+    assert ScoreModel.total(capped) == MAX_RISK_SCORE
+
+
+def test_row_components_of_legacy_and_current_rows():
+    model = ScoreModel()
+    assert model.row_components(42, None) == {UNATTRIBUTED: 42.0}
+    assert model.row_components(42, format_signal_scores({"S": 30.0, "T": 12.0})) == {"S": 30.0, "T": 12.0}
+    assert parse_half_lives("Suspicious Login=24, Account Sharing=720") == {"Suspicious Login": 24.0, "Account Sharing": 720.0}
+
+
+def _profile(user_id, score, level, age_ms):
+    return models.RiskProfile(
+        user_id=user_id, risk_score=score, risk_level=level, signals="S",
+        signal_scores=format_signal_scores({"S": float(score)}), updated_at=now_ms() - age_ms,
+    )
+
+
+def test_listing_filters_on_the_decayed_level(db):
+    # Stored HIGH a week (one default half-life) ago: decayed to MEDIUM now
+    db.add(_profile("A-decayed", 60, "HIGH", 7 * DAY_MS))
+    db.add(_profile("B-high", 60, "HIGH", 0))
+    db.add(_profile("C-low", 10, "LOW", 0))
+    db.commit()
+
+    assert [p["user_id"] for p in crud.get_risk_profiles(db, risk_level="HIGH", limit=1)] == ["B-high"]
+    medium = crud.get_risk_profiles(db, risk_level="medium")
+    assert [(p["user_id"], p["risk_score"]) for p in medium] == [("A-decayed", 30)]
+    assert [p["user_id"] for p in crud.get_risk_profiles(db)] == ["A-decayed", "B-high", "C-low"]
+
+
+def test_rescore_all_persists_decayed_levels(db):
+    db.add(_profile("A-decayed", 60, "HIGH", 7 * DAY_MS))
+    db.add(_profile("B-high", 60, "HIGH", 0))
+    db.commit()
+
+    assert rescore_all(db, batch_size=1) == (2, 1)
+    levels = dict(db.query(models.RiskProfile.user_id, models.RiskProfile.risk_level))
+    assert levels == {"A-decayed": "MEDIUM", "B-high": "HIGH"}
@@ -0,0 +1,107 @@
+import contextlib
+import io
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from backend import vectorized
+from backend.backtest import ReplayEvent
+from backend.context_builder import build_evaluation_context
+from backend.engine import match_rules
+from backend.feature_store import SlidingWindowStore
+from backend.rule_registry import RuleSet, compile_rule
+from backend.vectorized import BatchEvaluator, compile_vector
+
+CONDITIONS = [
+    "Paycell.amount > 20000",
+    "BiP.count > 100",
+    "merchant == 'CryptoExchange'",
+    "Paycell.merchant == 'CryptoExchange'",
+    "Paycell.amount > 10 AND event_type == 'TRANSFER'",
+    "Paycell.ip_risk == 'high' OR BiP.count > 50",
+    "BiP.ip_risk > 3 OR BiP.count > 50",
+    "service in ('BiP', 'TV+') and value >= 100",
+    "Paycell.count_10m > 2",
+    "Superonline.bandwidth > 1000 or Superonline.bandwidth < 5",
+    "Paycell.merchant not in ('Market', None)",
+    "BiP.device_status != 'new'",
+    "Paycell.amount > 100 and Paycell.amount < 1000",
+    "Paycell.mixed > 5",
+    "Paycell.mixed == 'a'",
+    "unit == None",
+    "BiP.flag == True",
+    "Paycell.amount * 2 > 100",
+]
+SERVICES = ["Paycell", "BiP", "Superonline", "TV+", None]
+
+
+def _rule_set(rng):
+    rows = [
+        SimpleNamespace(rule_id=f"R{i}", condition=condition, action=rng.choice(["BLOCK", "ALERT", "MONITOR", "FORCE_2FA"]),
+                        priority=1, signal=None, risk_score=5)
+        for i, condition in enumerate(CONDITIONS)
+    ]
+    return RuleSet(1, [compile_rule(row) for row in rows])
+
+
+def _events(rng, count):
+    events = []
+    for i in range(count):
+        meta = {}
+        if rng.random() < 0.5:
+            meta["merchant"] = rng.choice(["CryptoExchange", "Market", "X"])
+        if rng.random() < 0.3:
+            meta["ip_risk"] = rng.choice(["high", "low", 5])
+        if rng.random() < 0.3:
+            meta["device_status"] = rng.choice(["new", "known"])
+        if rng.random() < 0.2:
+            meta["flag"] = rng.choice([True, False, 1])
+        if rng.random() < 0.05:
+            # Mixed types in one column force that block onto the scalar path
+            meta["mixed"] = rng.choice(["a", 7, None])
+        events.append(ReplayEvent((
+            f"E{i}", f"U{rng.randint(1, 30)}", rng.choice(SERVICES), rng.choice(["TRANSFER", "PAYMENT", "MESSAGE"]),
+            rng.choice([None, rng.random() * 30000]), rng.choice([None, "TRY"]),
+            json.dumps(meta) if meta else None, f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z",
+        )))
+    return events
+
+
+def _both_paths(rule_set, events, block_size):
+    features = SlidingWindowStore()
+    contexts = [build_evaluation_context(event, features.observe(event)) for event in events]
+    # Rule errors are printed by the scalar path
+    with contextlib.redirect_stdout(io.StringIO()):
+        scalar = [match_rules(rule_set.candidates(e.service, e.event_type), c) for e, c in zip(events, contexts)]
+        evaluator = BatchEvaluator(rule_set)
+        batched = []
+        for start in range(0, len(events), block_size):
+            batched += evaluator.evaluate(events[start:start + block_size], contexts[start:start + block_size])
+    return scalar, batched
+
+
+def test_conditions_of_one_comparison_per_feature_are_vectorized():
+    rule_set = _rule_set(random.Random(1))
+    vectorized_ids = {rule.rule_id for rule in rule_set.rules if compile_vector(rule)}
+    assert {"R0", "R4", "R7", "R12"} <= vectorized_ids
+    # Arithmetic takes the scalar path
+    assert f"R{CONDITIONS.index('Paycell.amount * 2 > 100')}" not in vectorized_ids
+
+
+@pytest.mark.parametrize("seed,block_size", [(1, 500), (2, 64), (3, 1)])
+def test_batch_evaluation_matches_scalar(seed, block_size):
+    rng = random.Random(seed)
+    rule_set = _rule_set(rng)
+    scalar, batched = _both_paths(rule_set, _events(rng, 2000), block_size)
+    assert batched == scalar
+    assert sum(len(triggered) for triggered, _ in scalar) > 0
+
+
+def test_batch_evaluation_without_numpy_matches_scalar(monkeypatch):
+    monkeypatch.setattr(vectorized, "np", None)
+    rng = random.Random(4)
+    rule_set = _rule_set(rng)
+    scalar, batched = _both_paths(rule_set, _events(rng, 500), 100)
+    assert batched == scalar